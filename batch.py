@@ -0,0 +1,193 @@
+"""Edits files from the command line, without a window.
+
+    python notepad.py --batch [--find TERM [--replace TEXT] [--regex] [--match-case]
+                              [--whole-word]] [--encoding NAME] [--newline lf|crlf|cr]
+                              [--dry-run] [--workers N] GLOB...
+
+Globs are expanded with ** matching any depth. Files are decoded the way the
+editor opens them, edited with the find bar's search and replace and written
+back through the same atomic save. --dry-run only prints what would change.
+Neither Qt nor the editor module is imported, so a run starts in milliseconds.
+"""
+import argparse
+import codecs
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from compare import diff_regions, split_texts
+from fileio import TextFormat, atomic_write, decode_file, read_head, sniff_encoding
+from search import compile_pattern, replacements
+
+NEWLINES = {"lf": "\n", "crlf": "\r\n", "cr": "\r"}
+# codec names that stand for a byte order mark in front of the text
+BOM_ENCODINGS = {
+    "utf-8-sig": ("utf-8", codecs.BOM_UTF8),
+    "utf-16": ("utf-16-le", codecs.BOM_UTF16_LE),
+    "utf-32": ("utf-32-le", codecs.BOM_UTF32_LE),
+}
+# at most this many files go to a pool process at a time, fewer when there are only a few
+FILES_PER_TASK = 32
+
+
+def expand_globs(patterns):
+    # every file matching any pattern once, in the order the patterns name them
+    paths = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isfile(path):
+                paths.setdefault(os.path.realpath(path), path)
+    return list(paths.values())
+
+
+def target_format(text_format, encoding=None, newline=None):
+    # the format a file is written back in, unchanged where no option asks otherwise
+    if encoding is None:
+        encoding, bom = text_format.encoding, text_format.bom
+    else:
+        name = codecs.lookup(encoding).name
+        encoding, bom = BOM_ENCODINGS.get(name, (name, b""))
+    return TextFormat(encoding, bom, NEWLINES[newline] if newline else text_format.newline, text_format.compression)
+
+
+def is_binary(path):
+    # NUL bytes mark a binary file, unless they belong to UTF-16 or UTF-32 text. Compressed
+    # files are judged by what they decompress to
+    head = read_head(path)
+    return b"\0" in head and not sniff_encoding(head)[0].startswith(("utf-16", "utf-32"))
+
+
+def apply_edits(text, edits):
+    pieces = []
+    position = 0
+    for start, end, new_text in edits:
+        pieces += [text[position:start], new_text]
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def process_file(path, options):
+    # runs in a pool process. Returns (path, summary, error), summary being None when the
+    # file needs no change and error None unless it could not be read, edited or written
+    try:
+        # binary files are left alone, as find in files does
+        if is_binary(path):
+            return path, None, None
+        text, text_format = decode_file(path)
+        replaced = 0
+        new_text = text
+        if options["find"]:
+            pattern = compile_pattern(
+                options["find"], options["regex"], options["match_case"], options["whole_word"]
+            )
+            if options["replace"] is None:
+                matches = sum(1 for match in pattern.finditer(text) if match.end() > match.start())
+                return path, f"{matches:,} match{'es' if matches != 1 else ''}" if matches else None, None
+            edits = replacements(text, pattern, options["replace"], options["regex"])
+            replaced = len(edits)
+            new_text = apply_edits(text, edits)
+        new_format = target_format(text_format, options["encoding"], options["newline"])
+        converted = new_format.to_dict() != text_format.to_dict()
+        if new_text == text and not converted:
+            return path, None, None
+        # an encoding that can't hold the text fails here, before anything is written
+        data = new_format.encode(new_text)
+        changes = []
+        if new_text != text:
+            regions = diff_regions(*split_texts(text, new_text))
+            removed = sum(a_hi - a_lo for a_lo, a_hi, b_lo, b_hi in regions)
+            added = sum(b_hi - b_lo for a_lo, a_hi, b_lo, b_hi in regions)
+            changes.append(
+                f"{replaced:,} replacement{'s' if replaced != 1 else ''}, {len(regions):,} hunk"
+                f"{'s' if len(regions) != 1 else ''}, -{removed:,} +{added:,} lines"
+            )
+        if converted:
+            changes.append(f"{text_format.describe()} -> {new_format.describe()}")
+        if not options["dry_run"]:
+            atomic_write(path, data, compression=new_format.compression)
+        return path, "; ".join(changes), None
+    except (OSError, UnicodeError, re.error, IndexError, LookupError) as e:
+        return path, None, str(e)
+
+
+def process_files(paths, options):
+    return [process_file(path, options) for path in paths]
+
+
+def run(paths, options, workers=None):
+    # the files are split into batches over a process pool, results come back in path order
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return process_files(paths, options)
+    size = max(1, min(FILES_PER_TASK, len(paths) // (workers * 4)))
+    batches = [paths[start:start + size] for start in range(0, len(paths), size)]
+    with ProcessPoolExecutor(workers) as pool:
+        return [result for results in pool.map(process_files, batches, [options] * len(batches)) for result in results]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="notepad.py --batch", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("globs", nargs="+", metavar="GLOB", help="files to process, ** matches any depth")
+    parser.add_argument("--find", help="text or pattern to look for, counted per file without --replace")
+    parser.add_argument("--replace", help="replacement text, \\1 and \\g<name> refer to groups with --regex")
+    parser.add_argument("--regex", action="store_true", help="treat --find as a regular expression")
+    parser.add_argument("--match-case", action="store_true")
+    parser.add_argument("--whole-word", action="store_true")
+    parser.add_argument("--encoding", help="write files in this encoding, utf-8-sig adds a BOM")
+    parser.add_argument("--newline", choices=sorted(NEWLINES), help="write files with these line ends")
+    parser.add_argument("--dry-run", action="store_true", help="print what would change without writing")
+    parser.add_argument("--workers", type=int, help="processes to use, one per CPU by default")
+    args = parser.parse_args(argv)
+    if args.replace is not None and not args.find:
+        parser.error("--replace needs --find")
+    if args.find and args.regex:
+        try:
+            re.compile(args.find)
+        except re.error as e:
+            parser.error(f"invalid pattern: {e}")
+    if args.encoding:
+        try:
+            codecs.lookup(args.encoding)
+        except LookupError:
+            parser.error(f"unknown encoding: {args.encoding}")
+    if args.find and args.replace is None and (args.encoding or args.newline):
+        parser.error("--find without --replace only counts matches, give --replace to convert as well")
+    if not (args.find or args.encoding or args.newline):
+        parser.error("nothing to do, give --find, --encoding or --newline")
+
+    options = {
+        "find": args.find, "replace": args.replace, "regex": args.regex, "match_case": args.match_case,
+        "whole_word": args.whole_word, "encoding": args.encoding, "newline": args.newline,
+        "dry_run": args.dry_run,
+    }
+    started = time.perf_counter()
+    paths = expand_globs(args.globs)
+    results = run(paths, options, args.workers)
+    changed = failed = 0
+    for path, summary, error in results:
+        if error:
+            failed += 1
+            print(f"{path}: {error}", file=sys.stderr)
+        elif summary:
+            changed += 1
+            print(f"{path}: {summary}")
+    if options["find"] and options["replace"] is None:
+        verb = "matched"
+    else:
+        verb = "would change" if args.dry_run else "changed"
+    print(
+        f"{changed:,} of {len(paths):,} file(s) {verb}, {failed:,} failed "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
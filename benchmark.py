@@ -0,0 +1,290 @@
+"""Headless benchmarks for the editor's hot paths.
+
+    python benchmark.py run [--sizes 1K,1M,10M] [--output results.json]
+    python benchmark.py compare old.json new.json [--threshold 0.2]
+
+Every document size runs in its own process under the offscreen Qt platform,
+so peak RSS belongs to that size alone. compare exits with status 1 when a
+metric got slower than the threshold allows.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = "1K,100K,1M,10M,100M,500M"
+UNITS = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua notepad editor search replace"
+).split()
+SEARCH_TERM = "magna"
+
+# differences below this many seconds are noise, whatever the ratio says
+NOISE_FLOOR = 0.002
+# the editor's directories under ~/.notepad, each run gets its own
+STATE_DIRS = ("RECOVERY_DIR", "SESSION_DIR", "HIBERNATION_DIR", "UNDO_DIR", "DECOMPRESSED_DIR")
+
+
+def parse_size(label):
+    label = label.strip().upper()
+    if label[-1] in UNITS:
+        return int(float(label[:-1]) * UNITS[label[-1]])
+    return int(label)
+
+
+def generate_document(path, size, seed=0):
+    # a 1 MB block of random lines repeated up to size keeps generating 500 MB cheap
+    rng = random.Random(seed)
+    lines = []
+    block_size = 0
+    while block_size < min(size, 1024 * 1024):
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))) + "\n"
+        lines.append(line)
+        block_size += len(line)
+    block = "".join(lines).encode("utf-8")
+    with open(path, "wb") as file:
+        written = 0
+        while written < size:
+            chunk = block[:size - written]
+            file.write(chunk)
+            written += len(chunk)
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "wall": sum(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": ordered[-1],
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(path):
+    # runs inside the child process for one document
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtTest import QTest
+    from PyQt5.QtWidgets import QApplication
+
+    import notepad
+
+    app = QApplication([sys.argv[0]])
+    # private state directories keep the benchmark away from the user's journals, session,
+    # hibernated tabs and undo history, and theirs away from it
+    state = tempfile.mkdtemp(prefix="notepad-bench-")
+    for name in STATE_DIRS:
+        setattr(notepad, name, os.path.join(state, name.lower()))
+    window = notepad.NotePad()
+    results = {}
+
+    def timed(action, repeat):
+        samples = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            action(i)
+            app.processEvents()
+            samples.append(time.perf_counter() - start)
+        return percentiles(samples)
+
+    def wait_for(condition):
+        start = time.perf_counter()
+        while not condition():
+            app.processEvents()
+            time.sleep(0.0005)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    widget = window.open_path(path)
+    app.processEvents()
+    results["open"] = {"wall": time.perf_counter() - start}
+    window.find_bar.set_term(SEARCH_TERM)
+
+    if isinstance(widget, notepad.LargeFileView):
+        results["open"]["index"] = wait_for(lambda: widget.large_file.complete)
+        rng = random.Random(1)
+        line_count = widget.large_file.line_count()
+        results["scroll"] = timed(lambda i: QTest.keyClick(widget, Qt.Key_PageDown), 200)
+        results["go_to_line"] = timed(lambda i: widget.go_to_line(rng.randrange(line_count)), 100)
+
+        def find(i):
+            window.find_next()
+            wait_for(lambda: not widget.searching)
+
+        results["find_next"] = timed(find, 50)
+    else:
+        results["status_bar"] = timed(lambda i: window.refresh_status_bar(), 200)
+        results["cursor"] = timed(lambda i: QTest.keyClick(widget, Qt.Key_PageDown if i % 5 == 0 else Qt.Key_Down), 250)
+        text = "the quick brown fox jumps over the lazy dog "
+
+        def type_key(i):
+            if i % 60 == 59:
+                QTest.keyClick(widget, Qt.Key_Return)
+            else:
+                QTest.keyClick(widget, text[i % len(text)])
+
+        results["typing"] = timed(type_key, 500)
+
+        start = time.perf_counter()
+        window.find_next()
+        session = window.search_session(widget)
+        wait_for(lambda: session.index is not None)
+        results["find_index"] = {"wall": time.perf_counter() - start}
+        results["find_next"] = timed(lambda i: window.find_next(), 100)
+        results["highlight"] = timed(lambda i: window.highlight_matches(), 50)
+
+        window.find_bar.replace_edit.setText(SEARCH_TERM.upper())
+        start = time.perf_counter()
+        window.replace_all()
+        app.processEvents()
+        results["replace_all"] = {"wall": time.perf_counter() - start}
+
+        results["zoom"] = timed(lambda i: window.zoom_in() if i % 2 == 0 else window.zoom_out(), 20)
+
+        start = time.perf_counter()
+        window.save_file()
+        wait_for(lambda: not widget.document().isModified())
+        results["save"] = {"wall": time.perf_counter() - start}
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    for index in range(window.tab_widget.count()):
+        editor = window.tab_widget.widget(index)
+        if isinstance(editor, notepad.TEXT_EDITORS):
+            editor.document().setModified(False)
+    window.close()
+    shutil.rmtree(state, ignore_errors=True)
+    return results
+
+
+def run(sizes, output, keep=False):
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    directory = tempfile.mkdtemp(prefix="notepad-bench-docs-")
+    for label in sizes:
+        path = os.path.join(directory, f"document-{label}.txt")
+        generate_document(path, parse_size(label))
+        print(f"{label}: running...", file=sys.stderr, flush=True)
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "measure", path],
+            capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            print(child.stderr, file=sys.stderr)
+            report["results"][label] = {"error": child.stderr.strip().splitlines()[-1:]}
+        else:
+            report["results"][label] = json.loads(child.stdout.strip().splitlines()[-1])
+            print(summary(label, report["results"][label]), file=sys.stderr, flush=True)
+        if not keep:
+            os.unlink(path)
+    if not keep:
+        os.rmdir(directory)
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+
+def summary(label, results):
+    parts = []
+    for name, metrics in results.items():
+        if isinstance(metrics, dict) and "p95" in metrics:
+            parts.append(f"{name} p95 {metrics['p95'] * 1000:.2f} ms")
+        elif isinstance(metrics, dict) and "wall" in metrics:
+            parts.append(f"{name} {metrics['wall'] * 1000:.0f} ms")
+            if "index" in metrics:
+                parts.append(f"line index {metrics['index'] * 1000:.0f} ms")
+    parts.append(f"peak RSS {results.get('peak_rss_mb') or 0:.0f} MB")
+    return f"{label}: " + ", ".join(parts)
+
+
+def compare(old_path, new_path, threshold):
+    # flags every shared metric whose new value exceeds the old one by more than threshold
+    with open(old_path, encoding="utf-8") as file:
+        old = json.load(file)["results"]
+    with open(new_path, encoding="utf-8") as file:
+        new = json.load(file)["results"]
+    regressions = []
+    for label in old:
+        if label not in new:
+            continue
+        for scenario, old_metrics in old[label].items():
+            new_metrics = new[label].get(scenario)
+            if scenario == "peak_rss_mb":
+                old_metrics, new_metrics = {"rss": old_metrics}, {"rss": new_metrics}
+            if not isinstance(old_metrics, dict) or not isinstance(new_metrics, dict):
+                continue
+            for metric in ("wall", "index", "p50", "p95", "rss"):
+                before, after = old_metrics.get(metric), new_metrics.get(metric)
+                if not before or after is None:
+                    continue
+                change = after / before - 1
+                floor = 1 if metric == "rss" else NOISE_FLOOR
+                marker = ""
+                if change > threshold and after - before > floor:
+                    marker = "  REGRESSION"
+                    regressions.append((label, scenario, metric))
+                print(f"{label:>6} {scenario:<12} {metric:<5} {before:12.4f} -> {after:12.4f} {change:+7.1%}{marker}")
+    print(f"{len(regressions)} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="benchmark generated documents")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated, default {DEFAULT_SIZES}")
+    run_parser.add_argument("--output", help="JSON file for the results, stdout when omitted")
+    run_parser.add_argument("--keep", action="store_true", help="keep the generated documents")
+    compare_parser = commands.add_parser("compare", help="flag regressions between two runs")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    measure_parser = commands.add_parser("measure")
+    measure_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "measure":
+        print(json.dumps(measure(args.path)))
+    elif args.command == "run":
+        run([size for size in args.sizes.split(",") if size], args.output, args.keep)
+    else:
+        return 1 if compare(args.old, args.new, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import multiprocessing
+import sys
+import time
+
+from fileio import decode_file
+from filewatch import DIFF_LINE_LIMIT, diff_lines
+
+# the full diff gets this many seconds in its process before the coarse one replaces it
+DIFF_TIME_BUDGET = 5.0
+# texts with fewer lines than this are diffed in the calling thread, starting a process costs more
+PROCESS_LINE_THRESHOLD = 1000
+
+
+def diff_regions(old, new, limit=DIFF_LINE_LIMIT):
+    regions = []
+    diff_lines(old, new, 0, len(old), 0, len(new), regions, limit)
+    return regions
+
+
+def split_texts(left, right):
+    return left.split("\n"), right.split("\n")
+
+
+def diff_in_process(left, right):
+    # runs in the pool process, the texts are split there so only two strings are pickled. With
+    # the budget to stop it, every range without anchors is compared in full however long
+    return diff_regions(*split_texts(left, right), limit=sys.maxsize)
+
+
+class Comparison:
+    # two texts lined up row by row for side by side panes, the shorter side of a change is
+    # padded with empty filler rows. Runs are (first row, end row, kind) per side and hunks the
+    # (first row, end row) of every change
+    def __init__(self):
+        self.left = []
+        self.right = []
+        self.left_runs = []
+        self.right_runs = []
+        self.hunks = []
+        self.removed = 0
+        self.added = 0
+        # the coarse diff replaces whole ranges between unique lines instead of comparing them
+        self.coarse = False
+        self.seconds = 0.0
+
+    def describe(self):
+        if not self.hunks:
+            return "The documents are identical"
+        changes = f"{len(self.hunks):,} change{'s' if len(self.hunks) != 1 else ''}"
+        text = f"{changes}, {self.removed:,} lines removed, {self.added:,} added in {self.seconds:.2f}s"
+        if self.coarse:
+            text += " (coarse, the full diff ran out of time)"
+        return text
+
+
+def mark_rows(runs, start, lines, rows, kind):
+    # a side's lines of a change and the filler rows after them
+    if lines:
+        runs.append((start, start + lines, kind))
+    if lines < rows:
+        runs.append((start + lines, start + rows, "filler"))
+
+
+def line_up(old, new, regions):
+    comparison = Comparison()
+    left, right = comparison.left, comparison.right
+    i = j = 0
+    for a_lo, a_hi, b_lo, b_hi in regions:
+        left += old[i:a_lo]
+        right += new[j:b_lo]
+        start = len(left)
+        removed, added = a_hi - a_lo, b_hi - b_lo
+        rows = max(removed, added)
+        left += old[a_lo:a_hi] + [""] * (rows - removed)
+        right += new[b_lo:b_hi] + [""] * (rows - added)
+        mark_rows(comparison.left_runs, start, removed, rows, "changed" if added else "removed")
+        mark_rows(comparison.right_runs, start, added, rows, "changed" if removed else "added")
+        comparison.hunks.append((start, start + rows))
+        comparison.removed += removed
+        comparison.added += added
+        i, j = a_hi, b_hi
+    left += old[i:]
+    right += new[j:]
+    return comparison
+
+
+def compare_texts(left, right, budget=DIFF_TIME_BUDGET):
+    # a Comparison of two texts line by line. Long texts are diffed in a separate process that
+    # is killed once the budget runs out, the coarse diff that replaces it only matches lines
+    # found once on both sides and is quick on any input
+    started = time.perf_counter()
+    old, new = split_texts(left, right)
+    coarse = False
+    if max(len(old), len(new)) < PROCESS_LINE_THRESHOLD:
+        regions = diff_regions(old, new, limit=sys.maxsize)
+    else:
+        # spawn keeps the GUI process's threads out of the worker, as for find in files
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1) as pool:
+            result = pool.apply_async(diff_in_process, (left, right))
+            try:
+                regions = result.get(budget)
+            except multiprocessing.TimeoutError:
+                # leaving the block terminates the pool and the diff still running in it
+                regions = None
+        if regions is None:
+            regions = diff_regions(old, new, limit=0)
+            coarse = True
+    comparison = line_up(old, new, regions)
+    comparison.coarse = coarse
+    comparison.seconds = time.perf_counter() - started
+    return comparison
+
+
+def compare_with_file(text, path, budget=DIFF_TIME_BUDGET):
+    # text against the file it was loaded from, as it is on disk now
+    saved, _ = decode_file(path)
+    return compare_texts(saved, text, budget)
@@ -0,0 +1,168 @@
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nsmallest
+from itertools import chain
+
+# identifiers, hostnames and other dotted or dashed names: a letter or underscore not inside
+# a longer word, then word characters, dots and dashes, ending in a word character
+WORD_PATTERN = re.compile(r"(?<!\w)[^\W\d][\w.\-]*\w")
+# the same kind of word cut off at the cursor
+PREFIX_PATTERN = re.compile(r"(?<!\w)[^\W\d][\w.\-]*$")
+# a prefix is looked for in at most this much of the line before the cursor
+PREFIX_LIMIT = 256
+# suggestions offered for a prefix
+SUGGESTION_LIMIT = 10
+# a node keeps the words below it in one bucket of suffixes until there are more than this
+# many, then bursts into a child per next character. Most of the trie stays in buckets
+BUCKET_SIZE = 32
+
+
+def update_best(best, word, old, new):
+    # patches a node's sorted list of (-count, word) after word's count went from old to new.
+    # A full list only holds words ranked above every word left out, False when the change
+    # may have let one of those in
+    old_entry, new_entry = (-old, word), (-new, word)
+    full = len(best) > SUGGESTION_LIMIT
+    position = bisect_left(best, old_entry)
+    if old and position < len(best) and best[position] == old_entry:
+        if full and (not new or new_entry > best[-1]):
+            return False
+        del best[position]
+    elif full and new_entry > best[-1]:
+        return True
+    if new:
+        insort(best, new_entry)
+        del best[SUGGESTION_LIMIT + 1:]
+    return True
+
+
+def word_prefix(text):
+    # the word being typed at the end of text, "" when there is none
+    match = PREFIX_PATTERN.search(text[-PREFIX_LIMIT:])
+    return match.group() if match else ""
+
+
+class TrieNode:
+    __slots__ = ("bucket", "children", "count", "best")
+
+    def __init__(self):
+        # {suffix: count} of the words below this node until it bursts, then None
+        self.bucket = {}
+        # after a burst: child nodes by next character and the count of the word ending here
+        self.children = None
+        self.count = 0
+        # the most frequent words below a burst node as (-count, word), None once an edit
+        # below it may have changed them
+        self.best = None
+
+
+class CompletionIndex:
+    # word frequencies of one document in a burst trie, with each block's words kept so an
+    # edit only recounts the blocks it touched. A burst node caches its best words, merged
+    # from its children's, so a lookup walks the prefix and reads a short list
+    def __init__(self):
+        self.root = TrieNode()
+        self.block_words = []
+
+    @classmethod
+    def build(cls, text):
+        index = cls()
+        counts = Counter()
+        # a block's words as one string take a fraction of the memory of a string per word
+        for words in map(WORD_PATTERN.findall, text.split("\n")):
+            counts.update(words)
+            index.block_words.append(" ".join(words))
+        for word, count in counts.items():
+            index.add(word, count)
+        # burst nodes are few, their lists are merged here rather than on the first lookups
+        index.best(index.root, "")
+        return index
+
+    def add(self, word, count):
+        # count is negative for words that went away
+        node = self.root
+        depth = 0
+        path = []
+        while node.children is not None:
+            path.append(node)
+            if depth == len(word):
+                old = node.count
+                node.count += count
+                new = node.count
+                break
+            child = node.children.get(word[depth])
+            if child is None:
+                child = node.children[word[depth]] = TrieNode()
+            node = child
+            depth += 1
+        else:
+            suffix = word[depth:]
+            old = node.bucket.get(suffix, 0)
+            new = old + count
+            if new > 0:
+                node.bucket[suffix] = new
+                if len(node.bucket) > BUCKET_SIZE:
+                    self.burst(node)
+            else:
+                node.bucket.pop(suffix, None)
+        for node in path:
+            if node.best is not None and not update_best(node.best, word, old, max(new, 0)):
+                node.best = None
+
+    def burst(self, node):
+        node.children = {}
+        for suffix, count in node.bucket.items():
+            if suffix:
+                child = node.children.get(suffix[0])
+                if child is None:
+                    child = node.children[suffix[0]] = TrieNode()
+                child.bucket[suffix[1:]] = count
+            else:
+                node.count = count
+        node.bucket = None
+        for child in node.children.values():
+            if len(child.bucket) > BUCKET_SIZE:
+                self.burst(child)
+
+    def best(self, node, path):
+        # one more than SUGGESTION_LIMIT, the prefix itself is never suggested
+        if node.children is None:
+            return nsmallest(SUGGESTION_LIMIT + 1, [(-count, path + suffix) for suffix, count in node.bucket.items()])
+        if node.best is None:
+            # children that saw no edit keep their lists, only the edited path is merged again
+            node.best = nsmallest(SUGGESTION_LIMIT + 1, chain(
+                [(-node.count, path)] if node.count else [],
+                *(self.best(child, path + char) for char, child in node.children.items())
+            ))
+        return node.best
+
+    def suggest(self, prefix):
+        # [(word, count)] of the most frequent words longer than prefix that start with it
+        node = self.root
+        depth = 0
+        while node.children is not None and depth < len(prefix):
+            node = node.children.get(prefix[depth])
+            if node is None:
+                return []
+            depth += 1
+        if node.children is None:
+            rest = prefix[depth:]
+            base = prefix[:depth]
+            best = nsmallest(SUGGESTION_LIMIT, [
+                (-count, base + suffix) for suffix, count in node.bucket.items()
+                if len(suffix) > len(rest) and suffix.startswith(rest)
+            ])
+        else:
+            best = [entry for entry in self.best(node, prefix) if entry[1] != prefix][:SUGGESTION_LIMIT]
+        return [(word, -count) for count, word in best]
+
+    def replace_blocks(self, first, last, lines):
+        # blocks first to last now read lines, only words whose count changed touch the trie
+        new = [" ".join(WORD_PATTERN.findall(line)) for line in lines]
+        changes = Counter(chain.from_iterable(map(str.split, new)))
+        changes.subtract(chain.from_iterable(map(str.split, self.block_words[first:last + 1])))
+        self.block_words[first:last + 1] = new
+        for word, count in changes.items():
+            if count:
+                self.add(word, count)
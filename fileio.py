@@ -0,0 +1,327 @@
+import bz2
+import codecs
+import gzip
+import lzma
+import os
+import tempfile
+
+WRITE_CHUNK_SIZE = 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+
+# checked in order, the UTF-32 LE mark starts with the UTF-16 LE one
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+# tried when the sniffed encoding fails further into the file, latin-1 decodes any byte
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")
+NEWLINE_NAMES = {"\r\n": "CRLF", "\n": "LF", "\r": "CR"}
+# compressed files are recognized by their magic bytes, whatever they are called
+COMPRESSION_MAGIC = (("gzip", b"\x1f\x8b"), ("xz", b"\xfd7zXZ\x00"), ("bz2", b"BZh"))
+COMPRESSION_EXTENSIONS = {"gzip": (".gz", ".tgz"), "xz": (".xz", ".txz"), "bz2": (".bz2", ".tbz2")}
+# what each format writes when its file doesn't record the level it was made with
+DEFAULT_LEVELS = {"gzip": 6, "xz": 6, "bz2": 9}
+# xz presets by the log2 of their LZMA2 dictionary size. Presets 3 and 4, 5 and 6 share one
+# size, the higher of each pair is assumed
+XZ_PRESETS = {18: 0, 20: 1, 21: 2, 22: 4, 23: 6, 24: 7, 25: 8, 26: 9}
+# the process umask, read once here: setting it to read it back is not safe once saves run on
+# worker threads
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class DecodeCancelled(Exception):
+    pass
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class TextFormat:
+    # how a file looked on disk, the editor always works with \n line ends and no BOM.
+    # compression is (codec, level) for a gzip, xz or bzip2 file, saves compress the same way
+    def __init__(self, encoding="utf-8", bom=b"", newline="\n", compression=None):
+        self.encoding = encoding
+        self.bom = bom
+        self.newline = newline
+        self.compression = compression
+
+    def encode(self, text):
+        if self.newline != "\n":
+            text = text.replace("\n", self.newline)
+        return self.bom + text.encode(self.encoding)
+
+    def describe(self):
+        name = self.encoding.upper() + (" BOM" if self.bom else "")
+        text = f"{name}, {NEWLINE_NAMES[self.newline]}"
+        if self.compression:
+            text += f", {self.compression[0]}"
+        return text
+
+    def for_path(self, path):
+        # the format a Save As to path writes: compressed when the name asks for a codec, with
+        # the current level if it is the same one, and uncompressed otherwise
+        codec = next((
+            codec for codec, extensions in COMPRESSION_EXTENSIONS.items() if path.lower().endswith(extensions)
+        ), None)
+        if codec is None:
+            compression = None
+        elif self.compression and self.compression[0] == codec:
+            compression = self.compression
+        else:
+            compression = codec, DEFAULT_LEVELS[codec]
+        return TextFormat(self.encoding, self.bom, self.newline, compression)
+
+    def to_dict(self):
+        data = {"encoding": self.encoding, "bom": self.bom.hex(), "newline": self.newline}
+        if self.compression:
+            data["compression"] = list(self.compression)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        compression = tuple(data["compression"]) if data.get("compression") else None
+        return cls(data["encoding"], bytes.fromhex(data["bom"]), data["newline"], compression)
+
+
+def read_varint(data, position):
+    # xz's multibyte integers, 7 bits per byte with the high bit set on all but the last
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def xz_preset(head):
+    # the preset of the first block's LZMA2 filter, DEFAULT_LEVELS when it can't be read
+    try:
+        if head[12] == 0:
+            return DEFAULT_LEVELS["xz"]
+        flags = head[13]
+        position = 14
+        # optional compressed and uncompressed sizes come before the filter flags
+        for present in (0x40, 0x80):
+            if flags & present:
+                position = read_varint(head, position)[1]
+        dictionary = None
+        for _ in range((flags & 0x03) + 1):
+            filter_id, position = read_varint(head, position)
+            size, position = read_varint(head, position)
+            if filter_id == 0x21 and size == 1:
+                bits = head[position]
+                dictionary = (2 | (bits & 1)) << (bits // 2 + 11)
+            position += size
+    except IndexError:
+        return DEFAULT_LEVELS["xz"]
+    return XZ_PRESETS.get((dictionary or 0).bit_length() - 1, DEFAULT_LEVELS["xz"])
+
+
+def detect_compression(path):
+    # (codec, level) for a gzip, xz or bzip2 file and None for anything else. The level is
+    # what the header records: bzip2 keeps it, gzip only flags its fastest and best levels
+    # and xz its dictionary size
+    with open(path, "rb") as file:
+        head = file.read(64)
+    codec = next((codec for codec, magic in COMPRESSION_MAGIC if head.startswith(magic)), None)
+    if codec == "gzip":
+        return codec, {2: 9, 4: 1}.get(head[8] if len(head) > 8 else 0, DEFAULT_LEVELS["gzip"])
+    if codec == "bz2":
+        level = head[3:4]
+        return (codec, int(level)) if level.isdigit() and level != b"0" else None
+    if codec == "xz":
+        return codec, xz_preset(head)
+    return None
+
+
+def open_compressed(file, compression, mode="rb", name=""):
+    # a file object that decompresses what it reads from file, or compresses what is written
+    # to it, a chunk at a time
+    codec, level = compression
+    if codec == "gzip":
+        # the header keeps the name of the file, not the one of the temporary file written first
+        return gzip.GzipFile(name, mode, level if "w" in mode else 9, file)
+    if codec == "xz":
+        return lzma.LZMAFile(file, mode, preset=level if "w" in mode else None)
+    return bz2.BZ2File(file, mode, compresslevel=level)
+
+
+def read_head(path, size=READ_CHUNK_SIZE):
+    # the first size bytes of the file's content, decompressed when it is compressed
+    compression = detect_compression(path)
+    with open(path, "rb") as raw:
+        file = open_compressed(raw, compression) if compression else raw
+        return file.read(size)
+
+
+def decompress_file(path, target, compression, progress=None, cancelled=None):
+    # streams path decompressed into target a chunk at a time, neither is held in memory
+    size = os.path.getsize(path)
+    try:
+        with open(path, "rb") as raw, open(target, "wb") as output:
+            file = open_compressed(raw, compression)
+            while True:
+                if cancelled and cancelled():
+                    raise DecodeCancelled(path)
+                chunk = file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                output.write(chunk)
+                if progress and size:
+                    progress(raw.tell() * 100 // size)
+    except BaseException:
+        if os.path.exists(target):
+            os.unlink(target)
+        raise
+    return target
+
+
+def sniff_encoding(head):
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, bom
+    # UTF-16 without a BOM shows up as a NUL in every other byte of mostly ASCII text
+    if head.count(0) > len(head) // 4:
+        even, odd = head[0::2].count(0), head[1::2].count(0)
+        if odd > 4 * even:
+            return "utf-16-le", b""
+        if even > 4 * odd:
+            return "utf-16-be", b""
+    try:
+        # final=False, the chunk may end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8", b""
+    except UnicodeDecodeError:
+        pass
+    try:
+        head.decode("cp1252")
+        return "cp1252", b""
+    except UnicodeDecodeError:
+        return "latin-1", b""
+
+
+def decode_file(path, progress=None, cancelled=None, limit=None):
+    # decodes chunk by chunk, so the raw bytes are never held in full next to the text, and a
+    # compressed file is decompressed on the way. Returns the text with \n line ends and the
+    # TextFormat needed to write it back as it was. FileTooLarge is raised once the content
+    # passes limit bytes
+    size = os.path.getsize(path)
+    compression = detect_compression(path)
+    with open(path, "rb") as raw:
+        file = open_compressed(raw, compression) if compression else raw
+        head = file.read(READ_CHUNK_SIZE)
+        encoding, bom = sniff_encoding(head)
+        candidates = [encoding] + [fallback for fallback in FALLBACK_ENCODINGS if fallback != encoding]
+        for encoding in candidates:
+            try:
+                text, newline = _decode_stream(
+                    file, raw, head[len(bom):], encoding, size, progress, cancelled, limit
+                )
+            except UnicodeDecodeError:
+                if encoding == candidates[-1]:
+                    raise
+                file.seek(len(head))
+                # a fallback decodes a BOM like any other bytes, which keeps the round trip exact
+                bom = b""
+                continue
+            return text, TextFormat(encoding, bom, newline, compression)
+
+
+def _decode_stream(file, raw, chunk, encoding, size, progress, cancelled, limit):
+    # progress follows raw, the file on disk, which file decompresses from when they differ
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pieces = []
+    newline = None
+    carry = ""
+    read = file.tell()
+    last_percent = -1
+    while True:
+        if cancelled and cancelled():
+            raise DecodeCancelled(raw.name)
+        if limit is not None and read >= limit:
+            raise FileTooLarge(raw.name)
+        final = not chunk
+        text = carry + decoder.decode(chunk, final)
+        carry = ""
+        # a \r at the end of a chunk may be half of a \r\n
+        if text.endswith("\r") and not final:
+            text, carry = text[:-1], "\r"
+        if "\r" in text:
+            if newline is None:
+                newline = _first_newline(text)
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        elif newline is None and "\n" in text:
+            newline = "\n"
+        pieces.append(text)
+        if final:
+            break
+        chunk = file.read(READ_CHUNK_SIZE)
+        read += len(chunk)
+        if progress and size:
+            percent = min(raw.tell() * 100 // size, 100)
+            if percent != last_percent:
+                last_percent = percent
+                progress(percent)
+    return "".join(pieces), newline or "\n"
+
+
+def _first_newline(text):
+    cr, lf = text.find("\r"), text.find("\n")
+    if cr == -1 or (lf != -1 and lf < cr):
+        return "\n"
+    return "\r\n" if text.startswith("\n", cr + 1) else "\r"
+
+
+def read_text(path):
+    return decode_file(path)[0]
+
+
+def atomic_write(path, data, progress=None, compression=None):
+    # write next to the target, fsync, then rename over it so a crash never leaves a truncated file.
+    # With compression, (codec, level), data is compressed a chunk at a time on the way
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            output = open_compressed(file, compression, "wb", os.path.basename(path)) if compression else file
+            total = len(data)
+            for start in range(0, total, WRITE_CHUNK_SIZE):
+                output.write(data[start:start + WRITE_CHUNK_SIZE])
+                if progress:
+                    progress(min(start + WRITE_CHUNK_SIZE, total), total)
+            if compression:
+                # writes the format's trailer, the file itself stays open
+                output.close()
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp makes the file owner-only, a new file gets the mode open() would have given it
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        else:
+            os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    fsync_directory(directory)
+    return path
+
+
+def fsync_directory(directory):
+    # makes the rename itself durable, not supported on every platform
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
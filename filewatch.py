@@ -0,0 +1,183 @@
+import codecs
+import os
+from bisect import bisect_left
+from collections import Counter
+from difflib import SequenceMatcher
+from itertools import accumulate
+
+from fileio import decode_file
+
+# a change only counts as an append when this many bytes before the known end are unchanged
+TAIL_CHECK_SIZE = 4096
+# follow mode reads at most this much of an append at a time
+FOLLOW_CHUNK_SIZE = 4 * 1024 * 1024
+# lines between two anchors beyond this are replaced as one region instead of compared
+DIFF_LINE_LIMIT = 20000
+# a reload reads the file again when it changed during the read, at most this often
+RELOAD_ATTEMPTS = 3
+
+
+def file_signature(path):
+    # changes whenever the file is written or replaced, None once it is gone
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class DiskState:
+    # what an editor last took in from its file: the file's signature, how many of its bytes
+    # the document mirrors and the bytes just before that end. Appends are decoded with an
+    # incremental decoder, so a character split between two writes comes out whole
+    def __init__(self, path, signature, offset, tail):
+        self.path = path
+        self.signature = signature
+        self.offset = offset
+        self.tail = tail
+        self.decoder = None
+        self.carry = ""
+
+    @classmethod
+    def capture(cls, path):
+        signature = file_signature(path)
+        if signature is None:
+            raise FileNotFoundError(f"No such file: {path}")
+        size = signature[0]
+        with open(path, "rb") as file:
+            file.seek(max(0, size - TAIL_CHECK_SIZE))
+            tail = file.read(min(size, TAIL_CHECK_SIZE))
+        return cls(path, signature, size, tail)
+
+    def changed(self):
+        return file_signature(self.path) != self.signature
+
+    def acknowledge(self):
+        # the current version is known but was not taken in, only later changes are reported
+        self.signature = file_signature(self.path)
+
+    def appended(self):
+        # True when the file only grew past offset, a rewrite or truncation needs a reload
+        signature = file_signature(self.path)
+        if signature is None or signature[0] <= self.offset:
+            return False
+        with open(self.path, "rb") as file:
+            file.seek(self.offset - len(self.tail))
+            return file.read(len(self.tail)) == self.tail
+
+    def read_appended(self, text_format, limit=FOLLOW_CHUNK_SIZE):
+        # (text, more): up to limit bytes past offset as text with \n line ends, and whether
+        # the file holds more than that
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read(limit)
+        if self.decoder is None:
+            # bytes the file was not detected with still show up, as replacement characters
+            self.decoder = codecs.getincrementaldecoder(text_format.encoding)(errors="replace")
+        text = self.carry + self.decoder.decode(data)
+        self.carry = ""
+        # a \r at the end may be half of a \r\n
+        if text.endswith("\r"):
+            text, self.carry = text[:-1], "\r"
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        self.offset += len(data)
+        self.tail = (self.tail + data)[-TAIL_CHECK_SIZE:]
+        signature = file_signature(self.path)
+        more = signature is not None and signature[0] > self.offset
+        # with more to read the file must still look changed to the next check
+        self.signature = None if more else signature
+        return text, more
+
+
+def split_lines(text):
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def unique_anchors(old, new, a_lo, a_hi, b_lo, b_hi):
+    # (i, j) pairs of lines found exactly once in both ranges, the longest run that keeps
+    # the same order in both, as patience diff does
+    counts = Counter(old[a_lo:a_hi])
+    new_counts = Counter(new[b_lo:b_hi])
+    positions = {line: j for j, line in enumerate(new[b_lo:b_hi], b_lo) if new_counts[line] == 1}
+    pairs = [
+        (i, positions[line]) for i, line in enumerate(old[a_lo:a_hi], a_lo)
+        if counts[line] == 1 and line in positions
+    ]
+    # without moved lines the pairs are in order already, a sort of the nearly sorted
+    # j values checks that much faster than the loop below
+    lines = [j for i, j in pairs]
+    if lines == sorted(lines):
+        return pairs
+    # longest increasing run of j by patience sorting, back links rebuild it
+    tops, top_lines, links = [], [], []
+    for k, (i, j) in enumerate(pairs):
+        pile = bisect_left(top_lines, j)
+        links.append(tops[pile - 1] if pile else None)
+        if pile == len(tops):
+            tops.append(k)
+            top_lines.append(j)
+        else:
+            tops[pile] = k
+            top_lines[pile] = j
+    anchors = []
+    k = tops[-1] if tops else None
+    while k is not None:
+        anchors.append(pairs[k])
+        k = links[k]
+    return anchors[::-1]
+
+
+def diff_lines(old, new, a_lo, a_hi, b_lo, b_hi, regions, limit=DIFF_LINE_LIMIT):
+    # appends (a_lo, a_hi, b_lo, b_hi) for every range of old lines to replace with new ones.
+    # Ranges without anchors of more than limit lines are not compared any further
+    while a_lo < a_hi and b_lo < b_hi and old[a_lo] == new[b_lo]:
+        a_lo += 1
+        b_lo += 1
+    while a_lo < a_hi and b_lo < b_hi and old[a_hi - 1] == new[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+    if a_lo == a_hi and b_lo == b_hi:
+        return
+    anchors = unique_anchors(old, new, a_lo, a_hi, b_lo, b_hi) if a_lo < a_hi and b_lo < b_hi else []
+    if anchors:
+        for i, j in anchors:
+            # most anchors follow the previous one directly, with nothing between to compare
+            if i > a_lo or j > b_lo:
+                diff_lines(old, new, a_lo, i, b_lo, j, regions, limit)
+            a_lo, b_lo = i + 1, j + 1
+        diff_lines(old, new, a_lo, a_hi, b_lo, b_hi, regions, limit)
+    elif a_lo == a_hi or b_lo == b_hi or (a_hi - a_lo) + (b_hi - b_lo) > limit:
+        regions.append((a_lo, a_hi, b_lo, b_hi))
+    else:
+        # no line to anchor on, the range is small enough for a full comparison
+        matcher = SequenceMatcher(None, old[a_lo:a_hi], new[b_lo:b_hi], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                regions.append((a_lo + i1, a_lo + i2, b_lo + j1, b_lo + j2))
+
+
+def diff_text(old, new):
+    # the regions of old that differ from new as (start, end, replacement), compared line by
+    # line so a change in one place of a long file patches only that place
+    if old == new:
+        return []
+    old_lines, new_lines = split_lines(old), split_lines(new)
+    regions = []
+    diff_lines(old_lines, new_lines, 0, len(old_lines), 0, len(new_lines), regions)
+    offsets = [0, *accumulate(map(len, old_lines))]
+    return [(offsets[i1], offsets[i2], "".join(new_lines[j1:j2])) for i1, i2, j1, j2 in regions]
+
+
+def load_changes(path, old_text):
+    # (TextFormat, regions, DiskState) for patching old_text into the file's current text. The
+    # state is captured before the read, a file that changes meanwhile is read again
+    for _ in range(RELOAD_ATTEMPTS):
+        disk = DiskState.capture(path)
+        text, text_format = decode_file(path)
+        if file_signature(path) == disk.signature:
+            break
+    return text_format, diff_text(old_text, text), disk
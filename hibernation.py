@@ -0,0 +1,96 @@
+import json
+import os
+import re
+import sys
+import uuid
+import zlib
+
+from journal import process_alive
+
+# live text tabs are hibernated, least recently used first, once their estimated size
+# passes the budget. Tabs estimated below MIN_HIBERNATE_COST are not worth the round trip
+MEMORY_BUDGET = 512 * 1024 * 1024
+MIN_HIBERNATE_COST = 64 * 1024
+# what a character and a line cost inside a QTextDocument with its layout, measured on
+# 10 MB documents with 20 to 400 character lines
+CHARACTER_COST = 4
+BLOCK_COST = 350
+
+CACHE_NAME = re.compile(r"tab-(\d+)-[0-9a-f]+\.(?:z|txt)$")
+
+
+def document_cost(characters, blocks):
+    return characters * CHARACTER_COST + blocks * BLOCK_COST
+
+
+def cache_path(directory, suffix=".z"):
+    # a new file name in directory that remove_stale_caches cleans up once this process is gone
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"tab-{os.getpid()}-{uuid.uuid4().hex}{suffix}")
+
+
+def write_cache(directory, state):
+    # the cache only has to outlive this process' tab, so no atomic write or fsync
+    path = cache_path(directory)
+    data = zlib.compress(json.dumps(state, ensure_ascii=False).encode("utf-8"), 1)
+    try:
+        with open(path, "wb") as file:
+            file.write(data)
+    except OSError:
+        remove_cache(path)
+        raise
+    return path
+
+
+def read_cache(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    try:
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+    except zlib.error as e:
+        raise ValueError(f"corrupt tab cache {path}: {e}") from None
+
+
+def remove_cache(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_caches(directory):
+    # caches of processes that exited without cleaning up, their journals cover unsaved text
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        match = CACHE_NAME.match(name)
+        if match and not process_alive(int(match.group(1))):
+            remove_cache(os.path.join(directory, name))
+
+
+def process_memory():
+    # resident set size in bytes, None where it can't be read cheaply
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+                )
+            ]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.c_void_p(process), ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
@@ -0,0 +1,69 @@
+import getpass
+import json
+import os
+import socket
+import stat
+
+# the client side stays free of Qt so a second launch can forward its request and
+# exit without importing PyQt5, QLocalServer in the first process is the other end
+FORWARD_TIMEOUT = 2.0
+
+
+def server_name():
+    # OSError when there is no private directory for the socket
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError):
+        user = "user"
+    name = f"notepad-{user}"
+    if os.name == "nt":
+        return name
+    # a full path makes QLocalServer use exactly this unix socket
+    return os.path.join(runtime_dir(name), "notepad.sock")
+
+
+def runtime_dir(name):
+    # a socket in a shared directory can be taken over by whoever makes it first. The session's
+    # XDG_RUNTIME_DIR is only its owner's, without one a directory of our own is made for it
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if directory and os.path.isdir(directory):
+        return directory
+    directory = os.path.join(os.environ.get("TMPDIR") or "/tmp", name)
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    # someone else may have made it first
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError(f"{directory} is not a private directory")
+    return directory
+
+
+def encode_request(files, new_window=False):
+    request = {"files": [os.path.abspath(path) for path in files], "new_window": new_window}
+    return (json.dumps(request) + "\n").encode("utf-8")
+
+
+def decode_request(data):
+    request = json.loads(data.decode("utf-8"))
+    return {"files": list(request.get("files", [])), "new_window": bool(request.get("new_window"))}
+
+
+def forward_request(files, new_window=False):
+    # True once a running instance acknowledged the request, False when none is listening
+    data = encode_request(files, new_window)
+    try:
+        if os.name == "nt":
+            with open(rf"\\.\pipe\{server_name()}", "r+b", buffering=0) as pipe:
+                pipe.write(data)
+                reply = pipe.read(3)
+        else:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(FORWARD_TIMEOUT)
+                sock.connect(server_name())
+                sock.sendall(data)
+                reply = sock.recv(3)
+    except OSError:
+        return False
+    return reply == b"ok\n"
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from inspect import CO_VARARGS
+
+from fileio import atomic_write
+
+# per name only the latest RING_SIZE durations are kept, and the trace keeps the latest
+# TRACE_SIZE spans, so an overlay left on for hours still uses a fixed amount of memory
+RING_SIZE = 2048
+TRACE_SIZE = 20000
+# histogram bucket upper bounds in milliseconds, a last bucket takes everything slower
+BUCKETS_MS = (0.1, 0.5, 1, 2, 4, 8, 16, 33, 66, 100, 250, 1000)
+
+
+class Profiler:
+    def __init__(self, ring_size=RING_SIZE, trace_size=TRACE_SIZE):
+        self.enabled = False
+        self.ring_size = ring_size
+        # name -> [durations ring, next slot, samples recorded in total]
+        self.rings = {}
+        self.trace = deque(maxlen=trace_size)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def record(self, name, start, duration):
+        thread = threading.current_thread()
+        with self.lock:
+            ring = self.rings.get(name)
+            if ring is None:
+                ring = self.rings[name] = [array("d", bytes(8 * self.ring_size)), 0, 0]
+            ring[0][ring[1]] = duration
+            ring[1] = (ring[1] + 1) % self.ring_size
+            ring[2] += 1
+            self.trace.append((name, start - self.origin, duration, thread.ident, thread.name))
+
+    def reset(self):
+        with self.lock:
+            self.rings.clear()
+            self.trace.clear()
+
+    def samples(self, name):
+        with self.lock:
+            durations, _, total = self.rings[name]
+            return sorted(durations[:min(total, self.ring_size)])
+
+    def stats(self, name):
+        durations = self.samples(name)
+
+        def at(fraction):
+            return durations[min(len(durations) - 1, int(fraction * len(durations)))]
+
+        histogram = [0] * (len(BUCKETS_MS) + 1)
+        for duration in durations:
+            histogram[bisect_left(BUCKETS_MS, duration * 1000)] += 1
+        return {
+            "count": self.rings[name][2],
+            "window": len(durations),
+            "mean": sum(durations) / len(durations),
+            "p50": at(0.50),
+            "p95": at(0.95),
+            "p99": at(0.99),
+            "max": durations[-1],
+            "histogram": histogram,
+        }
+
+    def snapshot(self):
+        return {name: self.stats(name) for name in sorted(self.rings)}
+
+    def export_json(self, path):
+        data = {"buckets_ms": list(BUCKETS_MS), "unit": "seconds", "slots": self.snapshot()}
+        atomic_write(path, json.dumps(data, indent=2).encode("utf-8"))
+
+    def export_chrome_trace(self, path):
+        # complete ("X") events in microseconds, loadable in chrome://tracing and Perfetto
+        with self.lock:
+            spans = list(self.trace)
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for name, start, duration, tid, thread_name in spans:
+            threads[tid] = thread_name
+            events.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": tid})
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+        atomic_write(path, json.dumps({"traceEvents": events}).encode("utf-8"))
+
+
+profiler = Profiler()
+
+
+def instrumented(fn):
+    # times fn while the profiler is enabled, otherwise costs one extra call. Qt drops signal
+    # arguments a slot doesn't take, the wrapper hides fn's signature so it trims them itself
+    name = fn.__qualname__
+    code = fn.__code__
+    positional = None if code.co_flags & CO_VARARGS else code.co_argcount
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if positional is not None:
+            args = args[:positional]
+        if not profiler.enabled:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.record(name, start, time.perf_counter() - start)
+
+    return wrapper
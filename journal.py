@@ -0,0 +1,171 @@
+import json
+import os
+import re
+from itertools import count
+
+from fileio import atomic_write
+
+# rewrite the journal once it grows past this, tabs with more delta bytes than
+# COMPACT_TAB_BYTES get a fresh snapshot so replay stays cheap
+COMPACT_THRESHOLD = 4 * 1024 * 1024
+COMPACT_TAB_BYTES = 256 * 1024
+
+JOURNAL_NAME = re.compile(r"journal-(\d+)-(\d+)\.jsonl$")
+
+_journal_ids = count(1)
+
+
+class RecoveryJournal:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"journal-{os.getpid()}-{next(_journal_ids)}.jsonl")
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.buffer = []
+        # tab id -> encoded records since that tab's latest base, and their size. Sizes are in
+        # bytes as written, the text of a record may be mostly multi-byte characters
+        self.records = {}
+        self.delta_bytes = {}
+        self.size = 0
+
+    def append(self, tab_id, record):
+        # returns the size of the record in the file
+        record["tab"] = tab_id
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        size = len(line.encode("utf-8"))
+        self.buffer.append(line)
+        self.records.setdefault(tab_id, []).append(line)
+        self.size += size
+        return size
+
+    def set_base(self, tab_id, title, path=None, text=None, dirty=False):
+        # a base is either a reference to the file on disk or an inline snapshot
+        self.records[tab_id] = []
+        self.delta_bytes[tab_id] = 0
+        record = {"t": "base", "title": title, "path": path, "dirty": dirty}
+        if text is None:
+            stat = os.stat(path)
+            record["size"] = stat.st_size
+            record["mtime"] = stat.st_mtime_ns
+        else:
+            record["text"] = text
+        self.append(tab_id, record)
+
+    def record_edit(self, tab_id, position, removed, added):
+        size = self.append(tab_id, {"t": "edit", "p": position, "r": removed, "a": added})
+        self.delta_bytes[tab_id] = self.delta_bytes.get(tab_id, 0) + size
+
+    def close_tab(self, tab_id):
+        self.records.pop(tab_id, None)
+        self.delta_bytes.pop(tab_id, None)
+        line = json.dumps({"t": "close", "tab": tab_id}) + "\n"
+        self.buffer.append(line)
+        self.size += len(line)
+
+    def flush(self, sync=False):
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+            self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def needs_snapshot(self):
+        return [tab_id for tab_id, size in self.delta_bytes.items() if size > COMPACT_TAB_BYTES]
+
+    def compact(self, snapshot):
+        # snapshot(tab_id) returns (title, path, text) for a tab whose deltas got too big
+        if self.size <= COMPACT_THRESHOLD:
+            return False
+        for tab_id in self.needs_snapshot():
+            title, path, text = snapshot(tab_id)
+            self.set_base(tab_id, title, path, text, dirty=True)
+        self.buffer = []
+        data = "".join(line for lines in self.records.values() for line in lines).encode("utf-8")
+        self.file.close()
+        atomic_write(self.path, data)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = len(data)
+        return True
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def find_orphans(directory):
+    # journals left behind by processes that are no longer running
+    if not os.path.isdir(directory):
+        return []
+    orphans = []
+    for name in sorted(os.listdir(directory)):
+        match = JOURNAL_NAME.match(name)
+        if match and not process_alive(int(match.group(1))):
+            orphans.append(os.path.join(directory, name))
+    return orphans
+
+
+def base_text(base, read_text):
+    # an inline snapshot carries its text, a file reference only holds while the file is unchanged
+    if "text" in base:
+        return base["text"]
+    try:
+        stat = os.stat(base["path"])
+    except OSError:
+        return None
+    if stat.st_size != base["size"] or stat.st_mtime_ns != base["mtime"]:
+        return None
+    return read_text(base["path"])
+
+
+def replay(path, read_text):
+    # returns the unsaved documents as base text plus the deltas to apply on top of it,
+    # documents whose base file changed on disk since the journal was written are skipped
+    tabs = {}
+    # the last line may be torn if the process died mid-write, even inside a character
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            tab_id = record["tab"]
+            kind = record["t"]
+            if kind == "base":
+                tabs[tab_id] = record
+                record["edits"] = 0
+            elif kind == "edit" and tab_id in tabs:
+                tabs[tab_id]["edits"] += 1
+                tabs[tab_id].setdefault("deltas", []).append(record)
+            elif kind == "close":
+                tabs.pop(tab_id, None)
+
+    documents = []
+    for base in tabs.values():
+        if not base["edits"] and not base["dirty"]:
+            continue
+        text = base_text(base, read_text)
+        if text is None:
+            continue
+        deltas = [(delta["p"], delta["r"], delta["a"]) for delta in base.get("deltas", [])]
+        documents.append({"title": base["title"], "path": base["path"], "text": text, "deltas": deltas})
+    return documents
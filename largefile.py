@@ -0,0 +1,198 @@
+import codecs
+import mmap
+import os
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+# files at or above this size open in the read-only large-file viewer
+LARGE_FILE_THRESHOLD = 32 * 1024 * 1024
+
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# str patterns and backward searches go through the file in windows, each decoded with
+# SEARCH_OVERLAP bytes of context around it, so a match shorter than that is found whole
+SEARCH_WINDOW = 4 * 1024 * 1024
+SEARCH_OVERLAP = 64 * 1024
+
+ASCII = bytes(range(128))
+
+
+def byte_aligned(encoding):
+    # utf-8 and single-byte ASCII supersets, where an ASCII byte is always that character. The
+    # line index and byte searches rely on it, utf-16 or shift_jis would split characters
+    try:
+        if codecs.lookup(encoding).name in ("utf-8", "utf-8-sig"):
+            return True
+        return (
+            ASCII.decode(encoding) == ASCII.decode("ascii")
+            and len(bytes(range(256)).decode(encoding, errors="replace")) == 256
+        )
+    except (LookupError, UnicodeError):
+        return False
+
+
+class LargeFile:
+    # a temporary file, like the decompressed copy of a compressed one, goes away on close
+    def __init__(self, path, encoding="utf-8", temporary=False):
+        self.path = path
+        self.encoding = encoding
+        self.temporary = temporary
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses empty files, an empty bytes object behaves the same for reads
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+        # offsets[i] is the byte offset where line i starts
+        self.offsets = array("q", [0])
+        self.indexed_bytes = 0
+        self.complete = self.size == 0
+        self.cancelled = False
+
+    def close(self):
+        self.cancelled = True
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+        if self.temporary and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def build_index(self, progress=None):
+        # runs in a worker thread, readers only ever see a consistent prefix of the index
+        pos = 0
+        size = self.size
+        while pos < size and not self.cancelled:
+            end = min(pos + INDEX_CHUNK_SIZE, size)
+            data = self._map[pos:end]
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                # a single line longer than the chunk, keep scanning for its end
+                pos = end
+            else:
+                parts = data[:cut].split(b"\n")
+                starts = accumulate([len(part) + 1 for part in parts], initial=pos)
+                next(starts)
+                self.offsets.extend(starts)
+                pos += cut + 1
+            self.indexed_bytes = pos
+            if progress:
+                progress(int(pos * 100 / size))
+        if not self.cancelled:
+            self.indexed_bytes = size
+            self.complete = True
+
+    def line_count(self):
+        return len(self.offsets)
+
+    def line_start(self, number):
+        return self.offsets[number]
+
+    def line_end(self, number):
+        if number + 1 < len(self.offsets):
+            return self.offsets[number + 1] - 1
+        if self.complete:
+            return self.size
+        return self.indexed_bytes
+
+    def line(self, number, limit=None):
+        start = self.line_start(number)
+        end = self.line_end(number)
+        if limit is not None:
+            end = min(end, start + limit)
+        raw = self._map[start:end]
+        if raw.endswith(b"\r"):
+            raw = raw[:-1]
+        return raw.decode(self.encoding, errors="replace")
+
+    def lines(self, first, count, limit=None):
+        last = min(first + count, self.line_count())
+        return [self.line(number, limit) for number in range(max(first, 0), last)]
+
+    def line_at(self, offset):
+        return bisect_right(self.offsets, offset) - 1
+
+    def search(self, pattern, start=0, wrap=True, backward=False):
+        # a backward search finds the last match starting before start
+        if backward:
+            match = self.search_windows(pattern, 0, start, backward=True)
+            if match is None and wrap and start < self.size:
+                match = self.search_windows(pattern, start, self.size, backward=True)
+            return match
+        if isinstance(pattern.pattern, str):
+            match = self.search_windows(pattern, start, self.size)
+            if match is None and wrap and start > 0:
+                match = self.search_windows(pattern, 0, start)
+            return match
+        # re scans the mmap directly, so nothing is copied into memory
+        match = pattern.search(self._map, start)
+        if match is None and wrap and start > 0:
+            match = pattern.search(self._map, 0, start)
+        if match is None:
+            return None
+        return match.start(), match.end()
+
+    def search_windows(self, pattern, low, high, backward=False):
+        first, last = low, high
+        while first < last and not self.cancelled:
+            if backward:
+                begin, end = self.char_start(max(first, last - SEARCH_WINDOW)), last
+            else:
+                begin, end = first, min(last, self.char_start(first + SEARCH_WINDOW))
+            match = self.search_window(pattern, begin, end, backward)
+            if match:
+                return match
+            if backward:
+                last = begin
+            else:
+                first = end
+        return None
+
+    def search_window(self, pattern, begin, end, backward):
+        # the match found has to start between begin and end, empty ones are skipped
+        context = self.char_start(max(0, begin - SEARCH_OVERLAP))
+        stop = self.char_start(min(self.size, end + SEARCH_OVERLAP))
+        if isinstance(pattern.pattern, bytes):
+            text = self._map[context:stop]
+            head, limit = begin - context, end - context
+        else:
+            text = self.decode(context, begin)
+            head = len(text)
+            text += self.decode(begin, end)
+            limit = len(text)
+            text += self.decode(end, stop)
+        # a backward search starts in the context too, or it would take the tail of a match
+        # running into the window for a match of its own
+        found = None
+        for match in pattern.finditer(text, 0 if backward else head):
+            if match.start() >= limit:
+                break
+            if match.start() >= head and match.end() > match.start():
+                found = match
+                if not backward:
+                    break
+        if found is None:
+            return None
+        if isinstance(pattern.pattern, bytes):
+            return context + found.start(), context + found.end()
+        start = begin + len(self.encode(text[head:found.start()]))
+        return start, start + len(self.encode(found.group()))
+
+    # surrogateescape keeps undecodable bytes, so decoded matches map back to exact offsets
+    def decode(self, start, end):
+        return self._map[start:end].decode(self.encoding, errors="surrogateescape")
+
+    def encode(self, text):
+        return text.encode(self.encoding, errors="surrogateescape")
+
+    def char_start(self, offset):
+        # moves an offset off utf-8 continuation bytes so windows never split a character, in a
+        # single-byte encoding any offset would do
+        if offset >= self.size:
+            return self.size
+        for _ in range(3):
+            if offset == 0 or not 0x80 <= self._map[offset] < 0xC0:
+                break
+            offset -= 1
+        return offset
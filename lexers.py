@@ -0,0 +1,212 @@
+import builtins
+import keyword
+import os
+import re
+
+# end states are reported to the editor this many lines at a time
+STATES_CHUNK = 20000
+
+# foreground colors per token kind, for dark and light mode
+TOKEN_COLORS = {
+    "dark": {
+        "keyword": "#569cd6", "builtin": "#4ec9b0", "string": "#ce9178", "number": "#b5cea8",
+        "comment": "#6a9955", "decorator": "#dcdcaa", "key": "#9cdcfe", "literal": "#569cd6",
+        "heading": "#569cd6", "emphasis": "#c586c0", "code": "#ce9178", "link": "#4fc1ff",
+        "quote": "#6a9955", "list": "#d7ba7d", "timestamp": "#6a9955", "error": "#f44747",
+        "warning": "#cca700", "info": "#4fc1ff", "debug": "#808080",
+    },
+    "light": {
+        "keyword": "#0000ff", "builtin": "#267f99", "string": "#a31515", "number": "#098658",
+        "comment": "#008000", "decorator": "#795e26", "key": "#0451a5", "literal": "#0000ff",
+        "heading": "#0000ff", "emphasis": "#af00db", "code": "#a31515", "link": "#0070c1",
+        "quote": "#008000", "list": "#795e26", "timestamp": "#008000", "error": "#cd3131",
+        "warning": "#bf8803", "info": "#0070c1", "debug": "#6e6e6e",
+    },
+}
+
+
+def words(names):
+    return r"\b(?:" + "|".join(map(re.escape, names)) + r")\b"
+
+
+class Lexer:
+    # splits one line at a time into (start, length, kind) tokens. A lexer whose tokens can
+    # span lines sets multiline and passes an int state from the end of one line to the next,
+    # 0 being the state at the start of a document. Rules are tried left to right as one
+    # regex, the first alternative that matches at a position wins
+    name = "Plain Text"
+    extensions = ()
+    multiline = False
+    rules = ()
+
+    def __init__(self):
+        self.pattern = re.compile("|".join(f"(?P<{kind}>{rule})" for kind, rule in self.rules)) if self.rules else None
+
+    def scan(self, line, start=0):
+        if self.pattern is None:
+            return []
+        return [
+            (match.start(), match.end() - match.start(), match.lastgroup)
+            for match in self.pattern.finditer(line, start) if match.end() > match.start()
+        ]
+
+    def tokenize(self, line, state=0):
+        return self.scan(line), 0
+
+    def end_state(self, line, state=0):
+        return self.tokenize(line, state)[1]
+
+
+class PythonLexer(Lexer):
+    name = "Python"
+    extensions = (".py", ".pyw", ".pyi")
+    multiline = True
+    # states inside an unterminated triple quoted string
+    DELIMITERS = {1: "'''", 2: '"""'}
+    rules = (
+        ("comment", r"#.*"),
+        ("open", r"""(?:\b[rRbBuUfF]{1,2})?(?:'''|\"\"\")"""),
+        ("string", r"""\b[rRbBuUfF]{1,2}(?:'(?:[^'\\]|\\.)*'?|"(?:[^"\\]|\\.)*"?)|'(?:[^'\\]|\\.)*'?|"(?:[^"\\]|\\.)*"?"""),
+        ("decorator", r"^\s*@[\w.]+"),
+        ("keyword", words(keyword.kwlist)),
+        ("builtin", words(name for name in dir(builtins) if not name.startswith("_"))),
+        ("number", r"\b(?:0[xXoObB][\da-fA-F_]+|\d[\d_]*(?:\.[\d_]*)?(?:[eE][+-]?\d+)?[jJ]?)\b"),
+    )
+
+    def __init__(self):
+        super().__init__()
+        # the rest of a triple quoted string, up to and including its closing quotes
+        self.closers = {
+            state: re.compile(r"(?:[^\\]|\\.)*?" + re.escape(delimiter)) for state, delimiter in self.DELIMITERS.items()
+        }
+
+    def tokenize(self, line, state=0):
+        tokens = []
+        position = 0
+        while True:
+            if state:
+                match = self.closers[state].match(line, position)
+                if match is None:
+                    if len(line) > position:
+                        tokens.append((position, len(line) - position, "string"))
+                    return tokens, state
+                tokens.append((position, match.end() - position, "string"))
+                position = match.end()
+                state = 0
+            match = None
+            for match in self.pattern.finditer(line, position):
+                if match.lastgroup == "open":
+                    break
+                if match.end() > match.start():
+                    tokens.append((match.start(), match.end() - match.start(), match.lastgroup))
+                match = None
+            if match is None:
+                return tokens, 0
+            # a triple quote opens a string that may close on this line or a later one
+            state = 1 if match.group().endswith("'") else 2
+            tokens.append((match.start(), match.end() - match.start(), "string"))
+            position = match.end()
+            if position < len(line):
+                continue
+            return tokens, state
+
+    def end_state(self, line, state=0):
+        # lines without quotes can't change the state, most lines are skipped that way
+        if "'''" not in line and '"""' not in line:
+            return state
+        return self.tokenize(line, state)[1]
+
+
+class JsonLexer(Lexer):
+    name = "JSON"
+    extensions = (".json", ".jsonl", ".ndjson", ".geojson")
+    rules = (
+        ("key", r'"(?:[^"\\]|\\.)*"(?=\s*:)'),
+        ("string", r'"(?:[^"\\]|\\.)*"?'),
+        ("number", r"-?\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b"),
+        ("literal", r"\b(?:true|false|null)\b"),
+    )
+
+
+class LogLexer(Lexer):
+    name = "Log"
+    extensions = (".log", ".out", ".err")
+    rules = (
+        ("timestamp", r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?|\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b"),
+        ("error", r"\b(?:ERROR|FATAL|CRITICAL|SEVERE|Error|Exception|Traceback)\b"),
+        ("warning", r"\b(?:WARN|WARNING|Warning)\b"),
+        ("info", r"\b(?:INFO|NOTICE)\b"),
+        ("debug", r"\b(?:DEBUG|TRACE)\b"),
+        ("string", r'"[^"]*"'),
+    )
+
+
+class MarkdownLexer(Lexer):
+    name = "Markdown"
+    extensions = (".md", ".markdown", ".mdown")
+    multiline = True
+    # states inside a fenced code block opened by ``` or ~~~
+    FENCES = {1: "```", 2: "~~~"}
+    rules = (
+        ("heading", r"^#{1,6}\s.*"),
+        ("quote", r"^\s*>.*"),
+        ("list", r"^\s*(?:[-*+]|\d+[.)])(?=\s)"),
+        ("code", r"`[^`]+`"),
+        ("link", r"!?\[[^\]]*\]\([^)]*\)"),
+        ("emphasis", r"\*\*(?=\S).+?(?<=\S)\*\*|__(?=\S).+?(?<=\S)__|(?<![\w*])\*(?=\S)[^*]+?(?<=\S)\*"),
+    )
+
+    def tokenize(self, line, state=0):
+        fence = line.lstrip()[:3]
+        if state:
+            # everything up to and including the closing fence is code
+            return [(0, len(line), "code")] if line else [], 0 if fence == self.FENCES[state] else state
+        for opened, delimiter in self.FENCES.items():
+            if fence == delimiter:
+                return [(0, len(line), "code")], opened
+        return self.scan(line), 0
+
+    def end_state(self, line, state=0):
+        if not state and "```" not in line and "~~~" not in line:
+            return 0
+        return self.tokenize(line, state)[1]
+
+
+PLAIN_TEXT = Lexer()
+LEXERS = [PythonLexer(), JsonLexer(), LogLexer(), MarkdownLexer()]
+
+
+def register_lexer(lexer):
+    # later registrations win for the extensions they share with earlier ones
+    LEXERS.append(lexer)
+
+
+def lexer_named(name):
+    for lexer in reversed(LEXERS):
+        if lexer.name == name:
+            return lexer
+    return PLAIN_TEXT
+
+
+def lexer_for_path(path):
+    extension = os.path.splitext(path or "")[1].lower()
+    for lexer in reversed(LEXERS):
+        if extension in lexer.extensions:
+            return lexer
+    return None
+
+
+def lex_states(lexer, text, state=0, partial=None, cancelled=None):
+    # the lexer state at the end of every line of text, handed to partial STATES_CHUNK lines
+    # at a time. Stops early once cancelled returns True
+    states = []
+    for line in text.split("\n"):
+        state = lexer.end_state(line, state)
+        states.append(state)
+        if len(states) == STATES_CHUNK:
+            if cancelled and cancelled():
+                return
+            partial(states)
+            states = []
+    if states:
+        partial(states)
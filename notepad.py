@@ -1,114 +1,2609 @@
+import os
+import re
 import sys
+import threading
+import time
+from collections import Counter, deque
+from itertools import count
+
+from instance import FORWARD_TIMEOUT, decode_request, forward_request, server_name
+
+# --batch edits files from the command line, it needs neither Qt nor a running instance
+if __name__ == "__main__" and sys.argv[1:2] == ["--batch"]:
+    from batch import main
+    sys.exit(main(sys.argv[2:]))
+
+# a later launch hands its files (or a new window when there are none) to the running
+# instance and exits before paying for the Qt imports, --new-instance opts out
+if __name__ == "__main__" and "--new-instance" not in sys.argv:
+    if forward_request(sys.argv[1:], new_window=len(sys.argv) == 1):
+        sys.exit(0)
+
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QTextEdit, QAction, QFileDialog,
+    QApplication, QMainWindow, QTextEdit, QPlainTextEdit, QAction, QFileDialog,
     QTabWidget, QFontDialog, QColorDialog, QMessageBox, QToolBar,
-    QLabel, QStatusBar, QShortcut, QInputDialog
+    QLabel, QStatusBar, QShortcut, QInputDialog, QAbstractScrollArea, QProgressBar,
+    QWidget, QHBoxLayout, QVBoxLayout, QLineEdit, QCheckBox, QPushButton,
+    QDockWidget, QTreeWidget, QTreeWidgetItem, QPlainTextDocumentLayout, QActionGroup, QListWidget
+)
+from PyQt5.QtCore import (
+    Qt, QEvent, QTimer, QObject, QRunnable, QThreadPool, QPoint, QFileSystemWatcher, pyqtSignal
+)
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+from PyQt5.QtGui import (
+    QPainter, QFontDatabase, QTextCursor, QTextDocument, QKeySequence, QColor, QTextBlockUserData,
+    QTextBlockFormat, QTextCharFormat, QTextLayout, QKeyEvent
 )
-from PyQt5.QtCore import Qt, QTimer
 
+from compare import compare_texts, compare_with_file
+from completion import SUGGESTION_LIMIT, CompletionIndex, word_prefix
+from fileio import FileTooLarge, TextFormat, atomic_write, decode_file, decompress_file, detect_compression, read_text
+from filewatch import DiskState, file_signature, load_changes
+from hibernation import (
+    MEMORY_BUDGET, MIN_HIBERNATE_COST, cache_path, document_cost, process_memory, read_cache, remove_cache,
+    remove_stale_caches, write_cache
+)
+from instrumentation import BUCKETS_MS, instrumented, profiler
+from journal import RecoveryJournal, find_orphans, replay
+from largefile import LargeFile, LARGE_FILE_THRESHOLD, byte_aligned
+from lexers import LEXERS, PLAIN_TEXT, TOKEN_COLORS, lex_states, lexer_for_path, lexer_named
+from session import load_session, new_buffer_name, read_buffer, save_session
+from search import MatchIndex, bytes_searchable, compile_pattern, find_in_files, replaced_position, replacements
+from undo import UNDO_BYTE_LIMIT, UNDO_STEP_LIMIT, UndoLog, starts_word
 
-class NotePad(QMainWindow):
+# plain text tabs are the default, rich text (QTextEdit) is opt-in per tab
+TEXT_EDITORS = (QPlainTextEdit, QTextEdit)
+
+# the event loop lag probe fires this often (ms) while instrumentation is on
+LAG_PROBE_INTERVAL = 50
+
+# the memory budget is checked this often (ms) on top of every tab switch
+MEMORY_CHECK_INTERVAL = 5000
+
+# changed files are looked at this long (ms) after the first notification, writers rarely
+# finish in one write
+DISK_CHECK_DELAY = 50
+
+# typing opens the completion list once the word before the cursor is this long, Ctrl+Space
+# opens it for shorter words
+COMPLETION_MIN_PREFIX = 3
+# keys the open completion list takes from the editor, with the rows each moves the selection by
+COMPLETION_KEYS = {
+    Qt.Key_Up: -1, Qt.Key_Down: 1, Qt.Key_PageUp: -SUGGESTION_LIMIT, Qt.Key_PageDown: SUGGESTION_LIMIT,
+    Qt.Key_Tab: 0, Qt.Key_Return: 0, Qt.Key_Enter: 0, Qt.Key_Escape: 0,
+}
+
+# open windows, the most recent one takes files forwarded by later launches
+windows = []
+
+RECOVERY_DIR = os.path.join(os.path.expanduser("~"), ".notepad", "recovery")
+SESSION_DIR = os.path.join(os.path.expanduser("~"), ".notepad", "session")
+HIBERNATION_DIR = os.path.join(os.path.expanduser("~"), ".notepad", "hibernation")
+UNDO_DIR = os.path.join(os.path.expanduser("~"), ".notepad", "undo")
+DECOMPRESSED_DIR = os.path.join(os.path.expanduser("~"), ".notepad", "decompressed")
+
+
+# QTextDocument.toPlainText turns non-breaking spaces into plain ones, so the text that is saved,
+# journaled and compared comes from toRawText with only the separators Qt puts between blocks
+# and frames mapped back to \n
+RAW_TEXT_SEPARATORS = ("\u2029", "\ufdd0", "\ufdd1")
+
+
+def document_text(document):
+    # str.replace runs at memchr speed, a translate table goes through the text a character at
+    # a time and costs tens of times more on a large document
+    text = document.toRawText()
+    for separator in RAW_TEXT_SEPARATORS:
+        text = text.replace(separator, "\n")
+    return text
+
+
+_plain_text_cache = {}
+
+
+def text_range(document, start, end):
+    # QTextCursor.selectedText walks fragments one by one, for wide ranges a full copy is faster.
+    # Listeners of the same contentsChange share that copy until the event loop runs again.
+    if end - start > document.characterCount() // 4:
+        key = (id(document), document.revision())
+        if key not in _plain_text_cache:
+            if not _plain_text_cache:
+                QTimer.singleShot(0, _plain_text_cache.clear)
+            _plain_text_cache[key] = document_text(document)
+        return _plain_text_cache[key][start:end]
+    cursor = QTextCursor(document)
+    cursor.setPosition(start)
+    cursor.setPosition(end, QTextCursor.KeepAnchor)
+    return cursor.selectedText().replace("\u2029", "\n")
+
+
+def replay_steps(document, steps, clean=None, step=0):
+    # one edit block per step, so the document's undo stack gets exactly these steps. The
+    # document is marked unmodified once it reaches step number clean, which makes that step
+    # the stack's clean point. Returns the step reached
+    cursor = QTextCursor(document)
+    for edits in steps:
+        if step == clean:
+            document.setModified(False)
+        cursor.beginEditBlock()
+        for position, removed, added in edits:
+            end = document.characterCount() - 1
+            cursor.setPosition(min(position, end))
+            cursor.setPosition(min(position + removed, end), QTextCursor.KeepAnchor)
+            cursor.insertText(added)
+        cursor.endEditBlock()
+        step += 1
+    if step == clean:
+        document.setModified(False)
+    return step
+
+
+def rebuild_document(base, done, redone, expected, clean=None):
+    # a detached document with an undo history replayed from an UndoLog segment, or None when
+    # the replay doesn't arrive at expected. Without a layout or listeners replay stays cheap.
+    # clean is the step the file was saved at, the document stays modified without one
+    document = QTextDocument()
+    document.setPlainText(base)
+    document.setModified(True)
+    step = replay_steps(document, done, clean)
+    if document_text(document) != expected:
+        return None
+    replay_steps(document, reversed(redone), clean, step)
+    for _ in redone:
+        document.undo()
+    return document
+
+
+def patch_document(document, regions):
+    # (start, end, replacement) regions in one edit block, a single undo step. Cursors outside
+    # the regions keep their place in the text
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+    for start, end, text in reversed(regions):
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.insertText(text)
+    cursor.endEditBlock()
+
+
+def typed_text(event):
+    text = event.text()
+    if not text or event.modifiers() & (Qt.ControlModifier | Qt.AltModifier | Qt.MetaModifier):
+        return ""
+    return text if all(char.isprintable() or char in "\t\r" for char in text) else ""
+
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int)
+    partial = pyqtSignal(object)
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    # runs fn on the global thread pool and reports back through queued signals
+    def __init__(self, fn, *args, report_progress=False, report_partial=False, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        if report_progress:
+            self.kwargs["progress"] = self.signals.progress.emit
+        if report_partial:
+            self.kwargs["partial"] = self.signals.partial.emit
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            if profiler.enabled:
+                profiler.record(f"Worker {getattr(self.fn, '__qualname__', 'job')}", start, time.perf_counter() - start)
+            self.signals.finished.emit()
+
+    def start(self, pool=None):
+        (pool or QThreadPool.globalInstance()).start(self)
+        return self
+
+
+def load_file(path, progress=None, cancelled=None):
+    # (text, TextFormat), or None when the file is too big to read and goes to the large-file viewer.
+    # A compressed file is decoded as it is decompressed, one that turns out too big is streamed
+    # to a decompressed copy on disk and comes back as a LargeFile over that
+    compression = detect_compression(path)
+    if compression is None:
+        if os.path.getsize(path) >= LARGE_FILE_THRESHOLD:
+            return None
+        return decode_file(path, progress, cancelled)
+    try:
+        return decode_file(path, progress, cancelled, limit=LARGE_FILE_THRESHOLD)
+    except FileTooLarge:
+        copy = decompress_file(path, cache_path(DECOMPRESSED_DIR, ".txt"), compression, progress, cancelled)
+        return LargeFile(copy, temporary=True)
+
+
+class InstanceServer(QObject):
+    # receives the requests later launches send through instance.forward_request
+    requested = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.on_new_connection)
+
+    def listen(self):
+        try:
+            name = server_name()
+        except OSError:
+            return False
+        # a socket that still takes connections belongs to an instance started with
+        # --new-instance and stays, only one left behind by a crashed instance is removed.
+        # With UserAccessOption listen() would replace either, so only this user may connect
+        if self.answers(name):
+            return False
+        QLocalServer.removeServer(name)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        return self.server.listen(name)
+
+    @staticmethod
+    def answers(name):
+        probe = QLocalSocket()
+        probe.connectToServer(name)
+        connected = probe.waitForConnected(int(FORWARD_TIMEOUT * 1000))
+        probe.abort()
+        return connected
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            connection.buffer = b""
+            connection.readyRead.connect(lambda connection=connection: self.on_ready_read(connection))
+            connection.disconnected.connect(connection.deleteLater)
+
+    def on_ready_read(self, connection):
+        connection.buffer += bytes(connection.readAll())
+        if b"\n" not in connection.buffer:
+            return
+        try:
+            request = decode_request(connection.buffer.split(b"\n", 1)[0])
+        except ValueError:
+            connection.disconnectFromServer()
+            return
+        connection.write(b"ok\n")
+        connection.flush()
+        connection.disconnectFromServer()
+        self.requested.emit(request)
+
+
+def handle_instance_request(request):
+    if not windows:
+        return
+    window = windows[-1]
+    if request["new_window"]:
+        window.new_file()
+        return
+    window.open_paths(request["files"])
+    window.setWindowState(window.windowState() & ~Qt.WindowMinimized)
+    window.raise_()
+    window.activateWindow()
+
+
+class FileLoader(QObject):
+    # reads and decodes files on its own pool. At most MAX_IN_FLIGHT files are being read or
+    # waiting for their tab at any time, so opening hundreds of files never holds them all
+    loaded = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal()
+
+    MAX_IN_FLIGHT = 8
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(self.MAX_IN_FLIGHT)
+        self.pending = deque()
+        self.in_flight = 0
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        # queued files are dropped, files being decoded stop at their next chunk
+        self.pending.clear()
+        self.cancel_event.set()
+        self.cancel_event = threading.Event()
+
+    def load(self, paths):
+        self.pending.extend(paths)
+        self.fill()
+
+    def remaining(self):
+        return len(self.pending) + self.in_flight
+
+    def fill(self):
+        while self.pending and self.in_flight < self.MAX_IN_FLIGHT:
+            path = self.pending.popleft()
+            self.in_flight += 1
+            cancel = self.cancel_event
+            worker = Worker(load_file, path, cancelled=cancel.is_set, report_progress=True)
+            worker.signals.progress.connect(lambda percent, path=path: self.progress.emit(path, percent))
+            worker.signals.result.connect(lambda content, path=path: self.loaded.emit(path, content))
+            worker.signals.error.connect(
+                lambda error, path=path, cancel=cancel: None if cancel.is_set() else self.failed.emit(path, error)
+            )
+            worker.signals.finished.connect(self.on_finished)
+            worker.start(self.pool)
+
+    def on_finished(self):
+        self.in_flight -= 1
+        self.fill()
+        self.finished.emit()
+
+
+class SavePipeline(QObject):
+    # writes snapshots on a background thread, a newer save for the same key replaces a queued one
+    progress = pyqtSignal(object, int)
+    saved = pyqtSignal(object, str, int)
+    failed = pyqtSignal(object, str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pending = {}
+        self.order = deque()
+        self.busy = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="save-pipeline", daemon=True)
+        self.thread.start()
+
+    def submit(self, key, path, text, text_format, revision=0):
+        # True when this adds a save, False when it replaced one that was still queued
+        with self.condition:
+            queued = key not in self.pending
+            if queued:
+                self.order.append(key)
+            self.pending[key] = (path, text, text_format, revision)
+            self.condition.notify()
+        return queued
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.order)
+                key = self.order.popleft()
+                path, text, text_format, revision = self.pending.pop(key)
+                self.busy = True
+            try:
+                last_percent = [-1]
+
+                def report(written, total):
+                    percent = written * 100 // total
+                    if percent != last_percent[0]:
+                        last_percent[0] = percent
+                        self.progress.emit(key, percent)
+
+                start = time.perf_counter()
+                atomic_write(path, text_format.encode(text), report, text_format.compression)
+                if profiler.enabled:
+                    profiler.record("SavePipeline atomic_write", start, time.perf_counter() - start)
+            except Exception as e:
+                self.failed.emit(key, path, str(e))
+            else:
+                self.saved.emit(key, path, revision)
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+
+class FileWatcher(QObject):
+    # reports files that changed on disk. QFileSystemWatcher stops watching a file once it is
+    # replaced and misses changes on some network shares, so every file is polled as well
+    changed = pyqtSignal(str)
+
+    POLL_INTERVAL = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.signatures = {}
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.POLL_INTERVAL)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start()
+
+    def set_paths(self, paths):
+        for path in set(self.signatures) - paths:
+            del self.signatures[path]
+            if path in self.watcher.files():
+                self.watcher.removePath(path)
+        for path in paths - set(self.signatures):
+            self.signatures[path] = file_signature(path)
+            if self.signatures[path] is not None:
+                self.watcher.addPath(path)
+
+    def on_file_changed(self, path):
+        if path in self.signatures:
+            self.signatures[path] = file_signature(path)
+            self.changed.emit(path)
+
+    def poll(self):
+        watched = set(self.watcher.files())
+        for path, known in list(self.signatures.items()):
+            signature = file_signature(path)
+            # a file that was replaced or came back is watched again
+            if signature is not None and path not in watched:
+                self.watcher.addPath(path)
+            if signature != known:
+                self.signatures[path] = signature
+                self.changed.emit(path)
+
+
+class DocumentStats(QObject):
+    # keeps character, word and line counts current from contentsChange deltas
+    changed = pyqtSignal()
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.document = document
+        self.block_words = []
+        self.words = 0
+        self.block_count = 0
+        self.rebuild()
+        document.contentsChange.connect(self.on_contents_change)
+
+    def rebuild(self):
+        # one pass over a plain text copy is much cheaper than walking every block from python
+        self.block_words = list(map(len, map(str.split, document_text(self.document).split("\n"))))
+        self.words = sum(self.block_words)
+        self.block_count = self.document.blockCount()
+
+    @instrumented
+    def on_contents_change(self, position, removed, added):
+        document = self.document
+        count = document.blockCount()
+        end = min(position + added, document.characterCount() - 1)
+        first = document.findBlock(position)
+        last = document.findBlock(end).blockNumber()
+        # blocks after the edit only shifted, so the old span is the new one minus the block delta
+        old_last = last - (count - self.block_count)
+
+        if last - first.blockNumber() > 256:
+            # wide changes such as Replace All are cheaper to recount from one copy of the span
+            last_block = document.findBlockByNumber(last)
+            text = text_range(document, first.position(), last_block.position() + last_block.length() - 1)
+            new_words = list(map(len, map(str.split, text.split("\n"))))
+        else:
+            new_words = []
+            block = first
+            while block.isValid() and block.blockNumber() <= last:
+                new_words.append(len(block.text().split()))
+                block = block.next()
+
+        first = first.blockNumber()
+        self.words += sum(new_words) - sum(self.block_words[first:old_last + 1])
+        self.block_words[first:old_last + 1] = new_words
+        self.block_count = count
+        self.changed.emit()
+
+    def characters(self):
+        return self.document.characterCount() - 1
+
+    def lines(self):
+        return self.block_count
+
+
+class LargeFileView(QAbstractScrollArea):
+    # read-only viewer that only decodes and paints the lines in the viewport
+    cursorPositionChanged = pyqtSignal()
+
+    DISPLAY_LIMIT = 4096
+
+    def __init__(self, large_file):
+        super().__init__()
+        self.large_file = large_file
+        self.current_line = 0
+        self.match = None
+        self.match_start = 0
+        self.match_end = 0
+        self.searching = False
+        self.show_line_numbers = True
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update)
+        self.update_scroll_range()
+
+    def visible_rows(self):
+        return max(1, self.viewport().height() // self.fontMetrics().height())
+
+    def number_width(self):
+        # wide enough for the last line number known so far, it grows while lines are indexed
+        if not self.show_line_numbers:
+            return 0
+        digits = max(len(str(self.large_file.line_count())), 2)
+        return self.fontMetrics().horizontalAdvance("9") * digits + 2 * LineNumberGutter.PADDING
+
+    def update_scroll_range(self):
+        rows = self.visible_rows()
+        vbar = self.verticalScrollBar()
+        vbar.setRange(0, max(0, self.large_file.line_count() - rows))
+        vbar.setPageStep(rows)
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scroll_range()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        height = metrics.height()
+        width = metrics.horizontalAdvance(" ")
+        first = self.verticalScrollBar().value()
+        column = self.horizontalScrollBar().value()
+        numbers = self.number_width()
+        columns = (self.viewport().width() - numbers) // width + 1
+        palette = self.palette()
+        text_color = palette.text().color()
+        number_color = QColor(text_color)
+        number_color.setAlpha(LineNumberGutter.DIM_ALPHA)
+        longest = 0
+
+        for row, text in enumerate(self.large_file.lines(first, self.visible_rows() + 1, self.DISPLAY_LIMIT)):
+            line = first + row
+            y = row * height
+            text = text.expandtabs(4)
+            longest = max(longest, len(text))
+            if line == self.current_line:
+                painter.fillRect(0, y, self.viewport().width(), height, palette.alternateBase())
+            if self.match and self.match[0] == line:
+                start, end = self.match[1] - column, self.match[2] - column
+                painter.fillRect(numbers + start * width, y, (end - start) * width, height, palette.highlight())
+            if numbers:
+                painter.setPen(text_color if line == self.current_line else number_color)
+                painter.drawText(
+                    0, y, numbers - LineNumberGutter.PADDING, height, Qt.AlignRight | Qt.AlignVCenter, str(line + 1)
+                )
+            painter.setPen(text_color)
+            painter.drawText(numbers + 2, y + metrics.ascent(), text[column:column + columns])
+
+        hbar = self.horizontalScrollBar()
+        if longest - columns > hbar.maximum():
+            hbar.setRange(0, longest - columns)
+            hbar.setPageStep(columns)
+
+    def set_current_line(self, line):
+        line = max(0, min(line, self.large_file.line_count() - 1))
+        self.current_line = line
+        first = self.verticalScrollBar().value()
+        rows = self.visible_rows()
+        if line < first:
+            self.verticalScrollBar().setValue(line)
+        elif line >= first + rows:
+            self.verticalScrollBar().setValue(line - rows + 1)
+        self.viewport().update()
+        self.cursorPositionChanged.emit()
+
+    def go_to_line(self, line):
+        self.match = None
+        self.current_line = max(0, min(line, self.large_file.line_count() - 1))
+        self.verticalScrollBar().setValue(self.current_line - self.visible_rows() // 2)
+        self.viewport().update()
+        self.cursorPositionChanged.emit()
+
+    def show_match(self, start, end):
+        line = self.large_file.line_at(start)
+        line_start = self.large_file.line_start(line)
+        prefix = self.large_file._map[line_start:start].decode(self.large_file.encoding, errors="replace")
+        matched = self.large_file._map[start:end].decode(self.large_file.encoding, errors="replace")
+        column = len(prefix.expandtabs(4))
+        self.go_to_line(line)
+        self.match = (line, column, column + len(matched))
+        self.match_start = start
+        self.match_end = end
+        hbar = self.horizontalScrollBar()
+        columns = (self.viewport().width() - self.number_width()) // self.fontMetrics().horizontalAdvance(" ")
+        if not hbar.value() <= column < hbar.value() + columns:
+            hbar.setValue(max(0, column - columns // 2))
+
+    def search_start(self, backward=False):
+        # a backward search goes on from the start of the shown match, a forward one from its end
+        if self.match and self.match[0] == self.current_line:
+            return self.match_start if backward else self.match_end
+        return self.large_file.line_start(self.current_line)
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        rows = self.visible_rows()
+        if key == Qt.Key_Up:
+            self.set_current_line(self.current_line - 1)
+        elif key == Qt.Key_Down:
+            self.set_current_line(self.current_line + 1)
+        elif key == Qt.Key_PageUp:
+            self.set_current_line(self.current_line - rows)
+        elif key == Qt.Key_PageDown:
+            self.set_current_line(self.current_line + rows)
+        elif key == Qt.Key_Home and event.modifiers() & Qt.ControlModifier:
+            self.set_current_line(0)
+        elif key == Qt.Key_End and event.modifiers() & Qt.ControlModifier:
+            self.set_current_line(self.large_file.line_count() - 1)
+        else:
+            super().keyPressEvent(event)
+
+    def mousePressEvent(self, event):
+        row = event.pos().y() // self.fontMetrics().height()
+        self.set_current_line(self.verticalScrollBar().value() + row)
+
+
+class LineNumberGutter(QWidget):
+    # line numbers in the left margin of a plain text editor. Only the visible blocks are
+    # painted, and their tops and heights are read from the layout once per scroll position,
+    # edit and wrap mode, repaints in between such as the blinking cursor reuse them
+    PADDING = 4
+    DIM_ALPHA = 110
+
+    def __init__(self, text_edit):
+        super().__init__(text_edit)
+        self.text_edit = text_edit
+        self.shown = True
+        self.margin = -1
+        # (block number, top, height) of every visible block, and what they were read for
+        self.rows = []
+        self.rows_key = None
+        # the cursor's line is drawn brighter than the others
+        self.current = 0
+        text_edit.blockCountChanged.connect(self.update_width)
+        text_edit.updateRequest.connect(self.on_update_request)
+        text_edit.cursorPositionChanged.connect(self.on_cursor_moved)
+        text_edit.installEventFilter(self)
+        self.update_width()
+
+    def set_shown(self, shown):
+        self.shown = shown
+        self.setVisible(shown)
+        self.update_width()
+
+    def update_width(self):
+        # the margin only changes when the line count gains or loses a digit
+        margin = 0
+        if self.shown:
+            digits = max(len(str(self.text_edit.blockCount())), 2)
+            margin = self.fontMetrics().horizontalAdvance("9") * digits + 2 * self.PADDING
+        if margin != self.margin:
+            self.margin = margin
+            self.text_edit.setViewportMargins(margin, 0, 0, 0)
+            self.update_geometry()
+
+    def update_geometry(self):
+        rect = self.text_edit.contentsRect()
+        self.setGeometry(rect.left(), rect.top(), self.margin, rect.height())
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Resize:
+            self.update_geometry()
+        elif event.type() == QEvent.FontChange:
+            self.setFont(watched.font())
+            self.rows_key = None
+            self.margin = -1
+            self.update_width()
+        return False
+
+    def on_update_request(self, rect, dy):
+        if dy:
+            self.scroll(0, dy)
+        else:
+            self.update(0, rect.y(), self.width(), rect.height())
+
+    def on_cursor_moved(self):
+        # only the rows of the line the cursor left and the one it entered are repainted
+        current = self.text_edit.textCursor().blockNumber()
+        if current != self.current:
+            for number, top, height in self.visible_rows():
+                if number in (current, self.current):
+                    self.update(0, top, self.width(), height)
+            self.current = current
+
+    def visible_rows(self):
+        text_edit = self.text_edit
+        block = text_edit.firstVisibleBlock()
+        offset = text_edit.contentOffset()
+        key = (
+            block.blockNumber(), offset.y(), text_edit.document().revision(), text_edit.lineWrapMode(),
+            text_edit.viewport().width(), self.height()
+        )
+        if key != self.rows_key:
+            self.rows_key = key
+            self.rows = []
+            top = text_edit.blockBoundingGeometry(block).translated(offset).top()
+            while block.isValid() and top <= self.height():
+                height = text_edit.blockBoundingRect(block).height()
+                if block.isVisible():
+                    self.rows.append((block.blockNumber(), int(top), int(height)))
+                top += height
+                block = block.next()
+        return self.rows
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        exposed = event.rect()
+        painter.fillRect(exposed, self.palette().window())
+        current = self.current
+        text_color = self.palette().windowText().color()
+        number_color = QColor(text_color)
+        number_color.setAlpha(self.DIM_ALPHA)
+        line_height = self.fontMetrics().height()
+        right = self.width() - self.PADDING
+        for number, top, height in self.visible_rows():
+            if top > exposed.bottom():
+                break
+            if top + height < exposed.top():
+                continue
+            painter.setPen(text_color if number == current else number_color)
+            painter.drawText(0, top, right, line_height, Qt.AlignRight | Qt.AlignVCenter, str(number + 1))
+
+    def mousePressEvent(self, event):
+        # a click on a number puts the cursor at the start of its line
+        for number, top, height in self.visible_rows():
+            if top <= event.pos().y() < top + height:
+                cursor = self.text_edit.textCursor()
+                cursor.setPosition(self.text_edit.document().findBlockByNumber(number).position())
+                self.text_edit.setTextCursor(cursor)
+                self.text_edit.setFocus()
+                return
+
+
+class BlockFormat(QTextBlockUserData):
+    # what a block's format ranges were made from, they are redone once any of it changes
+    def __init__(self, revision, state, theme):
+        super().__init__()
+        self.revision = revision
+        self.state = state
+        self.theme = theme
+
+
+class ViewportHighlighter(QObject):
+    # colors the visible blocks of one plain text editor, plus a margin, through format ranges
+    # on their layouts, which leaves the document, its undo stack and contentsChange alone.
+    # Each block's userState holds the lexer state at its end, known for the first `valid`
+    # blocks. An edit relexes from its line until a block ends in the state it had before,
+    # states further down than RELEX_LIMIT blocks are lexed on a worker when the view needs them
+    MARGIN = 50
+    RELEX_LIMIT = 2000
+
+    def __init__(self, text_edit, lexer, colors):
+        super().__init__(text_edit)
+        self.text_edit = text_edit
+        self.lexer = lexer
+        self.formats = {}
+        self.theme = 0
+        self.valid = 0
+        self.block_count = text_edit.document().blockCount()
+        # bumped by every edit, a worker lexing an older copy of the text stops
+        self.generation = 0
+        self.lexing = None
+        self.painted = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(16)
+        self.timer.timeout.connect(self.highlight)
+        self.set_colors(colors)
+        text_edit.document().contentsChange.connect(self.on_contents_change)
+        text_edit.updateRequest.connect(self.schedule)
+
+    def schedule(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def set_colors(self, colors):
+        self.formats = {}
+        for kind, color in colors.items():
+            text_format = QTextCharFormat()
+            text_format.setForeground(QColor(color))
+            self.formats[kind] = text_format
+        self.theme += 1
+        self.schedule()
+
+    def set_lexer(self, lexer):
+        self.lexer = lexer
+        self.valid = 0
+        self.generation += 1
+        self.theme += 1
+        self.schedule()
+
+    def stop(self):
+        # the editor goes away, a running worker must not report back
+        self.generation += 1
+        self.timer.stop()
+
+    def clear(self):
+        # highlighting is turned off, every block that was colored goes back to plain text
+        self.stop()
+        block = self.text_edit.document().begin()
+        while block.isValid():
+            if block.userData() is not None:
+                block.layout().setFormats([])
+                block.setUserData(None)
+            block = block.next()
+        self.text_edit.viewport().update()
+
+    def start_state(self, block):
+        # None while the state at the end of the previous block is not known yet
+        number = block.blockNumber()
+        if number == 0 or not self.lexer.multiline:
+            return 0
+        if number > self.valid:
+            return None
+        return block.previous().userState()
+
+    @instrumented
+    def on_contents_change(self, position, removed, added):
+        document = self.text_edit.document()
+        count = document.blockCount()
+        delta = count - self.block_count
+        self.block_count = count
+        if self.lexer.multiline:
+            self.generation += 1
+            first = document.findBlock(position)
+            if first.blockNumber() <= self.valid:
+                last = document.findBlock(min(position + added, document.characterCount() - 1)).blockNumber()
+                # blocks after the edit only moved, their states hold again once a relexed
+                # block past the edit ends in the state it had
+                settled = self.valid + delta
+                self.valid = first.blockNumber()
+                self.lex_blocks(first, self.RELEX_LIMIT, last, settled)
+        self.schedule()
+
+    def lex_blocks(self, block, limit, last=-1, settled=0):
+        state = self.start_state(block)
+        number = block.blockNumber()
+        end = number + limit
+        while block.isValid() and number < end:
+            state = self.lexer.end_state(block.text(), state)
+            unchanged = state == block.userState()
+            block.setUserState(state)
+            self.valid = number + 1
+            if unchanged and last < number < settled:
+                self.valid = settled
+                return
+            number += 1
+            block = block.next()
+
+    def lex_rest(self):
+        # one copy of the text past the known states is lexed on a worker, which hands the
+        # states back in chunks so the GUI thread only ever stores a chunk at a time
+        if self.lexing == self.generation:
+            return
+        document = self.text_edit.document()
+        start = document.findBlockByNumber(self.valid)
+        text = text_range(document, start.position(), document.characterCount() - 1)
+        generation = self.lexing = self.generation
+        worker = Worker(
+            lex_states, self.lexer, text, self.start_state(start),
+            cancelled=lambda: generation != self.generation, report_partial=True
+        )
+        worker.signals.partial.connect(lambda states: self.on_states(generation, states))
+        worker.start()
+
+    def on_states(self, generation, states):
+        if generation != self.generation:
+            return
+        block = self.text_edit.document().findBlockByNumber(self.valid)
+        for state in states:
+            block.setUserState(state)
+            block = block.next()
+        self.valid += len(states)
+        self.schedule()
+
+    @instrumented
+    def highlight(self):
+        text_edit = self.text_edit
+        document = text_edit.document()
+        viewport = text_edit.viewport()
+        first = max(0, text_edit.firstVisibleBlock().blockNumber() - self.MARGIN)
+        last = text_edit.cursorForPosition(QPoint(viewport.width(), viewport.height())).blockNumber() + self.MARGIN
+        key = (first, last, document.revision(), self.theme, self.valid)
+        if key == self.painted:
+            return
+        self.painted = key
+        if self.lexer.multiline and self.valid < min(first, document.blockCount()):
+            # too far past the known states to lex them here
+            if first - self.valid > self.RELEX_LIMIT:
+                self.lex_rest()
+                return
+            self.lex_blocks(document.findBlockByNumber(self.valid), first - self.valid)
+        block = document.findBlockByNumber(first)
+        changed = False
+        while block.isValid() and block.blockNumber() <= last:
+            state = self.start_state(block)
+            if state is None:
+                self.lex_blocks(document.findBlockByNumber(self.valid), block.blockNumber() - self.valid + self.MARGIN)
+                state = self.start_state(block)
+            data = block.userData()
+            if data is None or (data.revision, data.state, data.theme) != (block.revision(), state, self.theme):
+                tokens, end_state = self.lexer.tokenize(block.text(), state)
+                ranges = []
+                for start, length, kind in tokens:
+                    format_range = QTextLayout.FormatRange()
+                    format_range.start = start
+                    format_range.length = length
+                    format_range.format = self.formats[kind]
+                    ranges.append(format_range)
+                block.layout().setFormats(ranges)
+                block.setUserData(BlockFormat(block.revision(), state, self.theme))
+                changed = True
+            block = block.next()
+        if changed:
+            viewport.update()
+
+
+class SearchSession(QObject):
+    # match index for one editor, built off the GUI thread and patched on every edit
+    ready = pyqtSignal()
+    changed = pyqtSignal()
+
+    def __init__(self, text_edit):
+        super().__init__(text_edit)
+        self.text_edit = text_edit
+        self.key = None
+        self.index = None
+        self.pending_edits = []
+        self.generation = 0
+        text_edit.document().contentsChange.connect(self.on_contents_change)
+
+    def start(self, key, pattern):
+        self.key = key
+        self.index = None
+        self.pending_edits = []
+        self.generation += 1
+        generation = self.generation
+        worker = Worker(MatchIndex.build, pattern, document_text(self.text_edit.document()))
+        worker.signals.result.connect(lambda index: self.on_built(generation, index))
+        worker.start()
+
+    def reset(self):
+        self.key = None
+        self.index = None
+        self.generation += 1
+
+    def line_range(self, position, added):
+        document = self.text_edit.document()
+        first = document.findBlock(position)
+        last = document.findBlock(max(position, min(position + added, document.characterCount() - 1)))
+        return first.position(), last.position() + last.length() - 1
+
+    @instrumented
+    def on_contents_change(self, position, removed, added):
+        if self.key is None:
+            return
+        start, new_end = self.line_range(position, added)
+        old_end = new_end - (added - removed)
+        if self.index is None:
+            self.pending_edits.append((start, old_end, new_end))
+        elif not self.index.line_local:
+            # a pattern that can span lines cannot be patched locally
+            self.reset()
+            self.changed.emit()
+        else:
+            self.index.apply_edit(start, old_end, new_end, text_range(self.text_edit.document(), start, new_end))
+            self.changed.emit()
+
+    @instrumented
+    def on_built(self, generation, index):
+        if generation != self.generation:
+            return
+        if self.pending_edits and not index.line_local:
+            self.start(self.key, index.pattern)
+            return
+        # replay edits made while the worker was scanning, then rescan the lines they touched
+        dirty = None
+        for start, old_end, new_end in self.pending_edits:
+            delta = new_end - old_end
+            index.remove_and_shift(start, old_end, delta)
+            if dirty is None:
+                dirty = [start, new_end]
+            else:
+                low, high = dirty
+                low = low + delta if low >= old_end else min(low, start)
+                high = high + delta if high >= old_end else (new_end if high >= start else high)
+                dirty = [min(low, start), max(high, new_end)]
+        if dirty:
+            start, end = self.line_range(dirty[0], dirty[1] - dirty[0])
+            index.remove_and_shift(start, end, 0)
+            index.rescan(start, text_range(self.text_edit.document(), start, end))
+        self.pending_edits = []
+        self.index = index
+        self.ready.emit()
+
+
+class WordIndex(QObject):
+    # the completion index of one document, built on a worker from a copy of the text and then
+    # kept current from contentsChange deltas. Edits made while the worker runs are replayed
+    # on its result: the blocks they touched are read again
+    # an edit across more blocks than this, such as Replace All, has the index built again on
+    # a worker rather than patched on the GUI thread
+    REBUILD_BLOCKS = 4096
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.document = document
+        self.index = None
+        self.pending_edits = []
+        self.generation = 0
+        self.block_count = document.blockCount()
+        document.contentsChange.connect(self.on_contents_change)
+        self.build()
+
+    def build(self):
+        self.index = None
+        self.pending_edits = []
+        self.generation += 1
+        generation = self.generation
+        worker = Worker(CompletionIndex.build, document_text(self.document))
+        worker.signals.result.connect(lambda index: self.on_built(generation, index))
+        worker.start()
+
+    def stop(self):
+        self.document.contentsChange.disconnect(self.on_contents_change)
+        self.deleteLater()
+
+    @instrumented
+    def on_contents_change(self, position, removed, added):
+        document = self.document
+        count = document.blockCount()
+        first = document.findBlock(position)
+        last = document.findBlock(min(position + added, document.characterCount() - 1))
+        # blocks after the edit only shifted, so the old span is the new one minus the block delta
+        old_last = last.blockNumber() - (count - self.block_count)
+        self.block_count = count
+        if last.blockNumber() - first.blockNumber() > self.REBUILD_BLOCKS:
+            self.build()
+        elif self.index is None:
+            self.pending_edits.append((first.blockNumber(), old_last, last.blockNumber()))
+        else:
+            text = text_range(document, first.position(), last.position() + last.length() - 1)
+            self.index.replace_blocks(first.blockNumber(), old_last, text.split("\n"))
+
+    @instrumented
+    def on_built(self, generation, index):
+        if generation != self.generation:
+            return
+        # the edited blocks are emptied one edit at a time, which keeps the index's blocks in
+        # step with the document, and the span they cover now is read once at the end
+        dirty = None
+        for first, old_last, new_last in self.pending_edits:
+            index.replace_blocks(first, old_last, [""] * (new_last - first + 1))
+            delta = new_last - old_last
+            if dirty is None:
+                dirty = [first, new_last]
+            else:
+                low, high = dirty
+                low = low + delta if low > old_last else min(low, first)
+                high = high + delta if high > old_last else (new_last if high >= first else high)
+                dirty = [min(low, first), max(high, new_last)]
+        if dirty:
+            first = self.document.findBlockByNumber(dirty[0])
+            last = self.document.findBlockByNumber(dirty[1])
+            text = text_range(self.document, first.position(), last.position() + last.length() - 1)
+            index.replace_blocks(dirty[0], dirty[1], text.split("\n"))
+        self.pending_edits = []
+        self.index = index
+
+
+class CompletionPopup(QListWidget):
+    # words to complete the one at the cursor with, shown under it without taking the focus,
+    # so typing goes on in the editor and the list follows
+    accepted = pyqtSignal(str)
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setUniformItemSizes(True)
+        self.itemClicked.connect(lambda item: self.accepted.emit(item.text()))
+        self.text_edit = None
+        self.prefix = ""
+        self.hide()
+
+    def show_words(self, text_edit, prefix, words):
+        self.text_edit = text_edit
+        self.prefix = prefix
+        self.setFont(text_edit.font())
+        self.clear()
+        self.addItems(words)
+        self.setCurrentRow(0)
+        frame = 2 * self.frameWidth()
+        width = max(self.sizeHintForColumn(0) + frame + 16, 120)
+        height = self.sizeHintForRow(0) * len(words) + frame
+        self.resize(width, height)
+        window = self.parentWidget()
+        rect = text_edit.cursorRect()
+        position = text_edit.viewport().mapTo(window, rect.bottomLeft())
+        # above the cursor when there is no room below it
+        if position.y() + height > window.height():
+            position.setY(text_edit.viewport().mapTo(window, rect.topLeft()).y() - height)
+        position.setX(max(0, min(position.x(), window.width() - width)))
+        self.move(position)
+        self.show()
+        self.raise_()
+
+    def move_selection(self, step):
+        self.setCurrentRow(max(0, min(self.count() - 1, self.currentRow() + step)))
+
+
+class FindBar(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        rows = QVBoxLayout(self)
+        rows.setContentsMargins(4, 2, 4, 2)
+        rows.setSpacing(2)
+        layout = QHBoxLayout()
+        rows.addLayout(layout)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Find")
+        layout.addWidget(self.search_edit, 1)
+
+        self.regex_box = QCheckBox("Regex")
+        self.case_box = QCheckBox("Match case")
+        self.word_box = QCheckBox("Whole word")
+        for box in (self.regex_box, self.case_box, self.word_box):
+            layout.addWidget(box)
+
+        self.count_label = QLabel("")
+        layout.addWidget(self.count_label)
+
+        self.previous_button = QPushButton("Previous")
+        self.next_button = QPushButton("Next")
+        self.close_button = QPushButton("Close")
+        for button in (self.previous_button, self.next_button, self.close_button):
+            layout.addWidget(button)
+
+        self.replace_row = QWidget()
+        replace_layout = QHBoxLayout(self.replace_row)
+        replace_layout.setContentsMargins(0, 0, 0, 0)
+        self.replace_edit = QLineEdit()
+        self.replace_edit.setPlaceholderText("Replace with")
+        replace_layout.addWidget(self.replace_edit, 1)
+        self.replace_button = QPushButton("Replace")
+        self.replace_all_button = QPushButton("Replace All")
+        replace_layout.addWidget(self.replace_button)
+        replace_layout.addWidget(self.replace_all_button)
+        rows.addWidget(self.replace_row)
+        self.replace_row.hide()
+
+    def options(self):
+        return (
+            self.search_edit.text(), self.regex_box.isChecked(),
+            self.case_box.isChecked(), self.word_box.isChecked()
+        )
+
+    def set_term(self, term):
+        self.search_edit.setText(term)
+
+
+class ReloadBar(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(4, 2, 4, 2)
+        self.message_label = QLabel("")
+        layout.addWidget(self.message_label, 1)
+        self.reload_button = QPushButton("Reload")
+        self.ignore_button = QPushButton("Ignore")
+        for button in (self.reload_button, self.ignore_button):
+            layout.addWidget(button)
+
+    def set_file(self, path, exists):
+        name = os.path.basename(path)
+        if exists:
+            self.message_label.setText(f"{name} was changed on disk.")
+        else:
+            self.message_label.setText(f"{name} was deleted on disk.")
+        self.reload_button.setEnabled(exists)
+
+
+class FindInFilesPanel(QDockWidget):
+    def __init__(self, parent=None):
+        super().__init__("Find in Files", parent)
+        self.setObjectName("find_in_files")
+        body = QWidget()
+        rows = QVBoxLayout(body)
+        rows.setContentsMargins(4, 2, 4, 2)
+        rows.setSpacing(2)
+
+        folder_row = QHBoxLayout()
+        rows.addLayout(folder_row)
+        self.folder_edit = QLineEdit(os.getcwd())
+        self.folder_edit.setPlaceholderText("Folder")
+        folder_row.addWidget(self.folder_edit, 1)
+        self.browse_button = QPushButton("Browse...")
+        folder_row.addWidget(self.browse_button)
+
+        search_row = QHBoxLayout()
+        rows.addLayout(search_row)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Find in files")
+        search_row.addWidget(self.search_edit, 1)
+        self.regex_box = QCheckBox("Regex")
+        self.case_box = QCheckBox("Match case")
+        self.word_box = QCheckBox("Whole word")
+        for box in (self.regex_box, self.case_box, self.word_box):
+            search_row.addWidget(box)
+        self.search_button = QPushButton("Search")
+        search_row.addWidget(self.search_button)
+
+        self.stats_label = QLabel("")
+        rows.addWidget(self.stats_label)
+
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.setUniformRowHeights(True)
+        rows.addWidget(self.results, 1)
+        self.setWidget(body)
+
+    def options(self):
+        return (
+            self.search_edit.text(), self.regex_box.isChecked(),
+            self.case_box.isChecked(), self.word_box.isChecked()
+        )
+
+    def set_running(self, running):
+        self.search_button.setText("Cancel" if running else "Search")
+
+
+def sparkline(counts):
+    bars = " \u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+    peak = max(counts) or 1
+    return "".join(bars[0 if not count else 1 + (len(bars) - 2) * count // peak] for count in counts)
+
+
+class CompareView(QWidget):
+    # two read-only panes lined up row by row with the changed rows colored, in a window of its
+    # own. The panes scroll together and the buttons step through the changes
+    COLORS = {
+        "removed": QColor(220, 60, 60, 70), "added": QColor(60, 180, 75, 70),
+        "changed": QColor(230, 170, 40, 70), "filler": QColor(128, 128, 128, 40),
+    }
+    # the panes are filled on the GUI thread a slice of rows at a time, so even two 100k-line
+    # documents never block it for more than about BUILD_SLICE seconds at once
+    BUILD_ROWS = 5000
+    BUILD_SLICE = 0.05
+
+    def __init__(self, parent, left_title, right_title):
+        super().__init__(parent, Qt.Window)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle(f"Compare {left_title} with {right_title}")
+        self.resize(1100, 700)
+        self.hunks = []
+        self.current = -1
+        self.building = None
+        self.build_timer = QTimer(self)
+        self.build_timer.setInterval(0)
+        self.build_timer.timeout.connect(self.build_step)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+
+        bar = QHBoxLayout()
+        layout.addLayout(bar)
+        self.summary_label = QLabel("Comparing...")
+        bar.addWidget(self.summary_label, 1)
+        self.position_label = QLabel("")
+        bar.addWidget(self.position_label)
+        self.previous_button = QPushButton("Previous Change")
+        self.previous_button.setShortcut(QKeySequence("Alt+Up"))
+        self.previous_button.clicked.connect(lambda: self.step(-1))
+        self.next_button = QPushButton("Next Change")
+        self.next_button.setShortcut(QKeySequence("Alt+Down"))
+        self.next_button.clicked.connect(lambda: self.step(1))
+        for button in (self.previous_button, self.next_button):
+            button.setEnabled(False)
+            bar.addWidget(button)
+
+        columns = QHBoxLayout()
+        layout.addLayout(columns, 1)
+        self.panes = []
+        for title in (left_title, right_title):
+            column = QVBoxLayout()
+            column.addWidget(QLabel(title))
+            pane = QPlainTextEdit()
+            pane.setReadOnly(True)
+            # rows must keep the same height on both sides to stay lined up
+            pane.setLineWrapMode(QPlainTextEdit.NoWrap)
+            pane.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+            column.addWidget(pane, 1)
+            columns.addLayout(column)
+            self.panes.append(pane)
+        left, right = self.panes
+        for pane, other in ((left, right), (right, left)):
+            # editors move their own scroll bars with signals blocked when they follow the cursor,
+            # a scroll of the view is reported through updateRequest either way
+            pane.updateRequest.connect(lambda rect, dy, pane=pane, other=other: self.sync_scroll(pane, other, dy))
+            pane.horizontalScrollBar().valueChanged.connect(other.horizontalScrollBar().setValue)
+
+    def show_result(self, comparison):
+        # the worker only hands over rows and runs, documents belong to the GUI thread
+        self.summary_label.setText("Filling the panes...")
+        self.building = self.fill_panes(comparison)
+        self.build_timer.start()
+
+    @instrumented
+    def build_step(self):
+        deadline = time.perf_counter() + self.BUILD_SLICE
+        for _ in self.building:
+            if time.perf_counter() >= deadline:
+                return
+        self.build_timer.stop()
+        self.building = None
+
+    def fill_panes(self, comparison):
+        # yields after every slice of rows or run of colored rows. The documents get no layout
+        # until they are full, one per run of rows rather than one block format per row
+        formats = {}
+        for kind, color in self.COLORS.items():
+            formats[kind] = QTextBlockFormat()
+            formats[kind].setBackground(color)
+        documents = []
+        for rows, runs in ((comparison.left, comparison.left_runs), (comparison.right, comparison.right_runs)):
+            document = QTextDocument()
+            document.setUndoRedoEnabled(False)
+            cursor = QTextCursor(document)
+            for start in range(0, len(rows), self.BUILD_ROWS):
+                cursor.insertText(("\n" if start else "") + "\n".join(rows[start:start + self.BUILD_ROWS]))
+                yield
+            for start, end, kind in runs:
+                cursor.setPosition(document.findBlockByNumber(start).position())
+                cursor.setPosition(document.findBlockByNumber(end - 1).position(), QTextCursor.KeepAnchor)
+                cursor.setBlockFormat(formats[kind])
+                yield
+            documents.append(document)
+        self.summary_label.setText(comparison.describe())
+        self.hunks = comparison.hunks
+        for pane, document in zip(self.panes, documents):
+            document.setDefaultFont(pane.font())
+            document.setDocumentLayout(QPlainTextDocumentLayout(document))
+            pane.setDocument(document)
+            document.setParent(pane)
+            yield
+        for button in (self.previous_button, self.next_button):
+            button.setEnabled(bool(self.hunks))
+        if self.hunks:
+            self.go_to_change(0)
+
+    def show_error(self, error):
+        self.summary_label.setText(f"Could not compare: {error}")
+
+    def sync_scroll(self, pane, other, dy):
+        if dy:
+            other.verticalScrollBar().setValue(pane.verticalScrollBar().value())
+
+    def step(self, direction):
+        if self.hunks:
+            self.go_to_change((self.current + direction) % len(self.hunks))
+
+    def go_to_change(self, index):
+        self.current = index
+        start = self.hunks[index][0]
+        for pane in self.panes:
+            cursor = pane.textCursor()
+            cursor.setPosition(pane.document().findBlockByNumber(start).position())
+            pane.setTextCursor(cursor)
+        # the other pane follows through the shared scroll position
+        self.panes[0].centerCursor()
+        self.position_label.setText(f"Change {index + 1:,} of {len(self.hunks):,}")
+
+
+class PerformanceOverlay(QLabel):
+    # read-only view of the profiler drawn over the top right corner of the editor
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.PlainText)
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 190); color: #e0e0e0; padding: 6px;")
+        self.timer = QTimer(self)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_active(self, active):
+        self.setVisible(active)
+        if active:
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        lines = [f"{'slot':<36} {'calls':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>8}  ms histogram"]
+        for name, stats in profiler.snapshot().items():
+            times = " ".join(f"{stats[key] * 1000:7.2f}" for key in ("p50", "p95", "p99"))
+            lines.append(
+                f"{name[-36:]:<36} {stats['count']:>7} {times} {stats['max'] * 1000:8.1f}  {sparkline(stats['histogram'])}"
+            )
+        lines.append("histogram buckets: " + " ".join(f"<{bound:g}" for bound in BUCKETS_MS) + " ms, slower")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        area = self.parentWidget().centralWidget().geometry()
+        self.move(area.right() - self.width() - 8, area.top() + 8)
+        self.raise_()
+
+
+def editor_cost(text_edit):
+    document = text_edit.document()
+    cost = document_cost(document.characterCount(), document.blockCount())
+    return cost + (text_edit.undo_log.size if text_edit.undo_log else 0)
+
+
+def enforce_memory_budget():
+    # one budget for the whole process: the least recently used text tabs of every window are
+    # hibernated until the rest fits. Current tabs stay, and nothing moves while a dialog is up
+    if QApplication.activeModalWidget():
+        return
+    tabs = [
+        (window, widget) for window in windows
+        for widget in map(window.tab_widget.widget, range(window.tab_widget.count()))
+        if isinstance(widget, TEXT_EDITORS)
+    ]
+    # a document shown in several windows counts once
+    used = sum(editor_cost(widget) for widget in {id(widget.state): widget for window, widget in tabs}.values())
+    for window, widget in sorted(tabs, key=lambda tab: tab[1].last_active):
+        if used <= MEMORY_BUDGET:
+            break
+        cost = editor_cost(widget)
+        if cost >= MIN_HIBERNATE_COST and window.can_hibernate(widget) and window.hibernate_tab(widget):
+            used -= cost
+    for window in windows:
+        window.update_memory_status(used)
+
+
+class TabPlaceholder(QWidget):
+    # stands in for a restored session tab until it is first activated, or for a hibernated
+    # tab whose document waits in the hibernation cache
+    def __init__(self, record, undo_log=None, disk=None):
+        super().__init__()
+        self.record = record
+        self.undo_log = undo_log
+        self.disk = disk
+        self.setProperty("file_path", record.get("path"))
+        self.error_label = QLabel(self)
+        self.error_label.setAlignment(Qt.AlignCenter)
+        self.error_label.setWordWrap(True)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.error_label)
+
+    def show_error(self, message):
+        # the tab stays as it was, showing it again tries once more
+        self.error_label.setText(f"{message}\n\nSwitch to another tab and back to try again.")
+
+
+class DocumentState:
+    # everything about an open document that is not about one view of it. Views of a file in
+    # several windows share its state along with the QTextDocument
+    def __init__(self, document):
+        self.document = document
+        # the view whose window journals the document's edits and logs its undo steps
+        self.owner = None
+        self.connections = []
+
+
+def shared_attribute(name):
+    return property(lambda view: getattr(view.state, name), lambda view, value: setattr(view.state, name, value))
+
+
+class DocumentView:
+    # the per document attributes of a text tab live on its DocumentState
+    text_format = shared_attribute("text_format")
+    stats = shared_attribute("stats")
+    journal_id = shared_attribute("journal_id")
+    saves_pending = shared_attribute("saves_pending")
+    undo_log = shared_attribute("undo_log")
+    typing = shared_attribute("typing")
+    disk = shared_attribute("disk")
+    disk_changed = shared_attribute("disk_changed")
+    following = shared_attribute("following")
+    reloading = shared_attribute("reloading")
+    completion = shared_attribute("completion")
+
+
+class PlainTextEditor(QPlainTextEdit, DocumentView):
+    pass
+
+
+class RichTextEditor(QTextEdit, DocumentView):
+    pass
+
+
+class DocumentRegistry:
+    # the documents of files open in text tabs by canonical path, so a window opening a file
+    # that is open elsewhere gets another view of the same QTextDocument instead of a copy
+    def __init__(self):
+        self.states = {}
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.realpath(path))
+
+    @staticmethod
+    def views(state):
+        return [
+            widget for window in windows
+            for widget in map(window.tab_widget.widget, range(window.tab_widget.count()))
+            if getattr(widget, "state", None) is state
+        ]
+
+    def lookup(self, path):
+        state = self.states.get(self.key(path))
+        return state if state and self.views(state) else None
+
+    def register(self, path, state):
+        # a file already shown elsewhere keeps that document
+        if self.lookup(path) is None:
+            self.states[self.key(path)] = state
+
+    def release(self, state):
+        for key in [key for key, known in self.states.items() if known is state]:
+            del self.states[key]
+
+
+registry = DocumentRegistry()
+
+
+class AppScheduler(QObject):
+    # the periodic jobs of all windows: one recovery journal flushed and compacted for every
+    # tab, one memory budget check, and one watcher for the files of all text tabs that checks
+    # each document once however many windows show it
     def __init__(self):
         super().__init__()
-        self.initUI()
-        # Set dark mode as default
-        self.dark_mode_action.setChecked(True)
-        self.toggle_dark_mode()
-        
-        self.document_modified = False
-        
+        # every edit of every tab goes into the recovery journal
+        self.journal = RecoveryJournal(RECOVERY_DIR)
+        self.tab_ids = count(1)
+        self.dark_mode = True
+        self.word_completion = True
+        self.complete_all_tabs = False
+        self.recovered = False
+
+        self.journal_timer = QTimer(self)
+        self.journal_timer.timeout.connect(self.journal.flush)
+        self.journal_timer.start(1000)
+
         # auto save every 60 seconds
         self.auto_save_timer = QTimer(self)
         self.auto_save_timer.timeout.connect(self.auto_save)
-        self.auto_save_timer.start(60000)  # 60 seconds
+        self.auto_save_timer.start(60000)
+
+        # inactive tabs are hibernated when the open documents outgrow the memory budget
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(MEMORY_CHECK_INTERVAL)
+        self.memory_timer.timeout.connect(enforce_memory_budget)
+        self.memory_timer.start()
+
+        # files of open tabs are watched for changes made by other programs
+        self.file_watcher = FileWatcher(self)
+        self.file_watcher.changed.connect(self.on_file_changed)
+        self.changed_files = set()
+        self.disk_timer = QTimer(self)
+        self.disk_timer.setSingleShot(True)
+        self.disk_timer.setInterval(DISK_CHECK_DELAY)
+        self.disk_timer.timeout.connect(self.check_changed_files)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(0)
+        self.watch_timer.timeout.connect(self.sync_watched_files)
+
+    @staticmethod
+    def tabs():
+        return [
+            (window, widget) for window in windows
+            for widget in map(window.tab_widget.widget, range(window.tab_widget.count()))
+        ]
+
+    def sync_watched_files(self):
+        # hibernated tabs are left out, their DiskState is checked when they come back
+        self.file_watcher.set_paths({
+            widget.property("file_path") for window, widget in self.tabs()
+            if isinstance(widget, TEXT_EDITORS) and widget.property("file_path")
+        })
+
+    def on_file_changed(self, path):
+        self.changed_files.add(path)
+        if not self.disk_timer.isActive():
+            self.disk_timer.start()
+
+    def check_changed_files(self):
+        paths, self.changed_files = self.changed_files, set()
+        checked = set()
+        for window, widget in self.tabs():
+            if isinstance(widget, TEXT_EDITORS) and widget.property("file_path") in paths and widget.state not in checked:
+                checked.add(widget.state)
+                window.check_disk(widget)
+        # every window showing a changed document offers the reload
+        for window in windows:
+            window.update_reload_bar()
+
+    @instrumented
+    def auto_save(self):
+        # unsaved changes of every tab already live in the recovery journal as deltas,
+        # so this only makes them durable and compacts the journal when it grows
+        editors, hibernated = {}, {}
+        for window, widget in self.tabs():
+            if isinstance(widget, TEXT_EDITORS):
+                editors[widget.journal_id] = window, widget
+            elif isinstance(widget, TabPlaceholder) and widget.record.get("cache"):
+                hibernated[widget.record["journal_id"]] = widget.record
+
+        def snapshot(tab_id):
+            if tab_id in hibernated:
+                record = hibernated[tab_id]
+                return record["title"], record["path"], read_cache(record["cache"])["text"]
+            window, text_edit = editors[tab_id]
+            title = window.tab_widget.tabText(window.tab_widget.indexOf(text_edit)).rstrip("*")
+            return title, text_edit.property("file_path"), document_text(text_edit.document())
+
+        self.journal.flush(sync=True)
+        if self.journal.compact(snapshot):
+            for window in windows:
+                window.status_bar.showMessage("Recovery journal compacted", 2000)
+
+    def stop(self):
+        # the last window is closing, no timer may touch the journal it discards
+        for timer in (
+            self.journal_timer, self.auto_save_timer, self.memory_timer, self.file_watcher.timer,
+            self.disk_timer, self.watch_timer
+        ):
+            timer.stop()
+        self.journal.discard()
+
+
+# created with the first window and shut down with the last one
+scheduler = None
+
+
+def app_scheduler():
+    global scheduler
+    if scheduler is None:
+        scheduler = AppScheduler()
+    return scheduler
+
+
+def shutdown_scheduler():
+    global scheduler
+    if scheduler is not None:
+        scheduler.stop()
+        scheduler = None
+
+
+# applied to the whole application while dark mode is on
+DARK_STYLESHEET = """
+QWidget {
+    background-color: #1e1e1e;
+    color: #f0f0f0;
+}
+
+QTextEdit, QPlainTextEdit {
+    background-color: #252525;
+    color: #f0f0f0;
+    border: none;
+    selection-background-color: #264f78;
+    selection-color: #ffffff;
+}
+
+QMenuBar {
+    background-color: #333333;
+    color: #f0f0f0;
+}
+
+QMenuBar::item {
+    background-color: #333333;
+    color: #f0f0f0;
+    padding: 4px 8px;
+}
+
+QMenuBar::item:selected {
+    background-color: #505050;
+}
+
+QMenu {
+    background-color: #2d2d2d;
+    color: #f0f0f0;
+    border: 1px solid #505050;
+}
+
+QMenu::item:selected {
+    background-color: #404040;
+}
+
+QTabWidget::pane {
+    border: none;
+}
+
+QTabBar::tab {
+    background: #333333;
+    color: #f0f0f0;
+    padding: 8px 12px;
+    margin-right: 2px;
+    border-top-left-radius: 4px;
+    border-top-right-radius: 4px;
+}
+
+QTabBar::tab:selected {
+    background: #0078d7;
+}
+
+QToolBar {
+    background-color: #333333;
+    border: none;
+    spacing: 3px;
+}
+
+QToolBar QToolButton {
+    background-color: #333333;
+    color: #f0f0f0;
+    border: 1px solid #505050;
+    border-radius: 4px;
+    padding: 4px;
+}
+
+QToolBar QToolButton:hover {
+    background-color: #404040;
+}
+
+QStatusBar {
+    background-color: #333333;
+    color: #f0f0f0;
+}
+
+QDialog {
+    background-color: #2d2d2d;
+    color: #f0f0f0;
+}
+
+QPushButton {
+    background-color: #0078d7;
+    color: #ffffff;
+    border: none;
+    padding: 6px 12px;
+    border-radius: 4px;
+}
+
+QPushButton:hover {
+    background-color: #1084e0;
+}
+
+QLineEdit, QSpinBox {
+    background-color: #252525;
+    color: #f0f0f0;
+    border: 1px solid #505050;
+    padding: 4px;
+    border-radius: 4px;
+}
+
+QMessageBox {
+    background-color: #2d2d2d;
+    color: #f0f0f0;
+}
+
+QListWidget {
+    background-color: #2d2d2d;
+    color: #f0f0f0;
+    border: 1px solid #505050;
+}
+
+QListWidget::item:selected {
+    background-color: #264f78;
+}
+"""
+
+
+class NotePad(QMainWindow):
+    def __init__(self, restore_session=False):
+        super().__init__()
+        # only the main window restores the last session and writes it back on close
+        self.session_enabled = restore_session
+        # top-level windows without a parent would be garbage collected without this
+        windows.append(self)
+        # the journal, auto save, memory budget and file watching are shared by all windows
+        self.scheduler = app_scheduler()
+        self.journal = self.scheduler.journal
+        self.tab_ids = self.scheduler.tab_ids
+        # live undo steps per plain text tab before the older ones are spilled to disk
+        self.undo_step_limit = UNDO_STEP_LIMIT
+        self.undo_byte_limit = UNDO_BYTE_LIMIT
+        # token colors of the current theme, set again by every dark mode toggle
+        self.token_colors = TOKEN_COLORS["dark"]
+        self.show_line_numbers = True
+        self.initUI()
+        # dark mode is the default, later windows take the theme the others have
+        self.dark_mode_action.setChecked(self.scheduler.dark_mode)
+        self.toggle_dark_mode()
+
+        # the first window offers what a crashed process left in the journal
+        if not self.scheduler.recovered:
+            self.scheduler.recovered = True
+            QTimer.singleShot(0, self.recover_documents)
 
     def initUI(self):
         self.setWindowTitle("Enhanced Notepad")
         self.resize(900, 700)
 
-        self.tab_widget = QTabWidget()
-        self.tab_widget.setTabsClosable(True)
-        self.tab_widget.tabCloseRequested.connect(self.close_tab)
-        self.setCentralWidget(self.tab_widget)
+        self.tab_widget = QTabWidget()
+        self.tab_widget.setTabsClosable(True)
+        self.tab_widget.tabCloseRequested.connect(self.close_tab)
+        self.tab_widget.currentChanged.connect(self.on_current_tab_changed)
+
+        self.find_bar = FindBar()
+        self.find_bar.hide()
+        self.find_bar.search_edit.returnPressed.connect(self.find_next)
+        self.find_bar.next_button.clicked.connect(self.find_next)
+        self.find_bar.previous_button.clicked.connect(self.find_previous)
+        self.find_bar.close_button.clicked.connect(self.close_find_bar)
+        self.find_bar.replace_edit.returnPressed.connect(self.replace_next)
+        self.find_bar.replace_button.clicked.connect(self.replace_next)
+        self.find_bar.replace_all_button.clicked.connect(self.replace_all)
+        QShortcut(QKeySequence("Shift+Return"), self.find_bar.search_edit, self.find_previous, context=Qt.WidgetShortcut)
+        QShortcut(QKeySequence("Escape"), self.find_bar, self.close_find_bar, context=Qt.WidgetWithChildrenShortcut)
+
+        self.reload_bar = ReloadBar()
+        self.reload_bar.hide()
+        self.reload_bar.reload_button.clicked.connect(self.reload_file)
+        self.reload_bar.ignore_button.clicked.connect(self.ignore_disk_change)
+        self.tab_widget.currentChanged.connect(self.update_reload_bar)
+
+        self.find_in_files_panel = FindInFilesPanel(self)
+        self.find_in_files_panel.hide()
+        self.find_in_files_panel.search_edit.returnPressed.connect(self.start_file_search)
+        self.find_in_files_panel.search_button.clicked.connect(self.toggle_file_search)
+        self.find_in_files_panel.browse_button.clicked.connect(self.choose_search_folder)
+        self.find_in_files_panel.results.itemActivated.connect(self.on_file_result_activated)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.find_in_files_panel)
+        self.file_search_cancel = None
+
+        central = QWidget()
+        central_layout = QVBoxLayout(central)
+        central_layout.setContentsMargins(0, 0, 0, 0)
+        central_layout.setSpacing(0)
+        central_layout.addWidget(self.tab_widget)
+        central_layout.addWidget(self.reload_bar)
+        central_layout.addWidget(self.find_bar)
+        self.setCentralWidget(central)
+
+        self.status_bar = QStatusBar()
+        self.setStatusBar(self.status_bar)
+        self.line_col_label = QLabel("Line: 1, Column: 1")
+        self.status_bar.addPermanentWidget(self.line_col_label)
+        self.char_count_label = QLabel("Characters: 0")
+        self.status_bar.addPermanentWidget(self.char_count_label)
+        self.format_label = QLabel("")
+        self.status_bar.addPermanentWidget(self.format_label)
+        self.memory_label = QLabel("")
+        self.status_bar.addPermanentWidget(self.memory_label)
+        self.save_progress = QProgressBar()
+        self.save_progress.setMaximumWidth(120)
+        self.save_progress.hide()
+        self.status_bar.addPermanentWidget(self.save_progress)
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(120)
+        self.load_progress.hide()
+        self.status_bar.addPermanentWidget(self.load_progress)
+        self.load_cancel_button = QPushButton("Cancel")
+        self.load_cancel_button.hide()
+        self.status_bar.addPermanentWidget(self.load_cancel_button)
+
+        self.file_loader = FileLoader(self)
+        self.file_loader.loaded.connect(self.on_file_loaded)
+        self.file_loader.failed.connect(self.on_file_load_failed)
+        self.file_loader.progress.connect(self.on_file_load_progress)
+        self.file_loader.finished.connect(self.update_load_status)
+        self.load_cancel_button.clicked.connect(self.cancel_file_loads)
+        self.setAcceptDrops(True)
+
+        self.save_pipeline = SavePipeline(self)
+        self.save_pipeline.progress.connect(self.on_save_progress)
+        self.save_pipeline.saved.connect(self.on_save_finished)
+        self.save_pipeline.failed.connect(self.on_save_failed)
+        # saves submitted and not yet finished. Closing a tab or the window with saves in flight
+        # waits for them: the tabs in closing_tabs close from on_save_finished, and with
+        # closing set so does the window, without asking again once close_confirmed
+        self.saves_queued = 0
+        self.closing_tabs = []
+        self.closing = False
+        self.close_confirmed = False
+
+        # status bar refreshes are coalesced to at most one per frame
+        self.status_timer = QTimer(self)
+        self.status_timer.setSingleShot(True)
+        self.status_timer.setInterval(16)
+        self.status_timer.timeout.connect(self.refresh_status_bar)
+        self.tab_widget.currentChanged.connect(self.schedule_status_update)
+
+        # match highlighting follows the viewport, also at most once per frame
+        self.highlight_timer = QTimer(self)
+        self.highlight_timer.setSingleShot(True)
+        self.highlight_timer.setInterval(16)
+        self.highlight_timer.timeout.connect(self.highlight_matches)
+        self.tab_widget.currentChanged.connect(self.schedule_highlight)
+
+        # opt-in instrumentation, nothing is timed until the overlay is switched on
+        self.performance_overlay = PerformanceOverlay(self)
+        self.lag_timer = QTimer(self)
+        self.lag_timer.setTimerType(Qt.PreciseTimer)
+        self.lag_timer.setInterval(LAG_PROBE_INTERVAL)
+        self.lag_timer.timeout.connect(self.measure_event_loop_lag)
+        self.lag_expected = None
+
+        self.completion_popup = CompletionPopup(self)
+        self.completion_popup.accepted.connect(self.accept_completion)
+        self.tab_widget.currentChanged.connect(self.completion_popup.hide)
+
+        self.create_toolbar()
+
+        # the first tab, unless the last session brings its own
+        if not (self.session_enabled and self.restore_session()):
+            self.add_new_tab()
+        self.create_menu_bar()
+        self.show()
+
+    def create_toolbar(self):
+        toolbar = QToolBar("Toolbar")
+        self.addToolBar(toolbar)
+
+        new_action = QAction("New", self)
+        new_action.triggered.connect(lambda: self.add_new_tab())
+        toolbar.addAction(new_action)
+
+        open_action = QAction("Open", self)
+        open_action.triggered.connect(self.open_file)
+        toolbar.addAction(open_action)
+
+        save_action = QAction("Save", self)
+        save_action.triggered.connect(self.save_file)
+        toolbar.addAction(save_action)
+
+        toolbar.addSeparator()
+
+        cut_action = QAction("Cut", self)
+        cut_action.triggered.connect(self.cut)
+        toolbar.addAction(cut_action)
+
+        copy_action = QAction("Copy", self)
+        copy_action.triggered.connect(self.copy)
+        toolbar.addAction(copy_action)
+
+        paste_action = QAction("Paste", self)
+        paste_action.triggered.connect(self.paste)
+        toolbar.addAction(paste_action)
+
+    def add_new_tab(self, title="Untitled", content="", rich=False, file_path=None, text_format=None, document=None,
+                    state=None):
+        text_edit = RichTextEditor() if rich else PlainTextEditor()
+        if state is not None:
+            # another view of a document open in some window, which brings its state along
+            text_edit.state = state
+            text_edit.setDocument(state.document)
+        elif document is None:
+            text_edit.setPlainText(content)
+            text_edit.document().setModified(False)
+        else:
+            # a document built off-screen keeps its undo history and modified state
+            if not rich:
+                document.setDocumentLayout(QPlainTextDocumentLayout(document))
+            text_edit.setDocument(document)
+            document.setParent(text_edit)
+        text_edit.setProperty("file_path", file_path)  # make sure to store the file path property
+        document = text_edit.document()
+        if state is None:
+            text_edit.state = DocumentState(document)
+            # encoding, BOM and line ends of the file on disk, saves write them back unchanged
+            text_edit.text_format = text_format or TextFormat()
+            text_edit.stats = DocumentStats(document)
+            text_edit.journal_id = next(self.tab_ids)
+            # a tab with saves on the way keeps its widget
+            text_edit.saves_pending = 0
+            # plain text undo history is bounded by an UndoLog, typing is grouped a word at a time
+            text_edit.undo_log = None if rich else UndoLog(UNDO_DIR, content)
+            if text_edit.undo_log and not document.isModified():
+                text_edit.undo_log.mark_clean()
+            text_edit.typing = None
+            # what the tab last took in from its file, external changes are compared against it
+            text_edit.disk = self.capture_disk(file_path)
+            text_edit.disk_changed = False
+            text_edit.following = False
+            text_edit.reloading = False
+            # words for completion, indexed while completion is on
+            text_edit.completion = WordIndex(document) if self.scheduler.word_completion else None
+            self.connect_document(text_edit)
+            if file_path:
+                registry.register(file_path, text_edit.state)
+        # recency orders hibernation
+        text_edit.last_active = time.monotonic()
+        text_edit.highlighter = None
+        if not rich:
+            self.set_tab_lexer(text_edit, lexer_for_path(file_path))
+            text_edit.gutter = LineNumberGutter(text_edit)
+            text_edit.gutter.set_shown(self.show_line_numbers)
+        
+        # this will connect signals for the position of the cursor and the text changed
+        text_edit.cursorPositionChanged.connect(lambda: self.update_status_bar(text_edit))
+        text_edit.cursorPositionChanged.connect(lambda: self.follow_completion(text_edit))
+        text_edit.textChanged.connect(lambda: self.on_text_changed(text_edit))
+        # document signals are let go of when the view closes, the document may stay with others
+        text_edit.view_connections = [
+            document.modificationChanged.connect(lambda modified: self.on_modification_changed(text_edit, modified))
+        ]
+        text_edit.installEventFilter(self)
+        text_edit.viewport().installEventFilter(self)
+
+        index = self.tab_widget.addTab(text_edit, title)
+        self.set_tab_modified(text_edit, document.isModified())
+        if state is None:
+            self.journal_base(text_edit)
+        self.scheduler.watch_timer.start()
+        self.tab_widget.setCurrentIndex(index)
+        text_edit.setFocus()
+
+        return text_edit
+    
+    def connect_document(self, text_edit):
+        # the journal and undo log follow the document's edits through one of its views, another
+        # view takes over when that one closes
+        document = text_edit.document()
+        state = text_edit.state
+        state.owner = text_edit
+        state.connections = [
+            document.contentsChange.connect(
+                lambda position, removed, added: self.journal_edit(text_edit, position, removed, added)
+            )
+        ]
+        if isinstance(text_edit, QPlainTextEdit):
+            state.connections.append(document.contentsChange.connect(
+                lambda position, removed, added: self.log_undo_edit(text_edit, position, removed, added)
+            ))
+
+    def detach_view(self, text_edit):
+        # a closing view of a document that other views still show leaves the document, its
+        # journal entry and its undo log to them. Returns whether there were any
+        state = text_edit.state
+        for connection in text_edit.view_connections:
+            QObject.disconnect(connection)
+        text_edit.view_connections = []
+        views = [view for view in registry.views(state) if view is not text_edit]
+        if not views:
+            registry.release(state)
+            return False
+        # the first view's document belongs to its internal text control and would go with it
+        state.document.setParent(views[0])
+        if state.owner is text_edit:
+            for connection in state.connections:
+                QObject.disconnect(connection)
+            views[0].window().connect_document(views[0])
+        return True
+
+    def open_shared(self, path):
+        # another view of the file's document when some window has it open, None otherwise
+        state = registry.lookup(path)
+        if state is None:
+            # a copy hibernated in another window comes back first, there is only ever one
+            key = registry.key(path)
+            for window in windows:
+                for index in range(window.tab_widget.count()):
+                    placeholder = window.tab_widget.widget(index)
+                    if (
+                        window is not self and isinstance(placeholder, TabPlaceholder)
+                        and placeholder.record.get("cache") and placeholder.record.get("path")
+                        and registry.key(placeholder.record["path"]) == key
+                    ):
+                        current = window.tab_widget.currentWidget()
+                        if window.materialize_tab(index) is None:
+                            return None
+                        if current is not placeholder:
+                            window.tab_widget.setCurrentWidget(current)
+                        return self.open_shared(path)
+        if state is None:
+            return None
+        view = registry.views(state)[0]
+        return self.add_new_tab(
+            os.path.basename(path), rich=isinstance(view, QTextEdit), file_path=view.property("file_path"), state=state
+        )
+
+    @instrumented
+    def on_text_changed(self, text_edit):
+        self.schedule_status_update()
+
+    def on_modification_changed(self, text_edit, modified):
+        self.set_tab_modified(text_edit, modified)
+        # a save or reload makes this step the clean one, an undo or redo only arrived at it
+        log = text_edit.undo_log
+        if not modified and log and not log.replaying:
+            log.mark_clean()
+        if not modified:
+            self.journal_base(text_edit)
+
+    def set_tab_modified(self, text_edit, modified):
+        index = self.tab_widget.indexOf(text_edit)
+        if index == -1:
+            return
+        current_tab_text = self.tab_widget.tabText(index)
+        if modified and not current_tab_text.endswith("*"):
+            self.tab_widget.setTabText(index, current_tab_text + "*")
+        elif not modified and current_tab_text.endswith("*"):
+            self.tab_widget.setTabText(index, current_tab_text[:-1])
+
+    def journal_base(self, text_edit):
+        # a clean tab backed by a file only needs a reference to it, anything else is snapshotted
+        index = self.tab_widget.indexOf(text_edit)
+        title = self.tab_widget.tabText(index).rstrip("*")
+        file_path = text_edit.property("file_path")
+        modified = text_edit.document().isModified()
+        if file_path and not modified and os.path.exists(file_path):
+            self.journal.set_base(text_edit.journal_id, title, file_path)
+        else:
+            self.journal.set_base(text_edit.journal_id, title, file_path, document_text(text_edit.document()), dirty=modified)
+
+    @instrumented
+    def journal_edit(self, text_edit, position, removed, added):
+        document = text_edit.document()
+        added = max(0, min(added, document.characterCount() - 1 - position))
+        self.journal.record_edit(text_edit.journal_id, position, removed, text_range(document, position, position + added))
+
+    @instrumented
+    def log_undo_edit(self, text_edit, position, removed, added):
+        log = text_edit.undo_log
+        if log is None or log.replaying:
+            return
+        document = text_edit.document()
+        added = max(0, min(added, document.characterCount() - 1 - position))
+        log.record(position, removed, text_range(document, position, position + added), document.availableUndoSteps())
+        # a typed word is spilled once the next keystroke starts a new step, see type_text
+        if not log.typing and log.over_limit(self.undo_step_limit, self.undo_byte_limit):
+            self.spill_undo(text_edit)
+
+    def spill_undo(self, text_edit):
+        # Qt can only drop its whole undo stack, so all live steps go to disk together
+        log = text_edit.undo_log
+        document = text_edit.document()
+        try:
+            log.spill(document_text(text_edit.document()))
+        except OSError as e:
+            # without a place for old steps the tab falls back to Qt's unbounded stack
+            log.discard()
+            text_edit.undo_log = None
+            self.status_bar.showMessage(f"Could not spill undo history: {e}", 5000)
+            return
+        modified = document.isModified()
+        document.blockSignals(True)
+        document.clearUndoRedoStacks()
+        # the clean state is remembered as a stack position, which the cleared stack no longer has
+        document.setModified(not modified)
+        document.setModified(modified)
+        document.blockSignals(False)
+        log.commands = document.availableUndoSteps()
+
+    def type_text(self, text_edit, event):
+        # each keystroke runs in an edit block that joins the previous one while the same word
+        # continues where the last key left off, so typing is undone a word at a time
+        document = text_edit.document()
+        cursor = text_edit.textCursor()
+        text = typed_text(event)
+        previous = text_edit.typing
+        joining = (
+            previous is not None and previous[:2] == (document.revision(), cursor.position())
+            and not cursor.hasSelection() and not starts_word(previous[2], text[0])
+        )
+        log = text_edit.undo_log
+        if log and not joining and log.over_limit(self.undo_step_limit, self.undo_byte_limit):
+            # the word typed so far is a closed step now, the history can go to disk without it
+            self.spill_undo(text_edit)
+            log = text_edit.undo_log
+        if joining:
+            cursor.joinPreviousEditBlock()
+        else:
+            cursor.beginEditBlock()
+        if log:
+            log.joining = joining
+            log.typing = True
+        if event.matches(QKeySequence.InsertLineSeparator):
+            # Shift+Enter would insert a U+2028 line separator, which toRawText keeps and the file
+            # would get instead of a line end
+            event = QKeyEvent(QEvent.KeyPress, event.key(), event.modifiers() & ~Qt.ShiftModifier, event.text())
+        try:
+            text_edit.keyPressEvent(event)
+        finally:
+            cursor.endEditBlock()
+            if log:
+                log.joining = log.typing = False
+        text_edit.typing = (document.revision(), text_edit.textCursor().position(), text[-1])
+
+    def undo_edit(self, text_edit):
+        log = text_edit.undo_log
+        if log is None or not (log.done or log.segments):
+            text_edit.undo()
+        elif log.done:
+            self.replay_undo_step(text_edit, text_edit.undo, log.undo)
+        else:
+            self.restore_undo_segment(text_edit)
+
+    def redo_edit(self, text_edit):
+        log = text_edit.undo_log
+        if log is None or not log.redone:
+            text_edit.redo()
+        else:
+            self.replay_undo_step(text_edit, text_edit.redo, log.redo)
+
+    def replay_undo_step(self, text_edit, action, log_action):
+        log = text_edit.undo_log
+        log.replaying = True
+        try:
+            action()
+        finally:
+            log.replaying = False
+        log_action()
+        log.commands = text_edit.document().availableUndoSteps()
+
+    def restore_undo_segment(self, text_edit):
+        # the live stack is used up: the newest spilled segment is replayed into a fresh document
+        # that replaces the editor's, then undone by one step
+        log = text_edit.undo_log
+        text = document_text(text_edit.document())
+        try:
+            base, done, redone = log.restore()
+        except (OSError, ValueError) as e:
+            document = None
+            self.status_bar.showMessage(f"Could not load older undo history: {e}", 5000)
+        else:
+            document = rebuild_document(base, done, redone, text, log.clean_step())
+            if document is None:
+                self.status_bar.showMessage("Older undo history no longer matches the document", 5000)
+        if document is None:
+            log.discard()
+            log.reset(text)
+            if not text_edit.document().isModified():
+                log.mark_clean()
+            log.commands = text_edit.document().availableUndoSteps()
+            return
+        position = done[-1][0][0] if done else 0
+        if done:
+            document.undo()
+            log.undo()
+        log.commands = document.availableUndoSteps()
+        others = [view for view in registry.views(text_edit.state) if view is not text_edit]
+        text_edit = self.replace_editor(text_edit, document)
+        # views in other windows move over to the rebuilt document as well
+        for view in others:
+            view.window().replace_editor(view, document, text_edit.state)
+        cursor = text_edit.textCursor()
+        cursor.setPosition(min(position, document.characterCount() - 1))
+        text_edit.setTextCursor(cursor)
+
+    def replace_editor(self, old_edit, document, state=None):
+        # a plain text tab takes over a document built off-screen, keeping its place and settings.
+        # With a state the document is already another view's and comes with its state
+        index = self.tab_widget.indexOf(old_edit)
+        title = self.tab_widget.tabText(index).rstrip("*")
+        current = self.tab_widget.currentWidget()
+        self.tab_widget.blockSignals(True)
+        self.tab_widget.removeTab(index)
+        self.tab_widget.blockSignals(False)
+        if state is None:
+            self.journal.close_tab(old_edit.journal_id)
+            registry.release(old_edit.state)
+        text_edit = self.add_new_tab(
+            title, file_path=old_edit.property("file_path"), text_format=old_edit.text_format, document=document,
+            state=state
+        )
+        self.tab_widget.tabBar().moveTab(self.tab_widget.indexOf(text_edit), index)
+        self.tab_widget.setCurrentWidget(text_edit if current is old_edit else current)
+        if state is None:
+            text_edit.undo_log = old_edit.undo_log
+            text_edit.disk, text_edit.disk_changed = old_edit.disk, old_edit.disk_changed
+            text_edit.following = old_edit.following
+        else:
+            cursor = text_edit.textCursor()
+            cursor.setPosition(min(old_edit.textCursor().position(), document.characterCount() - 1))
+            text_edit.setTextCursor(cursor)
+        self.set_tab_lexer(text_edit, self.tab_lexer(old_edit))
+        self.release_editor(old_edit)
+        text_edit.setFont(old_edit.font())
+        text_edit.setLineWrapMode(old_edit.lineWrapMode())
+        old_edit.deleteLater()
+        return text_edit
+
+    def tab_lexer(self, text_edit):
+        return text_edit.highlighter.lexer if text_edit.highlighter else PLAIN_TEXT
+
+    def set_tab_lexer(self, text_edit, lexer):
+        # plain text tabs only, rich text keeps the formatting it was given
+        if lexer is None or lexer is PLAIN_TEXT:
+            if text_edit.highlighter:
+                text_edit.highlighter.clear()
+                text_edit.highlighter.deleteLater()
+                text_edit.highlighter = None
+        elif text_edit.highlighter:
+            text_edit.highlighter.set_lexer(lexer)
+        else:
+            text_edit.highlighter = ViewportHighlighter(text_edit, lexer, self.token_colors)
+
+    def choose_syntax(self, action):
+        text_edit = self.get_current_text_edit()
+        if isinstance(text_edit, QPlainTextEdit):
+            self.set_tab_lexer(text_edit, lexer_named(action.text()))
+
+    def release_editor(self, text_edit):
+        # a match index or lexer still running must not report back to an editor on its way out
+        if hasattr(text_edit, "search"):
+            text_edit.search.reset()
+        if text_edit.highlighter:
+            text_edit.highlighter.stop()
 
-        self.status_bar = QStatusBar()
-        self.setStatusBar(self.status_bar)
-        self.line_col_label = QLabel("Line: 1, Column: 1")
-        self.status_bar.addPermanentWidget(self.line_col_label)
-        self.char_count_label = QLabel("Characters: 0")
-        self.status_bar.addPermanentWidget(self.char_count_label)
+    def capture_disk(self, file_path):
+        if not file_path:
+            return None
+        try:
+            return DiskState.capture(file_path)
+        except OSError:
+            return None
 
-        self.create_toolbar()
+    @instrumented
+    def check_disk(self, text_edit):
+        # the tab's own saves update its DiskState when they land, any other change came from
+        # outside. Following tabs take appends in, everything else is offered as a reload
+        disk = text_edit.disk
+        if disk is None or text_edit.saves_pending or text_edit.reloading or not disk.changed():
+            return
+        try:
+            appended = text_edit.following and disk.appended()
+        except OSError:
+            appended = False
+        if appended:
+            self.follow_file(text_edit)
+        else:
+            text_edit.disk_changed = True
+            self.update_reload_bar()
 
-        # the first tab        
-        self.add_new_tab()
-        self.create_menu_bar()
-        self.show()
+    def follow_file(self, text_edit):
+        # only the bytes written past the known end are read, a chunk at a time, so a burst of
+        # output never blocks the window for long
+        path = text_edit.property("file_path")
+        try:
+            text, more = text_edit.disk.read_appended(text_edit.text_format)
+        except OSError as e:
+            self.status_bar.showMessage(f"Could not follow {path}: {e}", 5000)
+            return
+        document = text_edit.document()
+        modified = document.isModified()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        if not modified:
+            document.setModified(False)
+        for view in registry.views(text_edit.state):
+            scroll_bar = view.verticalScrollBar()
+            scroll_bar.setValue(scroll_bar.maximum())
+        if more:
+            self.scheduler.on_file_changed(path)
 
-    def create_toolbar(self):
-        toolbar = QToolBar("Toolbar")
-        self.addToolBar(toolbar)
+    def reload_file(self):
+        text_edit = self.get_current_text_edit()
+        if text_edit and text_edit.disk and not text_edit.reloading:
+            self.reload_tab(text_edit)
 
-        new_action = QAction("New", self)
-        new_action.triggered.connect(lambda: self.add_new_tab())
-        toolbar.addAction(new_action)
+    def reload_tab(self, text_edit):
+        # the file is read and compared in the background, then only the regions that differ are
+        # patched in as one undo step, so cursor, scroll position and undo history stay put
+        path = text_edit.property("file_path")
+        revision = text_edit.document().revision()
+        text_edit.reloading = True
+        text_edit.disk_changed = False
+        self.update_reload_bar()
+        self.status_bar.showMessage(f"Reloading {os.path.basename(path)}...")
+        worker = Worker(load_changes, path, document_text(text_edit.document()))
+        worker.signals.result.connect(lambda result: self.on_reload_loaded(text_edit, revision, result))
+        worker.signals.error.connect(lambda error: self.on_reload_failed(text_edit, path, error))
+        worker.start()
 
-        open_action = QAction("Open", self)
-        open_action.triggered.connect(self.open_file)
-        toolbar.addAction(open_action)
+    @instrumented
+    def on_reload_loaded(self, text_edit, revision, result):
+        text_edit.reloading = False
+        if self.tab_widget.indexOf(text_edit) == -1:
+            return
+        document = text_edit.document()
+        if document.revision() != revision:
+            # edited during the read, the regions no longer line up with the document
+            self.reload_tab(text_edit)
+            return
+        text_format, regions, disk = result
+        scroll_bar = text_edit.verticalScrollBar()
+        scroll = scroll_bar.maximum() if text_edit.following else scroll_bar.value()
+        patch_document(document, regions)
+        document.setModified(False)
+        text_edit.text_format = text_format
+        text_edit.disk = disk
+        scroll_bar.setValue(scroll_bar.maximum() if text_edit.following else scroll)
+        self.schedule_status_update()
+        self.status_bar.showMessage(f"Reloaded {os.path.basename(disk.path)}, {len(regions)} changed region(s)", 2000)
+        # the file may have changed again while it was read
+        self.check_disk(text_edit)
 
-        save_action = QAction("Save", self)
-        save_action.triggered.connect(self.save_file)
-        toolbar.addAction(save_action)
+    def on_reload_failed(self, text_edit, path, error):
+        text_edit.reloading = False
+        self.status_bar.clearMessage()
+        QMessageBox.warning(self, "Reload", f"Could not reload {path}:\n{error}")
 
-        toolbar.addSeparator()
+    def compare_with_saved(self):
+        text_edit = self.get_current_text_edit()
+        path = text_edit.property("file_path") if text_edit else None
+        if not path or not os.path.exists(path):
+            self.status_bar.showMessage("The tab has no saved file to compare with", 3000)
+            return
+        name = os.path.basename(path)
+        self.show_comparison(
+            f"{name} (saved)", f"{name} (editor)", compare_with_file, document_text(text_edit.document()), path
+        )
 
-        cut_action = QAction("Cut", self)
-        cut_action.triggered.connect(self.cut)
-        toolbar.addAction(cut_action)
+    def compare_with_tab(self):
+        text_edit = self.get_current_text_edit()
+        if not text_edit:
+            return
+        # loaded text tabs only, hibernated and large file tabs have no text in memory
+        others = [
+            widget for widget in map(self.tab_widget.widget, range(self.tab_widget.count()))
+            if isinstance(widget, TEXT_EDITORS) and widget is not text_edit
+        ]
+        if not others:
+            self.status_bar.showMessage("There is no other open tab to compare with", 3000)
+            return
+        titles = [self.tab_widget.tabText(self.tab_widget.indexOf(widget)).rstrip("*") for widget in others]
+        title, ok = QInputDialog.getItem(self, "Compare with Tab", "Compare with:", titles, 0, False)
+        if ok:
+            other = others[titles.index(title)]
+            self.show_comparison(
+                self.tab_widget.tabText(self.tab_widget.currentIndex()).rstrip("*"), title,
+                compare_texts, document_text(text_edit.document()), document_text(other.document())
+            )
 
-        copy_action = QAction("Copy", self)
-        copy_action.triggered.connect(self.copy)
-        toolbar.addAction(copy_action)
+    def show_comparison(self, left_title, right_title, fn, *args):
+        # only the text snapshots are taken here, the diff runs in a worker process
+        view = CompareView(self, left_title, right_title)
+        view.show()
+        worker = Worker(fn, *args)
+        worker.signals.result.connect(view.show_result)
+        worker.signals.error.connect(view.show_error)
+        worker.start()
+        return view
 
-        paste_action = QAction("Paste", self)
-        paste_action.triggered.connect(self.paste)
-        toolbar.addAction(paste_action)
+    def ignore_disk_change(self):
+        text_edit = self.get_current_text_edit()
+        if text_edit and text_edit.disk:
+            text_edit.disk.acknowledge()
+            text_edit.disk_changed = False
+        self.update_reload_bar()
 
-    def add_new_tab(self, title="Untitled", content=""):
-        text_edit = QTextEdit()
-        text_edit.setText(content)
-        text_edit.setProperty("file_path", None)  # make sure to store the file path property
-        
-        # this will connect signals for the position of the cursor and the text changed
-        text_edit.cursorPositionChanged.connect(lambda: self.update_status_bar(text_edit))
-        text_edit.textChanged.connect(lambda: self.on_text_changed(text_edit))
+    def update_reload_bar(self):
+        text_edit = self.get_current_text_edit()
+        if not (text_edit and text_edit.disk_changed):
+            self.reload_bar.hide()
+            return
+        path = text_edit.property("file_path")
+        self.reload_bar.set_file(path, os.path.exists(path))
+        self.reload_bar.show()
 
-        index = self.tab_widget.addTab(text_edit, title)
-        self.tab_widget.setCurrentIndex(index)
-        text_edit.setFocus()
+    def toggle_follow(self, enabled):
+        # like tail -f, what other programs append to the file shows up at the end of the tab
+        text_edit = self.get_current_text_edit()
+        if not text_edit or not text_edit.disk:
+            self.follow_action.setChecked(False)
+            self.status_bar.showMessage("Only tabs opened from a file can follow it", 3000)
+            return
+        if enabled and text_edit.text_format.compression:
+            # appends to a compressed file can't be read on their own, changes offer a reload
+            self.follow_action.setChecked(False)
+            self.status_bar.showMessage("Compressed files can't be followed", 3000)
+            return
+        text_edit.following = enabled
+        if enabled:
+            scroll_bar = text_edit.verticalScrollBar()
+            scroll_bar.setValue(scroll_bar.maximum())
+            self.check_disk(text_edit)
 
-        return text_edit
-    
-    def on_text_changed(self, text_edit):
-        self.document_modified = True
-        char_count = len(text_edit.toPlainText())
-        self.char_count_label.setText(f"Characters: {char_count}")
-        
-        current_index = self.tab_widget.currentIndex()
-        current_tab_text = self.tab_widget.tabText(current_index)
-        if not current_tab_text.endswith("*") and text_edit.property("file_path"):
-            self.tab_widget.setTabText(current_index, current_tab_text + "*")
+    def recover_documents(self):
+        # a journal is only deleted once its documents are restored or the user discarded them,
+        # one that can't be read stays for a later launch
+        recovered = {}
+        for path in find_orphans(RECOVERY_DIR):
+            try:
+                documents = replay(path, read_text)
+            except (OSError, ValueError, KeyError):
+                continue
+            if documents:
+                recovered[path] = documents
+            else:
+                os.unlink(path)
+        documents = [document for documents in recovered.values() for document in documents]
+        if documents:
+            ret = QMessageBox.question(
+                self, "Recover",
+                f"{len(documents)} unsaved document(s) from a previous session can be recovered. Restore them?"
+            )
+            if ret == QMessageBox.Yes:
+                for document in documents:
+                    self.restore_document(document)
+            else:
+                ret = QMessageBox.question(
+                    self, "Recover",
+                    "Discard them? Otherwise they are offered again the next time Notepad starts.",
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+                )
+            if ret == QMessageBox.Yes:
+                for path in recovered:
+                    os.unlink(path)
+        remove_stale_caches(HIBERNATION_DIR)
+        remove_stale_caches(UNDO_DIR)
+        remove_stale_caches(DECOMPRESSED_DIR)
+
+    def restore_document(self, recovered):
+        text_edit = self.add_new_tab(recovered["title"], recovered["text"], file_path=recovered["path"])
+        document = text_edit.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        for position, removed, added in recovered["deltas"]:
+            end = document.characterCount() - 1
+            cursor.setPosition(min(position, end))
+            cursor.setPosition(min(position + removed, end), QTextCursor.KeepAnchor)
+            cursor.insertText(added)
+        cursor.endEditBlock()
+        document.setModified(True)
+        self.journal_base(text_edit)
 
+    @instrumented
     def update_status_bar(self, text_edit):
-        cursor = text_edit.textCursor()
-        line = cursor.blockNumber() + 1
-        col = cursor.columnNumber() + 1
-        self.line_col_label.setText(f"Line: {line}, Column: {col}")
+        self.schedule_status_update()
+
+    def schedule_status_update(self):
+        if not self.status_timer.isActive():
+            self.status_timer.start()
+
+    @instrumented
+    def refresh_status_bar(self):
+        view = self.get_current_large_view()
+        text_edit = self.get_current_text_edit()
+        self.follow_action.setChecked(bool(text_edit and text_edit.following))
+        plain = isinstance(text_edit, QPlainTextEdit)
+        self.syntax_menu.setEnabled(plain)
+        if plain:
+            self.syntax_actions[self.tab_lexer(text_edit).name].setChecked(True)
+        if view:
+            self.update_large_file_status(view)
+            return
+
+        if text_edit:
+            cursor = text_edit.textCursor()
+            line = cursor.blockNumber() + 1
+            col = cursor.columnNumber() + 1
+            self.line_col_label.setText(f"Line: {line}, Column: {col}")
+            self.format_label.setText(text_edit.text_format.describe())
+            stats = text_edit.stats
+            self.char_count_label.setText(
+                f"Characters: {stats.characters()}, Words: {stats.words}, Lines: {stats.lines()}"
+            )
 
     def close_tab(self, index):
         text_edit = self.tab_widget.widget(index)
-        if isinstance(text_edit, QTextEdit) and self.document_modified:
+        if isinstance(text_edit, TabPlaceholder) and text_edit.record.get("modified"):
+            # unsaved session buffers get the same prompt as any other modified tab
+            placeholder = text_edit
+            text_edit = self.materialize_tab(index)
+            if text_edit is None:
+                if not self.discard_unrestored(placeholder):
+                    return
+                text_edit = placeholder
+        # a document that stays open in another window is not lost with this view
+        shared = isinstance(text_edit, TEXT_EDITORS) and len(registry.views(text_edit.state)) > 1
+        if isinstance(text_edit, TEXT_EDITORS) and not shared and text_edit.document().isModified():
             msg_box = QMessageBox()
             msg_box.setIcon(QMessageBox.Question)
             msg_box.setText("The document has been modified.")
@@ -120,16 +2615,299 @@ class NotePad(QMainWindow):
             if ret == QMessageBox.Save:
                 self.tab_widget.setCurrentIndex(index)
                 self.save_file()
+                if text_edit.saves_pending:
+                    # the tab stays, read-only, until the save lands and finish_closes removes it
+                    text_edit.setReadOnly(True)
+                    self.closing_tabs.append(text_edit)
+                    return
+                # keep the tab open if the save was cancelled
+                if text_edit.document().isModified():
+                    return
             elif ret == QMessageBox.Cancel:
                 return
-        
+        self.remove_tab(text_edit)
+
+    def discard_unrestored(self, placeholder):
+        # a tab whose unsaved text can't be read back only goes away when the user says so
+        title = placeholder.record.get("title") or "Untitled"
+        ret = QMessageBox.question(
+            self, "Close", f"'{title}' could not be restored. Close it and lose its unsaved changes?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        return ret == QMessageBox.Yes
+
+    def remove_tab(self, text_edit):
+        if isinstance(text_edit, LargeFileView):
+            text_edit.large_file.close()
+        elif isinstance(text_edit, TEXT_EDITORS):
+            self.release_editor(text_edit)
+            if not self.detach_view(text_edit):
+                self.journal.close_tab(text_edit.journal_id)
+                if text_edit.undo_log:
+                    text_edit.undo_log.discard()
+        elif isinstance(text_edit, TabPlaceholder) and text_edit.record.get("cache"):
+            self.journal.close_tab(text_edit.record["journal_id"])
+            remove_cache(text_edit.record["cache"])
+            if text_edit.undo_log:
+                text_edit.undo_log.discard()
+        index = self.tab_widget.indexOf(text_edit)
         self.tab_widget.removeTab(index)
+        self.scheduler.watch_timer.start()
         if self.tab_widget.count() == 0:
             self.add_new_tab()
 
+    def restore_session(self):
+        # tabs come back as placeholders, files are only read when a tab is first shown
+        session = load_session(SESSION_DIR)
+        if not session or not session["tabs"]:
+            return False
+        self.tab_widget.blockSignals(True)
+        for record in session["tabs"]:
+            title = record.get("title") or "Untitled"
+            self.tab_widget.addTab(TabPlaceholder(record), title + ("*" if record.get("modified") else ""))
+        self.tab_widget.setCurrentIndex(min(max(session.get("current", 0), 0), self.tab_widget.count() - 1))
+        self.tab_widget.blockSignals(False)
+        # even the current tab is built after the window is up
+        QTimer.singleShot(0, lambda: self.on_current_tab_changed(self.tab_widget.currentIndex()))
+        return True
+
+    def on_current_tab_changed(self, index):
+        widget = self.tab_widget.widget(index)
+        if isinstance(widget, TabPlaceholder):
+            widget = self.materialize_tab(index)
+        if isinstance(widget, TEXT_EDITORS):
+            widget.last_active = time.monotonic()
+        QTimer.singleShot(0, enforce_memory_budget)
+
+    @instrumented
+    def materialize_tab(self, index):
+        placeholder = self.tab_widget.widget(index)
+        record = placeholder.record
+        title = record.get("title") or "Untitled"
+        path = record.get("path")
+        # the placeholder keeps its record, cache and undo history until the new tab exists
+        try:
+            text_format = TextFormat.from_dict(record["format"]) if record.get("format") else None
+            if record.get("cache"):
+                widget = self.rehydrate_tab(title, placeholder, text_format)
+            elif record.get("buffer"):
+                widget = self.add_new_tab(
+                    title, read_buffer(SESSION_DIR, record["buffer"]), rich=record.get("rich", False),
+                    file_path=path, text_format=text_format
+                )
+            elif path and record.get("rich"):
+                text, text_format = decode_file(path)
+                widget = self.add_new_tab(title, text, rich=True, file_path=path, text_format=text_format)
+            elif path:
+                widget = self.open_path(path)
+            else:
+                widget = self.add_new_tab(title, rich=record.get("rich", False))
+        except (OSError, ValueError) as e:
+            message = f"Could not restore {path or title}: {e}"
+            self.status_bar.showMessage(message, 5000)
+            placeholder.show_error(message)
+            return None
+        self.tab_widget.tabBar().moveTab(self.tab_widget.indexOf(widget), index)
+        self.tab_widget.blockSignals(True)
+        self.tab_widget.removeTab(self.tab_widget.indexOf(placeholder))
+        self.tab_widget.blockSignals(False)
+        placeholder.deleteLater()
+        self.tab_widget.setCurrentWidget(widget)
+        self.apply_tab_state(widget, record)
+        return widget
+
+    def apply_tab_state(self, widget, record):
+        if isinstance(widget, LargeFileView):
+            widget.go_to_line(min(record.get("cursor", 0), widget.large_file.line_count() - 1))
+            return
+        if record.get("zoom"):
+            font = widget.font()
+            font.setPointSize(record["zoom"])
+            widget.setFont(font)
+        if record.get("modified"):
+            widget.document().setModified(True)
+            self.journal_base(widget)
+        cursor = widget.textCursor()
+        cursor.setPosition(min(record.get("cursor", 0), widget.document().characterCount() - 1))
+        widget.setTextCursor(cursor)
+        widget.verticalScrollBar().setValue(record.get("scroll", 0))
+        if record.get("syntax") and not record.get("rich"):
+            self.set_tab_lexer(widget, lexer_named(record["syntax"]))
+        if record.get("follow") and widget.disk and not widget.text_format.compression:
+            widget.following = True
+            widget.verticalScrollBar().setValue(widget.verticalScrollBar().maximum())
+
+    def can_hibernate(self, widget):
+        # following or reloading tabs keep taking in their file, and a document shown in
+        # another window stays loaded for it
+        return (
+            widget is not self.tab_widget.currentWidget() and not widget.saves_pending
+            and not widget.following and not widget.reloading and len(registry.views(widget.state)) == 1
+        )
+
+    def hibernate_tab(self, widget):
+        # the document goes to a compressed cache file and a placeholder takes over the tab. Its
+        # journal entry stays open so a crash still recovers the text, and the undo history of
+        # plain text tabs is spilled to the tab's UndoLog, to be replayed when the tab comes back
+        index = self.tab_widget.indexOf(widget)
+        document = widget.document()
+        record = {
+            "title": self.tab_widget.tabText(index).rstrip("*"),
+            "path": widget.property("file_path"),
+            "rich": isinstance(widget, QTextEdit),
+            "cursor": widget.textCursor().position(),
+            "scroll": widget.verticalScrollBar().value(),
+            "zoom": widget.font().pointSize(),
+            "format": widget.text_format.to_dict(),
+            "modified": document.isModified(),
+            "journal_id": widget.journal_id,
+        }
+        if not record["rich"]:
+            record["syntax"] = self.tab_lexer(widget).name
+        state = {"text": document_text(widget.document())}
+        if record["rich"]:
+            state["html"] = widget.toHtml()
+        try:
+            record["cache"] = write_cache(HIBERNATION_DIR, state)
+        except OSError:
+            return False
+        log = widget.undo_log
+        if log and (log.done or log.redone):
+            try:
+                log.spill()
+            except OSError:
+                remove_cache(record["cache"])
+                return False
+        elif log:
+            log.anchor = None
+        self.release_editor(widget)
+        registry.release(widget.state)
+        title = self.tab_widget.tabText(index)
+        self.tab_widget.blockSignals(True)
+        self.tab_widget.removeTab(index)
+        self.tab_widget.insertTab(index, TabPlaceholder(record, log, widget.disk), title)
+        self.tab_widget.blockSignals(False)
+        widget.deleteLater()
+        self.scheduler.watch_timer.start()
+        return True
+
+    def rehydrate_tab(self, title, placeholder, text_format):
+        record = placeholder.record
+        log = placeholder.undo_log
+        state = read_cache(record["cache"])
+        text = state["text"]
+        # the document is rebuilt before it has a layout or listeners, replaying thousands
+        # of edits into a live editor would relayout and journal every one of them
+        document = None
+        if "html" in state:
+            document = QTextDocument()
+            document.setHtml(state["html"])
+        elif log and log.segments:
+            try:
+                base, done, redone = log.restore()
+                # the replay puts the clean point back where it was, undoing to the saved text
+                # clears the tab's modified mark again
+                document = rebuild_document(base, done, redone, text, log.clean_step())
+            except (OSError, ValueError):
+                document = None
+            if document is None:
+                log.discard()
+                log.reset(text)
+                if not record.get("modified"):
+                    log.mark_clean()
+        if document is None:
+            document = QTextDocument()
+            document.setPlainText(text)
+            document.setModified(bool(record.get("modified")))
+        if log and log.anchor is None:
+            log.reset(text)
+        widget = self.add_new_tab(
+            title, rich=record.get("rich", False), file_path=record.get("path"), text_format=text_format,
+            document=document
+        )
+        if log:
+            widget.undo_log = log
+            log.commands = document.availableUndoSteps()
+        if placeholder.disk:
+            # the file may have changed while the tab was hibernated
+            widget.disk = placeholder.disk
+            self.check_disk(widget)
+        # the new tab has its own journal entry by now
+        self.journal.close_tab(record["journal_id"])
+        remove_cache(record["cache"])
+        return widget
+
+    def update_memory_status(self, used):
+        megabyte = 1024 * 1024
+        hibernated = sum(
+            isinstance(widget, TabPlaceholder) and "cache" in widget.record
+            for widget in map(self.tab_widget.widget, range(self.tab_widget.count()))
+        )
+        text = f"Memory: {used / megabyte:.0f} / {MEMORY_BUDGET / megabyte:.0f} MB"
+        rss = process_memory()
+        if rss:
+            text += f" (RSS {rss / megabyte:.0f} MB)"
+        if hibernated:
+            text += f", {hibernated} hibernated"
+        self.memory_label.setText(text)
+
+    def session_record(self, index, buffers):
+        widget = self.tab_widget.widget(index)
+        if isinstance(widget, TabPlaceholder) and widget.record.get("cache"):
+            # the hibernation cache goes away with the process, the session keeps a buffer instead
+            record = {key: value for key, value in widget.record.items() if key not in ("cache", "journal_id")}
+            text = read_cache(widget.record["cache"])["text"]
+            if record["modified"] or (not record["path"] and text):
+                record["buffer"] = new_buffer_name()
+                buffers[record["buffer"]] = text
+            return record
+        if isinstance(widget, TabPlaceholder):
+            return widget.record
+        record = {
+            "title": self.tab_widget.tabText(index).rstrip("*"),
+            "path": widget.property("file_path"),
+            "scroll": widget.verticalScrollBar().value(),
+        }
+        if isinstance(widget, LargeFileView):
+            record["cursor"] = widget.current_line
+            return record
+        record["rich"] = isinstance(widget, QTextEdit)
+        record["cursor"] = widget.textCursor().position()
+        record["zoom"] = widget.font().pointSize()
+        record["format"] = widget.text_format.to_dict()
+        if not record["rich"]:
+            record["syntax"] = self.tab_lexer(widget).name
+        if widget.following:
+            record["follow"] = True
+        # unsaved text, or an Untitled tab with content, goes to a buffer file next to the session
+        if widget.document().isModified() or (not record["path"] and not widget.document().isEmpty()):
+            record["modified"] = widget.document().isModified()
+            record["buffer"] = new_buffer_name()
+            buffers[record["buffer"]] = document_text(widget.document())
+        return record
+
+    def save_session(self):
+        buffers = {}
+        try:
+            session = {
+                "current": self.tab_widget.currentIndex(),
+                "tabs": [self.session_record(i, buffers) for i in range(self.tab_widget.count())],
+            }
+            save_session(SESSION_DIR, session, buffers)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Session", f"Could not save the session:\n{e}")
+            return False
+        return True
+
     def get_current_text_edit(self):
         widget = self.tab_widget.currentWidget()
-        if isinstance(widget, QTextEdit):
+        if isinstance(widget, TEXT_EDITORS):
+            return widget
+        return None
+
+    def get_current_large_view(self):
+        widget = self.tab_widget.currentWidget()
+        if isinstance(widget, LargeFileView):
             return widget
         return None
 
@@ -149,6 +2927,10 @@ class NotePad(QMainWindow):
         new_tab_action.triggered.connect(lambda: self.add_new_tab())
         file_menu.addAction(new_tab_action)
 
+        new_rich_tab_action = QAction("New Rich Text Tab", self)
+        new_rich_tab_action.triggered.connect(lambda: self.add_new_tab(rich=True))
+        file_menu.addAction(new_rich_tab_action)
+
         open_file_action = QAction("Open...", self)
         open_file_action.setShortcut("Ctrl+O")
         open_file_action.triggered.connect(self.open_file)
@@ -163,6 +2945,18 @@ class NotePad(QMainWindow):
         save_as_file_action.setShortcut("Ctrl+Shift+S")
         save_as_file_action.triggered.connect(self.save_as_file)
         file_menu.addAction(save_as_file_action)
+
+        reload_action = QAction("Reload from Disk", self)
+        reload_action.triggered.connect(self.reload_file)
+        file_menu.addAction(reload_action)
+
+        compare_saved_action = QAction("Compare with Saved", self)
+        compare_saved_action.triggered.connect(self.compare_with_saved)
+        file_menu.addAction(compare_saved_action)
+
+        compare_tab_action = QAction("Compare with Tab...", self)
+        compare_tab_action.triggered.connect(self.compare_with_tab)
+        file_menu.addAction(compare_tab_action)
         
         file_menu.addSeparator()
         
@@ -184,6 +2978,10 @@ class NotePad(QMainWindow):
         redo_action.triggered.connect(self.redo)
         edit_menu.addAction(redo_action)
 
+        undo_limits_action = QAction("Undo History Limits...", self)
+        undo_limits_action.triggered.connect(self.set_undo_limits)
+        edit_menu.addAction(undo_limits_action)
+
         edit_menu.addSeparator()
 
         cut_action = QAction("Cut", self)
@@ -217,14 +3015,51 @@ class NotePad(QMainWindow):
         find_next_action.setShortcut("F3")
         find_next_action.triggered.connect(self.find_next)
         edit_menu.addAction(find_next_action)
+
+        find_previous_action = QAction("Find Previous", self)
+        find_previous_action.setShortcut("Shift+F3")
+        find_previous_action.triggered.connect(self.find_previous)
+        edit_menu.addAction(find_previous_action)
         
         replace_action = QAction("Replace...", self)
         replace_action.setShortcut("Ctrl+H")
         replace_action.triggered.connect(self.replace_text)
         edit_menu.addAction(replace_action)
+
+        replace_all_action = QAction("Replace All", self)
+        replace_all_action.setShortcut("Ctrl+Shift+H")
+        replace_all_action.triggered.connect(self.replace_all)
+        edit_menu.addAction(replace_all_action)
+
+        find_in_files_action = QAction("Find in Files...", self)
+        find_in_files_action.setShortcut("Ctrl+Shift+F")
+        find_in_files_action.triggered.connect(self.show_find_in_files)
+        edit_menu.addAction(find_in_files_action)
+
+        go_to_line_action = QAction("Go to Line...", self)
+        go_to_line_action.setShortcut("Ctrl+G")
+        go_to_line_action.triggered.connect(self.go_to_line)
+        edit_menu.addAction(go_to_line_action)
         
         edit_menu.addSeparator()
 
+        complete_word_action = QAction("Complete Word", self)
+        complete_word_action.setShortcut("Ctrl+Space")
+        complete_word_action.triggered.connect(self.complete_word)
+        edit_menu.addAction(complete_word_action)
+
+        self.word_completion_action = QAction("Word Completion", self, checkable=True)
+        self.word_completion_action.setChecked(self.scheduler.word_completion)
+        self.word_completion_action.triggered.connect(self.toggle_word_completion)
+        edit_menu.addAction(self.word_completion_action)
+
+        self.complete_all_tabs_action = QAction("Complete from All Tabs", self, checkable=True)
+        self.complete_all_tabs_action.setChecked(self.scheduler.complete_all_tabs)
+        self.complete_all_tabs_action.triggered.connect(self.toggle_complete_all_tabs)
+        edit_menu.addAction(self.complete_all_tabs_action)
+
+        edit_menu.addSeparator()
+
         select_all_action = QAction("Select All", self)
         select_all_action.setShortcut("Ctrl+A")
         select_all_action.triggered.connect(self.select_all)
@@ -246,6 +3081,10 @@ class NotePad(QMainWindow):
         text_color_action.triggered.connect(self.choose_text_color)
         format_menu.addAction(text_color_action)
         
+        rich_text_action = QAction("Rich Text Formatting", self)
+        rich_text_action.triggered.connect(self.toggle_rich_text)
+        format_menu.addAction(rich_text_action)
+
         bg_color_action = QAction("Background Color...", self)
         bg_color_action.triggered.connect(self.choose_bg_color)
         format_menu.addAction(bg_color_action)
@@ -275,154 +3114,183 @@ class NotePad(QMainWindow):
         show_status_bar_action.triggered.connect(self.toggle_status_bar)
         view_menu.addAction(show_status_bar_action)
 
+        line_numbers_action = QAction("Line Numbers", self, checkable=True)
+        line_numbers_action.setChecked(self.show_line_numbers)
+        line_numbers_action.triggered.connect(self.toggle_line_numbers)
+        view_menu.addAction(line_numbers_action)
+
         self.dark_mode_action = QAction("Dark Mode", self, checkable=True)
         self.dark_mode_action.triggered.connect(self.toggle_dark_mode)
         view_menu.addAction(self.dark_mode_action)
+
+        self.follow_action = QAction("Follow File", self, checkable=True)
+        self.follow_action.triggered.connect(self.toggle_follow)
+        view_menu.addAction(self.follow_action)
+
+        self.syntax_menu = view_menu.addMenu("Syntax Highlighting")
+        syntax_group = QActionGroup(self)
+        syntax_group.triggered.connect(self.choose_syntax)
+        self.syntax_actions = {}
+        for lexer in [PLAIN_TEXT, *LEXERS]:
+            action = QAction(lexer.name, self, checkable=True)
+            syntax_group.addAction(action)
+            self.syntax_menu.addAction(action)
+            self.syntax_actions[lexer.name] = action
+
+        view_menu.addSeparator()
+
+        performance_overlay_action = QAction("Performance Overlay", self, checkable=True)
+        performance_overlay_action.setShortcut("Ctrl+Shift+P")
+        performance_overlay_action.triggered.connect(self.toggle_performance_overlay)
+        view_menu.addAction(performance_overlay_action)
+
+        export_performance_action = QAction("Export Performance Data...", self)
+        export_performance_action.triggered.connect(self.export_performance_data)
+        view_menu.addAction(export_performance_action)
         
     def toggle_dark_mode(self):
-        if self.dark_mode_action.isChecked():
-            dark_stylesheet = """
-                QWidget {
-                    background-color: #1e1e1e;
-                    color: #f0f0f0;
-                }
-
-                QTextEdit {
-                    background-color: #252525;
-                    color: #f0f0f0;
-                    border: none;
-                    selection-background-color: #264f78;
-                    selection-color: #ffffff;
-                }
-
-                QMenuBar {
-                    background-color: #333333;
-                    color: #f0f0f0;
-                }
-
-                QMenuBar::item {
-                    background-color: #333333;
-                    color: #f0f0f0;
-                    padding: 4px 8px;
-                }
-
-                QMenuBar::item:selected {
-                    background-color: #505050;
-                }
-
-                QMenu {
-                    background-color: #2d2d2d;
-                    color: #f0f0f0;
-                    border: 1px solid #505050;
-                }
-
-                QMenu::item:selected {
-                    background-color: #404040;
-                }
-
-                QTabWidget::pane {
-                    border: none;
-                }
-
-                QTabBar::tab {
-                    background: #333333;
-                    color: #f0f0f0;
-                    padding: 8px 12px;
-                    margin-right: 2px;
-                    border-top-left-radius: 4px;
-                    border-top-right-radius: 4px;
-                }
-
-                QTabBar::tab:selected {
-                    background: #0078d7;
-                }
-                
-                QToolBar {
-                    background-color: #333333;
-                    border: none;
-                    spacing: 3px;
-                }
-                
-                QToolBar QToolButton {
-                    background-color: #333333;
-                    color: #f0f0f0;
-                    border: 1px solid #505050;
-                    border-radius: 4px;
-                    padding: 4px;
-                }
-                
-                QToolBar QToolButton:hover {
-                    background-color: #404040;
-                }
-                
-                QStatusBar {
-                    background-color: #333333;
-                    color: #f0f0f0;
-                }
-                
-                QDialog {
-                    background-color: #2d2d2d;
-                    color: #f0f0f0;
-                }
-                
-                QPushButton {
-                    background-color: #0078d7;
-                    color: #ffffff;
-                    border: none;
-                    padding: 6px 12px;
-                    border-radius: 4px;
-                }
-                
-                QPushButton:hover {
-                    background-color: #1084e0;
-                }
-                
-                QLineEdit, QSpinBox {
-                    background-color: #252525;
-                    color: #f0f0f0;
-                    border: 1px solid #505050;
-                    padding: 4px;
-                    border-radius: 4px;
-                }
-                
-                QMessageBox {
-                    background-color: #2d2d2d;
-                    color: #f0f0f0;
-                }
-            """
-            self.setStyleSheet(dark_stylesheet)
-        else:
-            self.setStyleSheet("")
+        # one stylesheet for the whole application, every window follows the toggle
+        self.scheduler.dark_mode = self.dark_mode_action.isChecked()
+        stylesheet = DARK_STYLESHEET if self.scheduler.dark_mode else ""
+        app = QApplication.instance()
+        if app.styleSheet() != stylesheet:
+            app.setStyleSheet(stylesheet)
+        for window in windows:
+            window.apply_theme(self.scheduler.dark_mode)
+
+    def apply_theme(self, dark):
+        self.dark_mode_action.setChecked(dark)
+        self.token_colors = TOKEN_COLORS["dark" if dark else "light"]
+        for widget in map(self.tab_widget.widget, range(self.tab_widget.count())):
+            if getattr(widget, "highlighter", None):
+                widget.highlighter.set_colors(self.token_colors)
     
+    def toggle_performance_overlay(self, enabled):
+        profiler.enabled = enabled
+        self.lag_expected = None
+        if enabled:
+            self.lag_timer.start()
+        else:
+            self.lag_timer.stop()
+        self.performance_overlay.set_active(enabled)
+
+    def measure_event_loop_lag(self):
+        # how late the probe fired is how long the event loop was busy with something else
+        now = time.perf_counter()
+        if self.lag_expected is not None:
+            profiler.record("event loop lag", self.lag_expected, max(0.0, now - self.lag_expected))
+        self.lag_expected = now + LAG_PROBE_INTERVAL / 1000
+
+    def export_performance_data(self):
+        file_name, selected = QFileDialog.getSaveFileName(
+            self, "Export Performance Data", "notepad-trace.json",
+            "Chrome Trace (*.json);;Histograms (*.json)"
+        )
+        if not file_name:
+            return
+        try:
+            if selected.startswith("Histograms"):
+                profiler.export_json(file_name)
+            else:
+                profiler.export_chrome_trace(file_name)
+        except OSError as e:
+            QMessageBox.warning(self, "Export", f"Could not export {file_name}:\n{e}")
+            return
+        self.status_bar.showMessage(f"Performance data written to {file_name}", 3000)
+
     def toggle_status_bar(self):
         if self.statusBar().isVisible():
             self.statusBar().hide()
         else:
             self.statusBar().show()
     
+    def toggle_line_numbers(self, enabled):
+        # plain text tabs and large files, rich text tabs have no gutter
+        self.show_line_numbers = enabled
+        for widget in map(self.tab_widget.widget, range(self.tab_widget.count())):
+            if isinstance(widget, QPlainTextEdit):
+                widget.gutter.set_shown(enabled)
+            elif isinstance(widget, LargeFileView):
+                widget.show_line_numbers = enabled
+                widget.viewport().update()
+
     def toggle_word_wrap(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
-            if text_edit.lineWrapMode() == QTextEdit.NoWrap:
-                text_edit.setLineWrapMode(QTextEdit.WidgetWidth)
+            editor_class = type(text_edit)
+            if text_edit.lineWrapMode() == editor_class.NoWrap:
+                text_edit.setLineWrapMode(editor_class.WidgetWidth)
             else:
-                text_edit.setLineWrapMode(QTextEdit.NoWrap)
+                text_edit.setLineWrapMode(editor_class.NoWrap)
     
     def choose_font(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
-            current_font = text_edit.currentFont()
+            current_font = text_edit.font()
             font, ok = QFontDialog.getFont(current_font, self)
             if ok:
                 text_edit.setFont(font)
     
     def choose_text_color(self):
-        text_edit = self.get_current_text_edit()
+        text_edit = self.get_rich_text_edit()
         if text_edit:
             color = QColorDialog.getColor()
             if color.isValid():
                 text_edit.setTextColor(color)
     
+    def get_rich_text_edit(self):
+        text_edit = self.get_current_text_edit()
+        if isinstance(text_edit, QTextEdit):
+            return text_edit
+        if text_edit:
+            ret = QMessageBox.question(
+                self, "Rich Text",
+                "This is a plain text tab. Enable rich text formatting for it?"
+            )
+            if ret == QMessageBox.Yes:
+                return self.convert_tab(self.tab_widget.currentIndex(), rich=True)
+        return None
+
+    def toggle_rich_text(self):
+        text_edit = self.get_current_text_edit()
+        if text_edit:
+            self.convert_tab(self.tab_widget.currentIndex(), rich=not isinstance(text_edit, QTextEdit))
+
+    def convert_tab(self, index, rich):
+        old_edit = self.tab_widget.widget(index)
+        if len(registry.views(old_edit.state)) > 1:
+            self.status_bar.showMessage("The document is open in another window as well", 3000)
+            return None
+        title = self.tab_widget.tabText(index)
+        cursor_position = old_edit.textCursor().position()
+        modified = old_edit.document().isModified()
+
+        self.tab_widget.blockSignals(True)
+        self.tab_widget.removeTab(index)
+        self.tab_widget.blockSignals(False)
+        self.journal.close_tab(old_edit.journal_id)
+        self.release_editor(old_edit)
+        registry.release(old_edit.state)
+        if old_edit.undo_log:
+            old_edit.undo_log.discard()
+        text_edit = self.add_new_tab(title, document_text(old_edit.document()), rich=rich, file_path=old_edit.property("file_path"))
+        self.tab_widget.tabBar().moveTab(self.tab_widget.indexOf(text_edit), index)
+        self.tab_widget.setCurrentWidget(text_edit)
+
+        text_edit.text_format = old_edit.text_format
+        text_edit.disk, text_edit.disk_changed = old_edit.disk, old_edit.disk_changed
+        text_edit.following = old_edit.following
+        text_edit.setFont(old_edit.font())
+        text_edit.setLineWrapMode(type(text_edit).LineWrapMode(int(old_edit.lineWrapMode())))
+        if modified:
+            text_edit.document().setModified(True)
+            self.journal_base(text_edit)
+        cursor = text_edit.textCursor()
+        cursor.setPosition(min(cursor_position, text_edit.document().characterCount() - 1))
+        text_edit.setTextCursor(cursor)
+        old_edit.deleteLater()
+        return text_edit
+
     def choose_bg_color(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
@@ -437,59 +3305,410 @@ class NotePad(QMainWindow):
             cursor.removeSelectedText()
     
     def find_text(self):
+        text_edit = self.get_current_text_edit()
+        if text_edit and text_edit.textCursor().hasSelection():
+            self.find_bar.set_term(text_edit.textCursor().selectedText())
+        self.find_bar.show()
+        self.find_bar.search_edit.setFocus()
+        self.find_bar.search_edit.selectAll()
+        self.schedule_highlight()
+
+    def close_find_bar(self):
+        self.find_bar.hide()
+        self.find_bar.replace_row.hide()
+        self.find_bar.count_label.clear()
         text_edit = self.get_current_text_edit()
         if text_edit:
-            search_term, ok = QInputDialog.getText(self, "Find", "Search for:")
-            if ok and search_term:
-                self.last_search = search_term
-                self.find_next()
-    
-    def find_next(self):
+            text_edit.setExtraSelections([])
+            text_edit.setFocus()
+
+    def find_previous(self):
+        self.find_next(backward=True)
+
+    @instrumented
+    def find_next(self, backward=False):
+        search_term, regex, case_sensitive, whole_word = self.find_bar.options()
+        if not search_term:
+            self.find_text()
+            return
+
+        view = self.get_current_large_view()
+        if view:
+            self.find_next_large(view, backward)
+            return
+
         text_edit = self.get_current_text_edit()
-        if text_edit and hasattr(self, 'last_search'):
-            # store the cursor position 
-            cursor = text_edit.textCursor()
-            current_pos = cursor.position()
-            
-            if not text_edit.find(self.last_search):
-                # If not found try from the beginning
-                cursor.setPosition(0)
-                text_edit.setTextCursor(cursor)
-                if not text_edit.find(self.last_search):
-                    QMessageBox.information(self, "Find", f"Cannot find '{self.last_search}'")
-                    # Return to original position
-                    cursor.setPosition(current_pos)
-                    text_edit.setTextCursor(cursor)
+        if not text_edit:
+            return
+        try:
+            pattern = compile_pattern(search_term, regex, case_sensitive, whole_word)
+        except re.error as e:
+            self.find_bar.count_label.setText(f"Invalid pattern: {e}")
+            return
+
+        session = self.search_session(text_edit)
+        session.move = "previous" if backward else "next"
+        key = (search_term, regex, case_sensitive, whole_word)
+        if session.key != key:
+            self.find_bar.count_label.setText("Searching...")
+            session.start(key, pattern)
+        elif session.index is not None:
+            self.move_to_match(text_edit)
+
+    def search_session(self, text_edit):
+        if not hasattr(text_edit, "search"):
+            text_edit.search = SearchSession(text_edit)
+            text_edit.search.ready.connect(lambda: self.move_to_match(text_edit))
+            text_edit.search.changed.connect(self.schedule_highlight)
+            text_edit.verticalScrollBar().valueChanged.connect(self.schedule_highlight)
+        return text_edit.search
+
+    def move_to_match(self, text_edit):
+        session = text_edit.search
+        index = session.index
+        move, session.move = session.move, None
+        if index is None or move is None:
+            return
+        self.schedule_highlight()
+        if index.total == 0:
+            self.find_bar.count_label.setText("No matches")
+            QMessageBox.information(self, "Find", f"Cannot find '{session.key[0]}'")
+            return
+
+        cursor = text_edit.textCursor()
+        if move == "previous":
+            current = index.index_at(cursor.selectionStart()) - 1
+            if current < 0:
+                current = index.total - 1
+                self.status_bar.showMessage("Search wrapped to the end", 2000)
+        else:
+            current = index.index_at(cursor.selectionEnd() if cursor.hasSelection() else cursor.position())
+            if current == index.total:
+                current = 0
+                self.status_bar.showMessage("Search wrapped to the beginning", 2000)
+
+        start, end = index.span(current)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        text_edit.setTextCursor(cursor)
+        self.find_bar.count_label.setText(f"{current + 1:,} of {index.total:,}")
+
+    def schedule_highlight(self):
+        if not self.highlight_timer.isActive():
+            self.highlight_timer.start()
+
+    @instrumented
+    def highlight_matches(self):
+        text_edit = self.get_current_text_edit()
+        if not text_edit:
+            return
+        session = getattr(text_edit, "search", None)
+        if not self.find_bar.isVisible() or session is None or session.index is None:
+            text_edit.setExtraSelections([])
+            return
+
+        # only the matches inside the viewport get an extra selection
+        viewport = text_edit.viewport()
+        first = text_edit.cursorForPosition(QPoint(0, 0)).block().position()
+        last_block = text_edit.cursorForPosition(QPoint(viewport.width(), viewport.height())).block()
+        last = last_block.position() + last_block.length()
+
+        selections = []
+        for start, end in session.index.spans_between(first, last):
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(QColor("#806000"))
+            selection.cursor = QTextCursor(text_edit.document())
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, QTextCursor.KeepAnchor)
+            selections.append(selection)
+        text_edit.setExtraSelections(selections)
     
+    def find_next_large(self, view, backward=False):
+        if view.searching:
+            return
+        search_term, regex, case_sensitive, whole_word = self.find_bar.options()
+        encoding = view.large_file.encoding
+        if not byte_aligned(encoding):
+            self.find_bar.count_label.setText(f"Cannot search {encoding.upper()} files in the large file view")
+            return
+        # literals are found in the raw bytes, anything else in decoded windows of the file
+        if not bytes_searchable(search_term, regex, case_sensitive, whole_word, encoding):
+            encoding = None
+        try:
+            pattern = compile_pattern(search_term, regex, case_sensitive, whole_word, encoding)
+        except re.error as e:
+            self.find_bar.count_label.setText(f"Invalid pattern: {e}")
+            return
+        view.searching = True
+        worker = Worker(view.large_file.search, pattern, view.search_start(backward), backward=backward)
+        worker.signals.result.connect(lambda match: self.on_large_search_result(view, search_term, match))
+        worker.signals.finished.connect(lambda: setattr(view, "searching", False))
+        worker.start()
+        self.status_bar.showMessage(f"Searching for '{search_term}'...")
+
+    def on_large_search_result(self, view, search_term, match):
+        self.status_bar.clearMessage()
+        if match is None:
+            QMessageBox.information(self, "Find", f"Cannot find '{search_term}'")
+        else:
+            view.show_match(*match)
+
+    def go_to_line(self):
+        view = self.get_current_large_view()
+        text_edit = self.get_current_text_edit()
+        if view:
+            current, count = view.current_line + 1, view.large_file.line_count()
+        elif text_edit:
+            current, count = text_edit.textCursor().blockNumber() + 1, text_edit.document().blockCount()
+        else:
+            return
+        line, ok = QInputDialog.getInt(self, "Go to Line", f"Line number (1 - {count}):", current, 1, count)
+        if ok:
+            self.move_to_line(view or text_edit, line - 1)
+
+    def set_undo_limits(self):
+        steps, ok = QInputDialog.getInt(
+            self, "Undo History", "Undo steps kept in memory per tab:", self.undo_step_limit, 10, 1000000
+        )
+        if not ok:
+            return
+        megabytes, ok = QInputDialog.getInt(
+            self, "Undo History", "Undo memory per tab (MB):", self.undo_byte_limit // (1024 * 1024), 1, 4096
+        )
+        if ok:
+            # older steps are spilled to disk, not dropped, so lowering the limits loses nothing
+            self.undo_step_limit = steps
+            self.undo_byte_limit = megabytes * 1024 * 1024
+
+    def move_to_line(self, widget, line, column=0):
+        if isinstance(widget, LargeFileView):
+            widget.go_to_line(line)
+            return
+        # the document keeps its blocks in a balanced tree, finding one by number is O(log n)
+        block = widget.document().findBlockByNumber(line)
+        cursor = widget.textCursor()
+        cursor.setPosition(block.position() + min(column, max(block.length() - 1, 0)))
+        widget.setTextCursor(cursor)
+        if isinstance(widget, QPlainTextEdit):
+            # a jump lands mid-screen, like it does in large file views
+            widget.centerCursor()
+        else:
+            widget.ensureCursorVisible()
+
+    def show_find_in_files(self):
+        panel = self.find_in_files_panel
+        text_edit = self.get_current_text_edit()
+        if text_edit and text_edit.textCursor().hasSelection():
+            panel.search_edit.setText(text_edit.textCursor().selectedText())
+        panel.show()
+        panel.search_edit.setFocus()
+        panel.search_edit.selectAll()
+
+    def choose_search_folder(self):
+        panel = self.find_in_files_panel
+        folder = QFileDialog.getExistingDirectory(self, "Find in Files", panel.folder_edit.text())
+        if folder:
+            panel.folder_edit.setText(folder)
+
+    def toggle_file_search(self):
+        if self.file_search_cancel:
+            self.file_search_cancel.set()
+        else:
+            self.start_file_search()
+
+    def start_file_search(self):
+        panel = self.find_in_files_panel
+        options = panel.options()
+        folder = panel.folder_edit.text()
+        if not options[0] or not os.path.isdir(folder):
+            return
+        try:
+            compile_pattern(*options)
+        except re.error as e:
+            panel.stats_label.setText(f"Invalid pattern: {e}")
+            return
+        if self.file_search_cancel:
+            self.file_search_cancel.set()
+        # every search owns its flag, a cancelled run that is still winding down can't stop the next one
+        cancel = self.file_search_cancel = threading.Event()
+        panel.results.clear()
+        panel.set_running(True)
+        panel.stats_label.setText("Searching...")
+
+        # the walk and the process pool run off the GUI thread, batches of hits stream back as they finish
+        worker = Worker(find_in_files, folder, options, cancelled=cancel.is_set, report_partial=True)
+        worker.signals.partial.connect(lambda batch: self.on_file_results(cancel, batch))
+        worker.signals.result.connect(lambda totals: self.on_file_search_done(cancel, totals))
+        worker.signals.error.connect(lambda error: self.on_file_search_failed(cancel, error))
+        worker.start()
+
+    def on_file_results(self, cancel, batch):
+        if cancel is not self.file_search_cancel or cancel.is_set():
+            return
+        hits, files, size, found, elapsed = batch
+        panel = self.find_in_files_panel
+        folder = panel.folder_edit.text()
+        items = []
+        for path, _, matches in hits:
+            item = QTreeWidgetItem([f"{os.path.relpath(path, folder)} ({len(matches)})"])
+            item.setData(0, Qt.UserRole, (path, 0, 0))
+            for line, column, text in matches:
+                child = QTreeWidgetItem(item, [f"{line}: {text.strip()}"])
+                child.setData(0, Qt.UserRole, (path, line - 1, column))
+            items.append(item)
+        panel.results.addTopLevelItems(items)
+        panel.stats_label.setText(self.file_search_stats("Searching", files, size, found, elapsed))
+
+    def on_file_search_done(self, cancel, totals):
+        if cancel is not self.file_search_cancel:
+            return
+        self.file_search_cancel = None
+        panel = self.find_in_files_panel
+        panel.set_running(False)
+        state = "Cancelled" if cancel.is_set() else "Done"
+        panel.stats_label.setText(self.file_search_stats(state, *totals))
+
+    def on_file_search_failed(self, cancel, error):
+        if cancel is not self.file_search_cancel:
+            return
+        self.file_search_cancel = None
+        self.find_in_files_panel.set_running(False)
+        self.find_in_files_panel.stats_label.setText(f"Search failed: {error}")
+
+    def file_search_stats(self, state, files, size, found, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        megabytes = size / (1024 * 1024)
+        return (
+            f"{state}: {found:,} matches in {files:,} files, {megabytes:.1f} MB in {elapsed:.2f} s "
+            f"({files / elapsed:,.0f} files/s, {megabytes / elapsed:.1f} MB/s)"
+        )
+
+    def on_file_result_activated(self, item):
+        path, line, column = item.data(0, Qt.UserRole)
+        self.open_location(path, line, column)
+
+    def find_tab(self, path):
+        path = os.path.realpath(path)
+        for i in range(self.tab_widget.count()):
+            widget = self.tab_widget.widget(i)
+            file_path = widget.property("file_path")
+            if file_path and os.path.realpath(file_path) == path:
+                return widget
+        return None
+
+    def open_location(self, path, line, column=0):
+        widget = self.find_tab(path)
+        if widget:
+            self.tab_widget.setCurrentWidget(widget)
+            # a session placeholder turns into the real editor when it becomes current
+            widget = self.tab_widget.currentWidget()
+        else:
+            try:
+                widget = self.open_path(path)
+            except OSError as e:
+                QMessageBox.warning(self, "Open", f"Could not open {path}:\n{e}")
+                return
+        self.move_to_line(widget, line, column)
+        widget.setFocus()
+
     def replace_text(self):
+        if self.get_current_text_edit():
+            self.find_bar.replace_row.show()
+            self.find_text()
+
+    def current_pattern(self):
+        search_term, regex, case_sensitive, whole_word = self.find_bar.options()
+        if not search_term:
+            self.replace_text()
+            return None
+        try:
+            return compile_pattern(search_term, regex, case_sensitive, whole_word)
+        except re.error as e:
+            self.find_bar.count_label.setText(f"Invalid pattern: {e}")
+            return None
+
+    def replace_next(self):
         text_edit = self.get_current_text_edit()
-        if text_edit:
-            search_term, ok = QInputDialog.getText(self, "Replace", "Search for:")
-            if ok and search_term:
-                replace_with, ok = QInputDialog.getText(self, "Replace", "Replace with:")
-                if ok:
-                    self.last_search = search_term
-                    cursor = text_edit.textCursor()
-                    
-                    if cursor.hasSelection() and cursor.selectedText() == search_term:
-                        cursor.insertText(replace_with)
-                    self.find_next()
-        
-    def auto_save(self):
+        pattern = self.current_pattern()
+        if not text_edit or not pattern:
+            return
+        regex = self.find_bar.regex_box.isChecked()
+        replace_with = self.find_bar.replace_edit.text()
+        cursor = text_edit.textCursor()
+
+        if cursor.hasSelection():
+            match = pattern.fullmatch(cursor.selectedText().replace("\u2029", "\n"))
+            if match:
+                cursor.insertText(match.expand(replace_with) if regex else replace_with)
+        self.find_next()
+
+    @instrumented
+    def replace_all(self):
         text_edit = self.get_current_text_edit()
-        if text_edit and text_edit.property("file_path") and self.document_modified:
-            self.save_file()
-            self.status_bar.showMessage("Auto-saved", 2000)
+        pattern = self.current_pattern()
+        if not text_edit or not pattern:
+            return
+        started = time.perf_counter()
+        regex = self.find_bar.regex_box.isChecked()
+        text = document_text(text_edit.document())
+        try:
+            edits = replacements(text, pattern, self.find_bar.replace_edit.text(), regex)
+        except (re.error, IndexError) as e:
+            self.find_bar.count_label.setText(f"Invalid replacement: {e}")
+            return
+        if not edits:
+            self.find_bar.count_label.setText("No matches")
+            QMessageBox.information(self, "Replace All", f"Cannot find '{self.find_bar.search_edit.text()}'")
+            return
 
+        document = text_edit.document()
+        # the insert would move every cursor inside the span to its end, each view keeps its place
+        views = registry.views(text_edit.state)
+        positions = [view.textCursor().position() for view in views]
+        cursor = QTextCursor(document)
+        if isinstance(text_edit, QPlainTextEdit):
+            # the span from the first match to the last is put together here and inserted once, a
+            # cursor edit per match costs more than the rest of Replace All. It is a single undo
+            # step and listeners get a single contentsChange
+            first, last = edits[0][0], edits[-1][1]
+            pieces = []
+            previous = first
+            for start, end, new_text in edits:
+                pieces.append(text[previous:start])
+                pieces.append(new_text)
+                previous = end
+            new_span = "".join(pieces)
+            del text, pieces
+            cursor.setPosition(first)
+            cursor.setPosition(last, QTextCursor.KeepAnchor)
+            cursor.insertText(new_span)
+        else:
+            # rich text would lose the formatting of everything between the matches, each match
+            # is replaced on its own in one edit block
+            del text
+            cursor.beginEditBlock()
+            for start, end, new_text in reversed(edits):
+                cursor.setPosition(start)
+                cursor.setPosition(end, QTextCursor.KeepAnchor)
+                cursor.insertText(new_text)
+            cursor.endEditBlock()
+        for view, position in zip(views, positions):
+            cursor = view.textCursor()
+            cursor.setPosition(min(replaced_position(edits, position), document.characterCount() - 1))
+            view.setTextCursor(cursor)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.find_bar.count_label.setText(f"Replaced {len(edits):,}")
+        self.status_bar.showMessage(f"Replaced {len(edits):,} occurrences in {elapsed:.0f} ms", 5000)
+        
     def undo(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
-            text_edit.undo()
+            self.undo_edit(text_edit)
 
     def redo(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
-            text_edit.redo()
+            self.redo_edit(text_edit)
 
     def cut(self):
         text_edit = self.get_current_text_edit()
@@ -517,39 +3736,339 @@ class NotePad(QMainWindow):
 
     def open_file(self):
         options = QFileDialog.Options()
-        file_name, _ = QFileDialog.getOpenFileName(
+        file_names, _ = QFileDialog.getOpenFileNames(
             self, "Open File", "", "Text Files (*.txt);;All Files (*)", options=options
         )
-        if file_name:
-            with open(file_name, 'r', encoding='utf-8', errors='ignore') as file:
-                content = file.read()
+        if file_names:
+            self.open_paths(file_names)
+
+    @instrumented
+    def open_path(self, file_name):
+        return self.open_shared(file_name) or self.add_file_tab(file_name, load_file(file_name))
+
+    def add_file_tab(self, file_name, content):
+        if content is None or isinstance(content, LargeFile):
+            return self.add_large_file_tab(file_name, content)
+        text, text_format = content
+        return self.add_new_tab(os.path.basename(file_name), text, file_path=file_name, text_format=text_format)
+
+    @instrumented
+    def open_paths(self, paths):
+        # files are read concurrently and each tab appears as soon as its file is decoded
+        queued = []
+        for path in map(os.path.abspath, paths):
+            widget = self.find_tab(path) or self.open_shared(path)
+            if widget:
+                self.tab_widget.setCurrentWidget(widget)
+            else:
+                queued.append(path)
+        self.file_loader.load(queued)
+        self.update_load_status()
+
+    @instrumented
+    def on_file_loaded(self, path, content):
+        # the same file can be queued twice from separate drops, or open in another window by now
+        if not (self.find_tab(path) or self.open_shared(path)):
+            self.add_file_tab(path, content)
+        elif isinstance(content, LargeFile):
+            content.close()
+        self.update_load_status()
+
+    def on_file_load_failed(self, path, error):
+        self.update_load_status()
+        QMessageBox.warning(self, "Open", f"Could not open {path}:\n{error}")
+
+    def on_file_load_progress(self, path, percent):
+        self.load_progress.setValue(percent)
+        self.status_bar.showMessage(f"Opening {os.path.basename(path)}... ({self.file_loader.remaining()} left)")
+
+    def cancel_file_loads(self):
+        self.file_loader.cancel()
+        self.status_bar.showMessage("Opening cancelled", 2000)
+
+    def update_load_status(self):
+        remaining = self.file_loader.remaining()
+        self.load_progress.setVisible(bool(remaining))
+        self.load_cancel_button.setVisible(bool(remaining))
+        if remaining:
+            self.load_progress.setValue(0)
+            self.status_bar.showMessage(f"Opening files... {remaining} left")
+        else:
+            self.status_bar.clearMessage()
+
+    def dropped_files(self, event):
+        mime = event.mimeData()
+        if not mime.hasUrls():
+            return []
+        return [url.toLocalFile() for url in mime.urls() if url.isLocalFile() and os.path.isfile(url.toLocalFile())]
+
+    def dragEnterEvent(self, event):
+        if self.dropped_files(event):
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        paths = self.dropped_files(event)
+        if paths:
+            event.acceptProposedAction()
+            self.open_paths(paths)
 
-            from os.path import basename
-            tab_title = basename(file_name)
+    def eventFilter(self, watched, event):
+        popup = self.completion_popup
+        if popup.isVisible() and watched is popup.text_edit:
+            # while the completion list is open it takes the keys that pick from it
+            if event.type() == QEvent.KeyPress and event.key() in COMPLETION_KEYS:
+                if event.key() == Qt.Key_Escape:
+                    popup.hide()
+                elif event.key() in (Qt.Key_Tab, Qt.Key_Return, Qt.Key_Enter):
+                    self.accept_completion(popup.currentItem().text())
+                else:
+                    popup.move_selection(COMPLETION_KEYS[event.key()])
+                return True
+            if event.type() == QEvent.FocusOut:
+                popup.hide()
+        # undo, redo and typing in editors go through the tab's UndoLog
+        if event.type() == QEvent.KeyPress and isinstance(watched, TEXT_EDITORS):
+            if event.matches(QKeySequence.Undo):
+                self.undo_edit(watched)
+                return True
+            if event.matches(QKeySequence.Redo):
+                self.redo_edit(watched)
+                return True
+            if typed_text(event):
+                self.type_text(watched, event)
+                # an open list already followed the cursor
+                if not popup.isVisible():
+                    self.complete(watched)
+                return True
+        if event.type() == QEvent.ContextMenu and isinstance(watched.parent(), TEXT_EDITORS):
+            self.show_editor_menu(watched.parent(), event)
+            return True
+        # editors would insert dropped file URLs as text, open the files instead
+        if event.type() in (QEvent.DragEnter, QEvent.DragMove, QEvent.Drop):
+            paths = self.dropped_files(event)
+            if paths:
+                event.acceptProposedAction()
+                if event.type() == QEvent.Drop:
+                    self.open_paths(paths)
+                return True
+        return super().eventFilter(watched, event)
 
-            text_edit = self.add_new_tab(tab_title, content)
-            text_edit.setProperty("file_path", file_name)
-            self.document_modified = False
+    @instrumented
+    def complete(self, text_edit, explicit=False):
+        # offers the words that start with the one before the cursor, most frequent first.
+        # Returns whether there were any
+        popup = self.completion_popup
+        cursor = text_edit.textCursor()
+        line = cursor.block().text()
+        column = cursor.positionInBlock()
+        prefix = word_prefix(line[:column])
+        following = line[column:column + 1]
+        words = []
+        # there is nothing to complete inside a word
+        if prefix and not cursor.hasSelection() and not (following.isalnum() or following == "_"):
+            shown = popup.isVisible() and popup.text_edit is text_edit
+            if explicit or shown or len(prefix) >= COMPLETION_MIN_PREFIX:
+                words = self.suggestions(text_edit, prefix)
+        if words:
+            popup.show_words(text_edit, prefix, words)
+        else:
+            popup.hide()
+        return bool(words)
+
+    def suggestions(self, text_edit, prefix):
+        # with Complete from All Tabs the counts of a word in every open document add up
+        states = {id(text_edit.state): text_edit.state}
+        if self.scheduler.complete_all_tabs:
+            for window, widget in self.scheduler.tabs():
+                if isinstance(widget, TEXT_EDITORS):
+                    states.setdefault(id(widget.state), widget.state)
+        totals = Counter()
+        for state in states.values():
+            if state.completion and state.completion.index:
+                for word, count in state.completion.index.suggest(prefix):
+                    totals[word] += count
+        return [word for word, count in sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:SUGGESTION_LIMIT]]
+
+    def follow_completion(self, text_edit):
+        popup = self.completion_popup
+        if popup.isVisible() and popup.text_edit is text_edit:
+            self.complete(text_edit)
+
+    def complete_word(self):
+        text_edit = self.get_current_text_edit()
+        if not text_edit:
+            return
+        if not self.scheduler.word_completion:
+            self.status_bar.showMessage("Word completion is off (Edit → Word Completion)", 3000)
+        elif not self.complete(text_edit, explicit=True):
+            self.status_bar.showMessage("No completions", 2000)
+
+    def accept_completion(self, word):
+        popup = self.completion_popup
+        text_edit = popup.text_edit
+        popup.hide()
+        if text_edit is None or not word.startswith(popup.prefix):
+            return
+        # an edit block of its own, so undo takes back the completion and not the typing before it
+        cursor = text_edit.textCursor()
+        cursor.beginEditBlock()
+        cursor.insertText(word[len(popup.prefix):])
+        cursor.endEditBlock()
+        text_edit.setTextCursor(cursor)
+
+    def toggle_word_completion(self, enabled):
+        # documents are only indexed while completion is on, in every window
+        self.scheduler.word_completion = enabled
+        for window in windows:
+            window.word_completion_action.setChecked(enabled)
+            window.completion_popup.hide()
+        for window, widget in self.scheduler.tabs():
+            if not isinstance(widget, TEXT_EDITORS):
+                continue
+            if enabled and widget.completion is None:
+                widget.completion = WordIndex(widget.document())
+            elif not enabled and widget.completion:
+                widget.completion.stop()
+                widget.completion = None
+
+    def toggle_complete_all_tabs(self, enabled):
+        self.scheduler.complete_all_tabs = enabled
+        for window in windows:
+            window.complete_all_tabs_action.setChecked(enabled)
+
+    def show_editor_menu(self, text_edit, event):
+        # the standard menu with its Undo and Redo routed like the keyboard shortcuts
+        menu = text_edit.createStandardContextMenu(event.pos())
+        log = text_edit.undo_log
+        for action in menu.actions():
+            if action.objectName() == "edit-undo":
+                action.triggered.disconnect()
+                action.triggered.connect(lambda: self.undo_edit(text_edit))
+                action.setEnabled(text_edit.document().isUndoAvailable() or bool(log and log.segments))
+            elif action.objectName() == "edit-redo":
+                action.triggered.disconnect()
+                action.triggered.connect(lambda: self.redo_edit(text_edit))
+        menu.exec_(event.globalPos())
+        menu.deleteLater()
+
+    def add_large_file_tab(self, file_name, large_file=None):
+        # large_file is given for the decompressed copy of a compressed file
+        large_file = large_file or LargeFile(file_name)
+        view = LargeFileView(large_file)
+        view.show_line_numbers = self.show_line_numbers
+        view.setProperty("file_path", file_name)
+        view.cursorPositionChanged.connect(lambda: self.update_large_file_status(view))
+
+        index = self.tab_widget.addTab(view, os.path.basename(file_name) + " [read-only]")
+        self.tab_widget.setCurrentIndex(index)
+        view.setFocus()
+
+        # index lines in the background, the view grows as offsets come in
+        worker = Worker(large_file.build_index, report_progress=True)
+        worker.signals.progress.connect(lambda percent: self.on_index_progress(view, percent))
+        worker.signals.finished.connect(lambda: self.on_index_progress(view, 100))
+        worker.start()
+        self.update_large_file_status(view)
+        return view
+
+    def on_index_progress(self, view, percent):
+        view.update_scroll_range()
+        if self.tab_widget.currentWidget() is view:
+            self.update_large_file_status(view)
+            if percent < 100:
+                self.status_bar.showMessage(f"Indexing lines... {percent}%", 1000)
 
+    def update_large_file_status(self, view):
+        large_file = view.large_file
+        lines = f"{large_file.line_count():,}" + ("" if large_file.complete else "+")
+        self.line_col_label.setText(f"Line: {view.current_line + 1}")
+        self.format_label.setText(large_file.encoding.upper())
+        self.char_count_label.setText(f"Lines: {lines}, Size: {large_file.size / (1024 * 1024):.1f} MB")
+
+    @instrumented
     def save_file(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
             file_path = text_edit.property("file_path")
 
             if file_path:
-                with open(file_path, 'w', encoding='utf-8') as file:
-                    file.write(text_edit.toPlainText())
-
-                current_index = self.tab_widget.currentIndex()
-                current_tab_text = self.tab_widget.tabText(current_index)
-                if current_tab_text.endswith("*"):
-                    self.tab_widget.setTabText(current_index, current_tab_text[:-1])
-                
-                self.document_modified = False
-                self.status_bar.showMessage(f"Saved to {file_path}", 2000)
+                self.queue_save(text_edit, file_path)
             else:
                 self.save_as_file()
 
+    @instrumented
+    def queue_save(self, text_edit, file_path):
+        # only the snapshot happens on the GUI thread, encoding and disk I/O run in the pipeline
+        revision = text_edit.document().revision()
+        if self.save_pipeline.submit(text_edit, file_path, document_text(text_edit.document()), text_edit.text_format, revision):
+            text_edit.saves_pending += 1
+            self.saves_queued += 1
+        self.save_progress.setValue(0)
+        self.save_progress.show()
+        self.status_bar.showMessage(f"Saving {os.path.basename(file_path)}...")
+
+    def on_save_progress(self, text_edit, percent):
+        self.save_progress.setValue(percent)
+
+    @instrumented
+    def on_save_finished(self, text_edit, file_path, revision):
+        self.save_progress.hide()
+        text_edit.saves_pending -= 1
+        self.saves_queued -= 1
+        if self.tab_widget.indexOf(text_edit) != -1:
+            document = text_edit.document()
+            if document.revision() == revision and document.isModified():
+                document.setModified(False)
+            else:
+                # the journal base must follow the file that was just replaced
+                self.journal_base(text_edit)
+            # later outside changes are compared against the file as this save left it
+            text_edit.disk = self.capture_disk(file_path)
+            text_edit.disk_changed = False
+            self.update_reload_bar()
+            self.scheduler.watch_timer.start()
+        self.status_bar.showMessage(f"Saved to {file_path}", 2000)
+        self.finish_closes()
+
+    def on_save_failed(self, text_edit, file_path, error):
+        self.save_progress.hide()
+        text_edit.saves_pending -= 1
+        self.saves_queued -= 1
+        self.status_bar.clearMessage()
+        # a window waiting to close stays open with the unsaved document
+        if self.closing:
+            self.closing = self.close_confirmed = False
+            self.setEnabled(True)
+        self.finish_closes()
+        QMessageBox.warning(self, "Save", f"Could not save {file_path}:\n{error}")
+        # outside changes that came in during the save were put off until now
+        if self.tab_widget.indexOf(text_edit) != -1:
+            self.check_disk(text_edit)
+
+    def finish_closes(self):
+        # tabs whose close waited for their save go once it is done, or become editable again
+        # when the document is still unsaved
+        for text_edit in list(self.closing_tabs):
+            if text_edit.saves_pending:
+                continue
+            self.closing_tabs.remove(text_edit)
+            if self.tab_widget.indexOf(text_edit) == -1:
+                continue
+            if text_edit.document().isModified():
+                text_edit.setReadOnly(False)
+            else:
+                self.remove_tab(text_edit)
+        if self.closing and not self.saves_queued:
+            self.closing = False
+            self.setEnabled(True)
+            self.close()
+
+    def defer_close(self, event):
+        event.ignore()
+        self.closing = True
+        self.setEnabled(False)
+        self.status_bar.showMessage("Closing once the files being saved are written...")
+
     def save_as_file(self):
         text_edit = self.get_current_text_edit()
         if text_edit:
@@ -558,15 +4077,21 @@ class NotePad(QMainWindow):
                 self, "Save As", "", "Text Files (*.txt);;All Files (*)", options=options
             )
             if file_name:
-                with open(file_name, 'w', encoding='utf-8') as file:
-                    file.write(text_edit.toPlainText())
-
                 from os.path import basename
                 tab_title = basename(file_name)
-                self.tab_widget.setTabText(self.tab_widget.currentIndex(), tab_title)
-                text_edit.setProperty("file_path", file_name)
-                self.document_modified = False
-                self.status_bar.showMessage(f"Saved to {file_name}", 2000)
+                # views of the document in other windows follow it to the new file
+                for view in registry.views(text_edit.state):
+                    window = view.window()
+                    window.tab_widget.setTabText(window.tab_widget.indexOf(view), tab_title)
+                    window.set_tab_modified(view, view.document().isModified())
+                    view.setProperty("file_path", file_name)
+                    if isinstance(view, QPlainTextEdit):
+                        window.set_tab_lexer(view, lexer_for_path(file_name))
+                registry.release(text_edit.state)
+                registry.register(file_name, text_edit.state)
+                # a .gz, .xz or .bz2 name compresses the file, any other name writes it plain
+                text_edit.text_format = text_edit.text_format.for_path(file_name)
+                self.queue_save(text_edit, file_name)
 
     def zoom_in(self):
         text_edit = self.get_current_text_edit()
@@ -593,32 +4118,85 @@ class NotePad(QMainWindow):
             text_edit.setFont(current_font)
     
     def closeEvent(self, event):
-        # Check for unsaved changes before closing
-        for i in range(self.tab_widget.count()):
-            text_edit = self.tab_widget.widget(i)
-            if isinstance(text_edit, QTextEdit) and self.document_modified:
-                self.tab_widget.setCurrentIndex(i)
+        # queued saves must land before the session decides which tabs are still unsaved
+        if self.saves_queued:
+            self.defer_close(event)
+            return
+        # the session window keeps unsaved tabs as session buffers, other windows ask about each one
+        session_saved = self.close_confirmed or self.session_enabled and self.save_session()
+        if not session_saved:
+            for i in range(self.tab_widget.count()):
+                text_edit = self.tab_widget.widget(i)
+                if isinstance(text_edit, TabPlaceholder) and text_edit.record.get("modified"):
+                    placeholder = text_edit
+                    text_edit = self.materialize_tab(i)
+                    if text_edit is None and not self.discard_unrestored(placeholder):
+                        event.ignore()
+                        return
+                if (
+                    isinstance(text_edit, TEXT_EDITORS) and text_edit.document().isModified()
+                    and len(registry.views(text_edit.state)) == 1
+                ):
+                    self.tab_widget.setCurrentIndex(i)
                 
-                msg_box = QMessageBox()
-                msg_box.setIcon(QMessageBox.Question)
-                msg_box.setText(f"The document '{self.tab_widget.tabText(i)}' has been modified.")
-                msg_box.setInformativeText("Do you want to save your changes?")
-                msg_box.setStandardButtons(QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
-                msg_box.setDefaultButton(QMessageBox.Save)
-                ret = msg_box.exec_()
+                    msg_box = QMessageBox()
+                    msg_box.setIcon(QMessageBox.Question)
+                    msg_box.setText(f"The document '{self.tab_widget.tabText(i)}' has been modified.")
+                    msg_box.setInformativeText("Do you want to save your changes?")
+                    msg_box.setStandardButtons(QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
+                    msg_box.setDefaultButton(QMessageBox.Save)
+                    ret = msg_box.exec_()
                 
-                if ret == QMessageBox.Save:
-                    self.save_file()
-                elif ret == QMessageBox.Cancel:
-                    event.ignore()
-                    return
+                    if ret == QMessageBox.Save:
+                        self.save_file()
+                    elif ret == QMessageBox.Cancel:
+                        event.ignore()
+                        return
+        # saves just asked for must reach the disk before the window goes away, every tab has
+        # had its answer by the time it closes
+        if self.saves_queued:
+            self.close_confirmed = True
+            self.defer_close(event)
+            return
 
+        if self.file_search_cancel:
+            self.file_search_cancel.set()
+        for i in range(self.tab_widget.count()):
+            widget = self.tab_widget.widget(i)
+            if isinstance(widget, TabPlaceholder) and widget.record.get("cache"):
+                self.journal.close_tab(widget.record["journal_id"])
+                remove_cache(widget.record["cache"])
+                if widget.undo_log:
+                    widget.undo_log.discard()
+            elif isinstance(widget, LargeFileView):
+                widget.large_file.close()
+            elif isinstance(widget, TEXT_EDITORS):
+                self.release_editor(widget)
+                # documents other windows still show keep their journal entry and undo history
+                if not self.detach_view(widget):
+                    self.journal.close_tab(widget.journal_id)
+                    if widget.undo_log:
+                        widget.undo_log.discard()
+        if self in windows:
+            windows.remove(self)
+        if windows:
+            self.scheduler.watch_timer.start()
+        else:
+            # the last window takes the shared timers and the journal with it
+            shutdown_scheduler()
         event.accept()
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyle("Fusion")  
-    notepad = NotePad()
+    notepad = NotePad(restore_session=True)
+    instance_server = InstanceServer(app)
+    instance_server.requested.connect(handle_instance_request)
+    instance_server.listen()
+    # files named on the command line open next to the restored session
+    files = [arg for arg in app.arguments()[1:] if arg != "--new-instance"]
+    if files:
+        notepad.open_paths(files)
     notepad.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,381 @@
+import fnmatch
+import multiprocessing
+import os
+import re
+import time
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # before Python 3.11
+    import sre_parse
+
+CHUNK_SIZE = 512
+
+# find in files skips these directories and anything matched by the root .gitignore
+IGNORED_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".tox", ".mypy_cache"}
+BINARY_SNIFF_SIZE = 8192
+FILES_PER_TASK = 32
+MAX_MATCHES_PER_FILE = 1000
+
+# ASCII letters a case-insensitive str pattern also matches outside ASCII, as in \u0130 and \u212a
+NON_ASCII_FOLDS = set("iks")
+NEWLINE = ord("\n")
+# the classes \s, \D and \W take in a line break
+NEWLINE_CATEGORIES = {sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_NOT_DIGIT, sre_parse.CATEGORY_NOT_WORD}
+# \A and \Z would match at the edges of the lines rescanned after an edit
+STRING_EDGES = {sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END_STRING}
+LINE_EDGES = {sre_parse.AT_BEGINNING, sre_parse.AT_END}
+REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None)}
+
+
+def compile_pattern(term, regex=False, case_sensitive=False, whole_word=False, encoding=None):
+    pattern = term if regex else re.escape(term)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    if encoding:
+        return re.compile(pattern.encode(encoding), flags)
+    return re.compile(pattern, flags)
+
+
+def bytes_searchable(term, regex, case_sensitive, whole_word, encoding):
+    # on the bytes of utf-8 or a single-byte encoding a literal matches where its text does, but
+    # ., classes and \b would work per byte and case folding would miss non-ASCII letters
+    if regex or whole_word:
+        return False
+    if not case_sensitive and not (term.isascii() and not NON_ASCII_FOLDS & set(term.lower())):
+        return False
+    try:
+        term.encode(encoding)
+    except UnicodeError:
+        return False
+    return True
+
+
+def is_line_local(pattern):
+    # a match of a line-local pattern never takes in a line break or depends on where the text
+    # ends, so an edit only needs the lines it touched searched again. A pattern the parser
+    # walk doesn't understand counts as multiline and gets a full rescan
+    try:
+        return not spans_lines(sre_parse.parse(pattern.pattern, pattern.flags), pattern.flags)
+    except (re.error, ValueError, TypeError):
+        return False
+
+
+def class_matches_newline(items):
+    negated = bool(items) and items[0][0] is sre_parse.NEGATE
+    found = False
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            found = av == NEWLINE
+        elif op is sre_parse.RANGE:
+            found = av[0] <= NEWLINE <= av[1]
+        elif op is sre_parse.CATEGORY:
+            found = av in NEWLINE_CATEGORIES
+        elif op is not sre_parse.NEGATE:
+            raise ValueError(f"unexpected {op} in a character class")
+        if found:
+            break
+    return found != negated
+
+
+def spans_lines(items, flags):
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            found = av == NEWLINE
+        elif op is sre_parse.NOT_LITERAL:
+            found = av != NEWLINE
+        elif op is sre_parse.ANY:
+            found = bool(flags & re.DOTALL)
+        elif op is sre_parse.IN:
+            found = class_matches_newline(av)
+        elif op is sre_parse.AT:
+            found = av in STRING_EDGES or av in LINE_EDGES and not flags & re.MULTILINE
+        elif op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, subpattern = av
+            found = spans_lines(subpattern, (flags | add_flags) & ~del_flags)
+        elif op in REPEATS:
+            found = spans_lines(av[2], flags)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            found = spans_lines(av[1], flags)
+        elif op is sre_parse.BRANCH:
+            found = any(spans_lines(branch, flags) for branch in av[1])
+        elif op is sre_parse.GROUPREF_EXISTS:
+            group, yes, no = av
+            found = spans_lines(yes, flags) or no is not None and spans_lines(no, flags)
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            found = spans_lines(av, flags)
+        elif op is sre_parse.GROUPREF:
+            # a back reference matches what its group did, which is checked on its own
+            found = False
+        else:
+            raise ValueError(f"unexpected {op} in a pattern")
+        if found:
+            return True
+    return False
+
+
+def find_all(text, pattern, offset=0):
+    # empty matches are useless for navigation and would never advance the cursor
+    return [(offset + m.start(), offset + m.end()) for m in pattern.finditer(text) if m.end() > m.start()]
+
+
+class MatchIndex:
+    # sorted match spans kept in chunks with a shared offset, so an edit only
+    # touches the chunks around it and shifts the rest in O(number of chunks)
+    def __init__(self, pattern, spans=()):
+        self.pattern = pattern
+        self.line_local = is_line_local(pattern)
+        self.chunks = []
+        self.total = 0
+        self._insert_at(0, list(spans))
+
+    @classmethod
+    def build(cls, pattern, text):
+        return cls(pattern, find_all(text, pattern))
+
+    def _insert_at(self, chunk_index, spans):
+        new_chunks = []
+        for start in range(0, len(spans), CHUNK_SIZE):
+            part = spans[start:start + CHUNK_SIZE]
+            offset = part[0][0]
+            new_chunks.append([offset, [s - offset for s, e in part], [e - offset for s, e in part]])
+        self.chunks[chunk_index:chunk_index] = new_chunks
+        self.total += len(spans)
+
+    def remove_and_shift(self, start, old_end, delta):
+        # drops matches starting in [start, old_end) and moves everything after by delta
+        kept = []
+        for chunk in self.chunks:
+            offset, starts, ends = chunk
+            if offset + starts[-1] < start:
+                kept.append(chunk)
+                continue
+            if offset + starts[0] >= old_end:
+                chunk[0] += delta
+                kept.append(chunk)
+                continue
+            first = bisect_left(starts, start - offset)
+            last = bisect_left(starts, old_end - offset)
+            del starts[first:last]
+            del ends[first:last]
+            self.total -= last - first
+            for i in range(first, len(starts)):
+                starts[i] += delta
+                ends[i] += delta
+            if starts:
+                kept.append(chunk)
+        self.chunks = kept
+
+    def rescan(self, start, text):
+        spans = find_all(text, self.pattern, start)
+        if not spans:
+            return
+        chunk_index = 0
+        while chunk_index < len(self.chunks) and self.chunks[chunk_index][0] + self.chunks[chunk_index][1][-1] < start:
+            chunk_index += 1
+        if chunk_index < len(self.chunks):
+            offset, starts, ends = self.chunks[chunk_index]
+            split = bisect_left(starts, start - offset)
+            if split:
+                # the chunk straddles the rescanned lines, split it around them
+                self.chunks[chunk_index:chunk_index + 1] = [
+                    [offset, starts[:split], ends[:split]],
+                    [offset, starts[split:], ends[split:]],
+                ]
+                chunk_index += 1
+        self._insert_at(chunk_index, spans)
+
+    def apply_edit(self, start, old_end, new_end, text):
+        # start..old_end covered whole lines before the edit, start..new_end covers them now
+        self.remove_and_shift(start, old_end, new_end - old_end)
+        self.rescan(start, text)
+        if len(self.chunks) > 2 * self.total // CHUNK_SIZE + 64:
+            self.rebalance()
+
+    def rebalance(self):
+        # edits split chunks, regroup them once too many small ones pile up
+        spans = self.spans_between(0, float("inf"))
+        self.chunks = []
+        self.total = 0
+        self._insert_at(0, spans)
+
+    def index_at(self, position):
+        # number of matches that start before position
+        count = 0
+        for offset, starts, ends in self.chunks:
+            if offset + starts[-1] < position:
+                count += len(starts)
+                continue
+            return count + bisect_left(starts, position - offset)
+        return count
+
+    def span(self, index):
+        for offset, starts, ends in self.chunks:
+            if index < len(starts):
+                return offset + starts[index], offset + ends[index]
+            index -= len(starts)
+        raise IndexError(index)
+
+    def spans_between(self, start, end):
+        spans = []
+        for offset, starts, ends in self.chunks:
+            if offset + ends[-1] <= start:
+                continue
+            if offset + starts[0] >= end:
+                break
+            first = bisect_left(starts, start - offset)
+            # a match that began before start can still reach into the range
+            if first and offset + ends[first - 1] > start:
+                first -= 1
+            for i in range(first, len(starts)):
+                if offset + starts[i] >= end:
+                    break
+                spans.append((offset + starts[i], offset + ends[i]))
+        return spans
+
+
+def replacements(text, pattern, replacement, regex=False):
+    # every match as (start, end, replacement text) from a single scan. For regex
+    # templates sub() does the expansion, each replacement and original match is
+    # bracketed with a marker character that occurs nowhere else and the spans are
+    # recovered from the pieces, which avoids re-parsing the template per match
+    if not regex:
+        return [(m.start(), m.end(), replacement) for m in pattern.finditer(text)]
+    marker = next(chr(c) for c in range(0xE000, 0xF900) if chr(c) not in text and chr(c) not in replacement)
+    pieces = pattern.sub(f"{marker}{replacement}{marker}\\g<0>{marker}", text).split(marker)
+    edits = []
+    position = 0
+    for i in range(0, len(pieces) - 1, 3):
+        start = position + len(pieces[i])
+        position = start + len(pieces[i + 2])
+        edits.append((start, position, pieces[i + 1]))
+    return edits
+
+
+def replaced_position(edits, position):
+    # where position ends up once edits from replacements() are applied, a position inside a
+    # replaced match goes to the end of its replacement
+    shift = 0
+    for start, end, new_text in edits:
+        if start >= position:
+            break
+        if end > position:
+            return start + shift + len(new_text)
+        shift += len(new_text) - (end - start)
+    return position + shift
+
+
+def load_ignore_patterns(root):
+    try:
+        with open(os.path.join(root, ".gitignore"), encoding="utf-8", errors="replace") as file:
+            lines = [line.strip() for line in file]
+    except OSError:
+        return []
+    return [line.rstrip("/") for line in lines if line and not line.startswith(("#", "!"))]
+
+
+def is_ignored(relative_path, name, patterns):
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(relative_path, p.lstrip("/")) for p in patterns)
+
+
+def walk_files(root):
+    patterns = load_ignore_patterns(root)
+    for directory, dirs, files in os.walk(root):
+        relative = os.path.relpath(directory, root)
+        dirs[:] = sorted(
+            d for d in dirs
+            if d not in IGNORED_DIRS and not is_ignored(os.path.normpath(os.path.join(relative, d)), d, patterns)
+        )
+        for name in sorted(files):
+            if not is_ignored(os.path.normpath(os.path.join(relative, name)), name, patterns):
+                yield os.path.join(directory, name)
+
+
+@lru_cache(maxsize=8)
+def _cached_pattern(options):
+    return compile_pattern(*options)
+
+
+def search_file(path, options):
+    # runs in a pool process, returns (path, bytes read, [(line, column, line text)]) or None for binaries
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if b"\0" in data[:BINARY_SNIFF_SIZE]:
+        return None
+    text = data.decode("utf-8", errors="replace")
+    pattern = _cached_pattern(options)
+    matches = []
+    line, line_start, counted = 1, 0, 0
+    for match in pattern.finditer(text):
+        start = match.start()
+        line += text.count("\n", counted, start)
+        counted = start
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", start)
+        line_text = text[line_start:line_end if line_end != -1 else len(text)]
+        matches.append((line, start - line_start, line_text[:500]))
+        if len(matches) >= MAX_MATCHES_PER_FILE:
+            break
+    return path, len(data), matches
+
+
+def search_files(paths, options):
+    results = [search_file(path, options) for path in paths]
+    return [result for result in results if result is not None]
+
+
+def find_in_files(root, options, partial, cancelled, workers=None):
+    # walks root and searches batches of files across processes, partial() gets each batch of
+    # results as it completes, the return value is (files, bytes, matches, seconds)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    files = size = found = 0
+    # spawn keeps the GUI process's threads out of the workers, this module is enough to run them
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending = set()
+
+        def collect(done):
+            nonlocal files, size, found
+            for future in done:
+                results = future.result()
+                files += future.file_count
+                size += sum(result[1] for result in results)
+                found += sum(len(result[2]) for result in results)
+                hits = [result for result in results if result[2]]
+                partial((hits, files, size, found, time.perf_counter() - started))
+
+        batch = []
+        for path in walk_files(root):
+            if cancelled():
+                break
+            batch.append(path)
+            if len(batch) == FILES_PER_TASK:
+                future = pool.submit(search_files, batch, options)
+                future.file_count = len(batch)
+                pending.add(future)
+                batch = []
+                # a bounded number of batches in flight keeps memory flat on huge trees
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+        if batch and not cancelled():
+            future = pool.submit(search_files, batch, options)
+            future.file_count = len(batch)
+            pending.add(future)
+        while pending and not cancelled():
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+        if cancelled():
+            pool.shutdown(cancel_futures=True)
+    return files, size, found, time.perf_counter() - started
@@ -0,0 +1,41 @@
+import json
+import os
+import uuid
+
+from fileio import atomic_write
+
+SESSION_FILE = "session.json"
+
+
+def load_session(directory):
+    try:
+        with open(os.path.join(directory, SESSION_FILE), encoding="utf-8") as file:
+            session = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(session, dict) or not isinstance(session.get("tabs"), list):
+        return None
+    return session
+
+
+def new_buffer_name():
+    return f"buffer-{uuid.uuid4().hex}.txt"
+
+
+def read_buffer(directory, name):
+    # buffers are always written as UTF-8 by save_session, nothing to detect
+    with open(os.path.join(directory, name), encoding="utf-8", newline="") as file:
+        return file.read()
+
+
+def save_session(directory, session, buffers):
+    # buffers maps new buffer names to the unsaved text they hold, buffer files the
+    # session no longer references are removed once the new session is in place
+    os.makedirs(directory, exist_ok=True)
+    for name, text in buffers.items():
+        atomic_write(os.path.join(directory, name), text.encode("utf-8"))
+    atomic_write(os.path.join(directory, SESSION_FILE), json.dumps(session, ensure_ascii=False).encode("utf-8"))
+    referenced = {tab.get("buffer") for tab in session["tabs"]}
+    for name in os.listdir(directory):
+        if name.startswith("buffer-") and name not in referenced:
+            os.unlink(os.path.join(directory, name))
@@ -0,0 +1,89 @@
+import pytest
+
+from batch import main
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "sub" / "deeper").mkdir(parents=True)
+    files = {
+        "a.txt": "foo bar\r\nfood\r\n".encode("utf-8"),
+        "sub/b.txt": "café foo\n".encode("utf-16"),
+        "sub/deeper/c.txt": b"nothing here\n",
+        "sub/image.txt": b"foo\0\x01\x02 binary",
+        "other.log": b"foo\n",
+    }
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+    return tmp_path
+
+
+def run(capsys, *args):
+    code = main(list(args))
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def test_dry_run_writes_nothing(tree, capsys):
+    before = {path: path.read_bytes() for path in tree.rglob("*") if path.is_file()}
+    code, out, err = run(capsys, str(tree / "**" / "*.txt"), "--find", "foo", "--replace", "baz", "--dry-run")
+    assert code == 0 and not err
+    assert "a.txt: 2 replacements, 1 hunk, -2 +2 lines" in out
+    assert "b.txt: 1 replacement" in out
+    assert "image.txt" not in out and "c.txt" not in out
+    assert out.splitlines()[-1].startswith("2 of 4 file(s) would change, 0 failed")
+    assert {path: path.read_bytes() for path in tree.rglob("*") if path.is_file()} == before
+
+
+def test_replace_keeps_each_files_format(tree, capsys):
+    code, out, err = run(capsys, str(tree / "**" / "*.txt"), "--find", "fo+", "--replace", "<\\g<0>>", "--regex")
+    assert code == 0
+    assert (tree / "a.txt").read_bytes() == b"<foo> bar\r\n<foo>d\r\n"
+    assert (tree / "sub" / "b.txt").read_bytes() == "café <foo>\n".encode("utf-16")
+    # binary files are skipped, not edited
+    assert (tree / "sub" / "image.txt").read_bytes() == b"foo\0\x01\x02 binary"
+    assert out.splitlines()[-1].startswith("2 of 4 file(s) changed")
+
+
+def test_counting_matches(tree, capsys):
+    code, out, err = run(capsys, str(tree / "*.txt"), str(tree / "*.log"), "--find", "FOO", "--whole-word")
+    assert code == 0
+    assert f"{tree / 'a.txt'}: 1 match\n" in out and f"{tree / 'other.log'}: 1 match\n" in out
+    assert out.splitlines()[-1].startswith("2 of 2 file(s) matched")
+
+
+def test_encoding_and_newline_conversion(tree, capsys):
+    code, out, err = run(
+        capsys, str(tree / "**" / "*.txt"), "--encoding", "utf-8-sig", "--newline", "lf", "--workers", "2"
+    )
+    assert code == 0
+    assert (tree / "a.txt").read_bytes() == b"\xef\xbb\xbffoo bar\nfood\n"
+    assert (tree / "sub" / "b.txt").read_bytes() == b"\xef\xbb\xbf" + "café foo\n".encode("utf-8")
+    assert (tree / "sub" / "deeper" / "c.txt").read_bytes() == b"\xef\xbb\xbfnothing here\n"
+    assert "CRLF" in out and "UTF-16" in out
+    # converted files are left alone the second time
+    code, out, err = run(capsys, str(tree / "**" / "*.txt"), "--encoding", "utf-8-sig", "--newline", "lf")
+    assert out.splitlines()[-1].startswith("0 of 4 file(s) changed")
+
+
+def test_text_the_encoding_cannot_hold(tree, capsys):
+    code, out, err = run(capsys, str(tree / "**" / "*.txt"), "--encoding", "ascii")
+    assert code == 1
+    assert "b.txt: 'ascii' codec can't encode character" in err
+    # the file that failed is untouched, the others are converted
+    assert (tree / "sub" / "b.txt").read_bytes() == "café foo\n".encode("utf-16")
+    assert (tree / "a.txt").read_bytes() == b"foo bar\r\nfood\r\n"
+    assert out.splitlines()[-1].startswith("2 of 4 file(s) changed, 1 failed")
+
+
+@pytest.mark.parametrize("args, message", [
+    (["--replace", "x"], "--replace needs --find"),
+    (["--find", "(", "--regex"], "invalid pattern"),
+    (["--encoding", "no-such-codec"], "unknown encoding"),
+    (["--find", "x", "--newline", "lf"], "only counts matches"),
+    ([], "nothing to do"),
+])
+def test_invalid_arguments(tree, capsys, args, message):
+    with pytest.raises(SystemExit):
+        main([str(tree / "a.txt")] + args)
+    assert message in capsys.readouterr().err
@@ -0,0 +1,67 @@
+import random
+from collections import Counter
+
+import completion
+from completion import SUGGESTION_LIMIT, WORD_PATTERN, CompletionIndex, update_best, word_prefix
+
+PREFIXES = ["a", "ab", "abc", "h", "srv", "srv-01.", "my", "gg", "abcdefgh", "z"]
+
+
+def linear_suggest(lines, prefix):
+    counts = Counter(word for line in lines for word in WORD_PATTERN.findall(line))
+    matches = [(word, count) for word, count in counts.items() if word.startswith(prefix) and word != prefix]
+    return sorted(matches, key=lambda match: (-match[1], match[0]))[:SUGGESTION_LIMIT]
+
+
+def test_trie_matches_a_linear_scan_after_random_edits(monkeypatch):
+    # small buckets so the trie bursts often and most lookups go through cached lists
+    monkeypatch.setattr(completion, "BUCKET_SIZE", 4)
+    rng = random.Random(24)
+    vocabulary = [
+        "".join(rng.choice("abcdefgh") for _ in range(rng.randint(2, 9))) for _ in range(300)
+    ] + ["srv-01.example.com", "srv-02.example.com", "my_identifier", "9lives", "_private"]
+
+    def line():
+        return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 8)))
+
+    lines = [line() for _ in range(300)]
+    index = CompletionIndex.build("\n".join(lines))
+    for prefix in PREFIXES:
+        assert index.suggest(prefix) == linear_suggest(lines, prefix)
+    for step in range(600):
+        first = rng.randrange(len(lines))
+        last = min(len(lines) - 1, first + rng.randint(0, 3))
+        new = [line() for _ in range(rng.randint(0, 4))] or [""]
+        lines[first:last + 1] = new
+        index.replace_blocks(first, last, new)
+        if step % 10 == 0:
+            for prefix in PREFIXES:
+                assert index.suggest(prefix) == linear_suggest(lines, prefix), prefix
+    assert len(index.block_words) == len(lines)
+
+
+def test_words_that_go_away_are_not_suggested():
+    index = CompletionIndex.build("alpha alphabet\nalphanumeric")
+    assert [word for word, count in index.suggest("alp")] == ["alpha", "alphabet", "alphanumeric"]
+    index.replace_blocks(1, 1, [""])
+    assert index.suggest("alp") == [("alpha", 1), ("alphabet", 1)]
+    assert index.suggest("alpha") == [("alphabet", 1)]
+    assert index.suggest("beta") == []
+
+
+def test_update_best():
+    best = sorted((-count, word) for word, count in [("a", 5), ("b", 3), ("c", 1)])
+    assert update_best(best, "c", 1, 4)
+    assert best == [(-5, "a"), (-4, "c"), (-3, "b")]
+    assert update_best(best, "b", 3, 0)
+    assert best == [(-5, "a"), (-4, "c")]
+    # a full list can't tell which word left out takes the place of one that dropped
+    full = [(-count, str(count)) for count in range(SUGGESTION_LIMIT + 1, 0, -1)]
+    assert not update_best(full, str(SUGGESTION_LIMIT + 1), SUGGESTION_LIMIT + 1, 0)
+
+
+def test_word_prefix():
+    assert word_prefix("x = srv-01.ex") == "srv-01.ex"
+    assert word_prefix("foo 123ab") == ""
+    assert word_prefix("a b ") == ""
+    assert word_prefix("call(my_var") == "my_var"
@@ -0,0 +1,141 @@
+import os
+import stat
+
+import pytest
+
+import fileio
+from fileio import FileTooLarge, TextFormat, atomic_write, decode_file, detect_compression
+
+TEXT = "café naïve\nnon\u00a0breaking\u00a0spaces\n\u2028line separator, \u20ac and \U0001f600\nlast"
+
+
+def round_trip(tmp_path, text_format, text=TEXT, name="file.txt"):
+    path = str(tmp_path / name)
+    atomic_write(path, text_format.encode(text), compression=text_format.compression)
+    with open(path, "rb") as file:
+        data = file.read()
+    decoded, found = decode_file(path)
+    assert decoded == text
+    assert (found.encoding, found.bom, found.newline, found.compression) == (
+        text_format.encoding, text_format.bom, text_format.newline, text_format.compression
+    )
+    # written back the way it was read, the file stays byte for byte the same
+    atomic_write(path, found.encode(decoded), compression=found.compression)
+    with open(path, "rb") as file:
+        assert file.read() == data
+    return data
+
+
+@pytest.mark.parametrize("encoding, bom", [
+    ("utf-8", b""),
+    ("utf-8", b"\xef\xbb\xbf"),
+    ("utf-16-le", b"\xff\xfe"),
+    ("utf-16-be", b"\xfe\xff"),
+    ("utf-32-le", b"\xff\xfe\x00\x00"),
+])
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+def test_encoding_round_trip(tmp_path, encoding, bom, newline):
+    round_trip(tmp_path, TextFormat(encoding, bom, newline))
+
+
+def test_non_breaking_spaces_survive(tmp_path):
+    data = round_trip(tmp_path, TextFormat())
+    assert data.count("\u00a0".encode("utf-8")) == 2
+
+
+def test_utf16_without_bom(tmp_path):
+    text = "plain ascii text\n" * 50
+    round_trip(tmp_path, TextFormat("utf-16-le"), text)
+    round_trip(tmp_path, TextFormat("utf-16-be"), text)
+
+
+def test_single_byte_fallbacks(tmp_path):
+    round_trip(tmp_path, TextFormat("cp1252", newline="\r\n"), "café \u20ac\nnaïve\n")
+    # 0x81 is undefined in cp1252, only latin-1 takes it
+    path = tmp_path / "latin.txt"
+    path.write_bytes(b"abc \x81\xe9\n")
+    text, found = decode_file(str(path))
+    assert (text, found.encoding) == ("abc \x81\xe9\n", "latin-1")
+
+
+def test_fallback_after_the_first_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileio, "READ_CHUNK_SIZE", 16)
+    path = tmp_path / "late.txt"
+    path.write_bytes(b"x" * 100 + b"\xe9t\xe9\n")
+    text, found = decode_file(str(path))
+    assert (text, found.encoding) == ("x" * 100 + "été\n", "cp1252")
+
+
+def test_chunk_boundaries(tmp_path, monkeypatch):
+    # characters and \r\n pairs split between chunks
+    monkeypatch.setattr(fileio, "READ_CHUNK_SIZE", 7)
+    for newline in ("\r\n", "\r"):
+        round_trip(tmp_path, TextFormat("utf-8", newline=newline), TEXT * 5)
+        round_trip(tmp_path, TextFormat("utf-16-le", b"\xff\xfe", newline), TEXT * 5)
+
+
+@pytest.mark.parametrize("compression, name", [
+    (("gzip", 6), "file.txt.gz"),
+    (("gzip", 9), "file.txt.gz"),
+    (("gzip", 1), "file.txt.gz"),
+    (("xz", 6), "file.txt.xz"),
+    (("xz", 1), "file.txt.xz"),
+    (("bz2", 9), "file.txt.bz2"),
+    (("bz2", 3), "file.txt.bz2"),
+])
+def test_compression_round_trip(tmp_path, compression, name):
+    text_format = TextFormat("utf-16-le", b"\xff\xfe", "\r\n", compression)
+    data = round_trip(tmp_path, text_format, TEXT * 100, name)
+    assert detect_compression(str(tmp_path / name)) == compression
+    assert len(data) < len(text_format.encode(TEXT * 100))
+
+
+def test_compressed_file_under_any_name(tmp_path):
+    round_trip(tmp_path, TextFormat(compression=("gzip", 6)), name="no-extension")
+
+
+def test_for_path():
+    text_format = TextFormat("utf-16-le", b"\xff\xfe", "\r\n", ("xz", 1))
+    assert text_format.for_path("a.xz").compression == ("xz", 1)
+    assert text_format.for_path("a.GZ").compression == ("gzip", 6)
+    assert text_format.for_path("a.txt").compression is None
+    assert text_format.for_path("a.txt").encoding == "utf-16-le"
+    assert TextFormat.from_dict(text_format.to_dict()).to_dict() == text_format.to_dict()
+
+
+def test_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileio, "READ_CHUNK_SIZE", 1024)
+    path = tmp_path / "big.txt"
+    path.write_text("x" * 10000)
+    with pytest.raises(FileTooLarge):
+        decode_file(str(path), limit=4096)
+    assert decode_file(str(path), limit=20000)[0] == "x" * 10000
+
+
+def test_atomic_write_modes(tmp_path):
+    path = str(tmp_path / "new.txt")
+    atomic_write(path, b"new")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~fileio.UMASK
+    os.chmod(path, 0o640)
+    atomic_write(path, b"again", compression=("gzip", 6))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    # only the target is left, no temporary files
+    assert os.listdir(tmp_path) == ["new.txt"]
+
+
+def test_atomic_write_progress_and_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileio, "WRITE_CHUNK_SIZE", 10)
+    path = str(tmp_path / "file.txt")
+    reports = []
+    atomic_write(path, b"x" * 25, lambda written, total: reports.append((written, total)))
+    assert reports == [(10, 25), (20, 25), (25, 25)]
+
+    def fail(written, total):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        atomic_write(path, b"y" * 25, fail)
+    # the old content is untouched and the temporary file is gone
+    with open(path, "rb") as file:
+        assert file.read() == b"x" * 25
+    assert os.listdir(tmp_path) == ["file.txt"]
@@ -0,0 +1,127 @@
+import random
+
+from fileio import TextFormat
+from filewatch import DiskState, diff_lines, diff_text, load_changes, split_lines, unique_anchors
+
+
+def patch(text, regions):
+    # regions come in order and don't overlap, as the editor applies them
+    pieces = []
+    previous = 0
+    for start, end, replacement in regions:
+        assert previous <= start <= end
+        pieces.append(text[previous:start])
+        pieces.append(replacement)
+        previous = end
+    return "".join(pieces) + text[previous:]
+
+
+def mutate(rng, lines):
+    lines = list(lines)
+    for _ in range(rng.randrange(1, 8)):
+        kind = rng.randrange(5)
+        i = rng.randrange(len(lines) + 1)
+        if kind == 0:
+            lines[i:i] = [f"new {rng.random()}\n" for _ in range(rng.randrange(1, 4))]
+        elif kind == 1:
+            del lines[i:i + rng.randrange(1, 4)]
+        elif kind == 2 and i < len(lines):
+            lines[i] = "changed " + lines[i]
+        elif kind == 3 and lines:
+            # a moved line
+            lines.insert(rng.randrange(len(lines) + 1), lines.pop(rng.randrange(len(lines))))
+        else:
+            # repeated lines have no unique anchor
+            lines[i:i] = ["same\n"] * rng.randrange(1, 4)
+    return lines
+
+
+def test_diff_text_reproduces_random_changes():
+    rng = random.Random(17)
+    for _ in range(200):
+        old_lines = [f"line {i}\n" if rng.random() < 0.8 else "same\n" for i in range(rng.randrange(60))]
+        old = "".join(old_lines)
+        new = "".join(mutate(rng, old_lines))
+        if rng.random() < 0.3:
+            # a last line without a line end
+            new = new.rstrip("\n")
+        assert patch(old, diff_text(old, new)) == new
+
+
+def test_diff_text_patches_only_what_changed():
+    old = "".join(f"line {i}\n" for i in range(10000))
+    new = old.replace("line 5000\n", "line 5000 edited\nline 5000.5\n")
+    start = old.index("line 5000\n")
+    assert diff_text(old, new) == [(start, start + len("line 5000\n"), "line 5000 edited\nline 5000.5\n")]
+    assert diff_text(old, old) == []
+
+
+def test_long_regions_without_anchors_are_replaced_whole():
+    old = split_lines("same\n" * 30)
+    new = split_lines("other\n" * 20)
+    regions = []
+    diff_lines(old, new, 0, len(old), 0, len(new), regions, limit=10)
+    assert regions == [(0, 30, 0, 20)]
+
+
+def test_unique_anchors_keep_their_order():
+    old = ["a\n", "b\n", "c\n", "d\n", "e\n"]
+    new = ["d\n", "a\n", "b\n", "x\n", "c\n", "e\n"]
+    anchors = unique_anchors(old, new, 0, len(old), 0, len(new))
+    assert anchors == [(0, 1), (1, 2), (2, 4), (4, 5)]
+
+
+def test_split_lines():
+    assert split_lines("a\nb") == ["a\n", "b"]
+    assert split_lines("a\nb\n") == ["a\n", "b\n"]
+    assert split_lines("") == []
+
+
+def test_load_changes(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes("one\r\ntwo\r\nthree\r\n".encode("utf-16"))
+    old = "one\nthree\n"
+    text_format, regions, disk = load_changes(str(path), old)
+    assert patch(old, regions) == "one\ntwo\nthree\n"
+    assert (text_format.encoding, text_format.newline) == ("utf-16-le", "\r\n")
+    assert not disk.changed()
+
+
+def test_appends_are_read_in_pieces(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"start\n")
+    disk = DiskState.capture(str(path))
+    assert not disk.changed() and not disk.appended()
+    text_format = TextFormat()
+    # a character and a \r\n both split between two writes
+    for data, text in ((b"caf\xc3", "caf"), (b"\xa9\r", "\u00e9"), (b"\nnext", "\nnext")):
+        with open(path, "ab") as file:
+            file.write(data)
+        assert disk.changed() and disk.appended()
+        assert disk.read_appended(text_format) == (text, False)
+    assert not disk.changed()
+
+
+def test_append_limit(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"")
+    disk = DiskState.capture(str(path))
+    path.write_bytes(b"x" * 10)
+    assert disk.read_appended(TextFormat(), limit=4) == ("xxxx", True)
+    # the rest is still reported as a change
+    assert disk.changed()
+    assert disk.read_appended(TextFormat(), limit=100) == ("xxxxxx", False)
+
+
+def test_rewrites_are_not_appends(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"first version\n")
+    disk = DiskState.capture(str(path))
+    path.write_bytes(b"other version\nand more\n")
+    assert disk.changed() and not disk.appended()
+    path.write_bytes(b"first")
+    assert not disk.appended()
+    disk.acknowledge()
+    assert not disk.changed()
+    path.unlink()
+    assert disk.changed() and not disk.appended()
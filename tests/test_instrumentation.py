@@ -0,0 +1,99 @@
+import json
+import threading
+
+import pytest
+
+import instrumentation
+from instrumentation import BUCKETS_MS, Profiler, instrumented
+
+
+def test_rings_keep_the_latest_durations():
+    profiler = Profiler(ring_size=4)
+    for ms in range(1, 11):
+        profiler.record("slot", 0.0, ms / 1000)
+    assert profiler.samples("slot") == [0.007, 0.008, 0.009, 0.01]
+    stats = profiler.stats("slot")
+    assert (stats["count"], stats["window"]) == (10, 4)
+    assert stats["p50"] == 0.009 and stats["max"] == 0.01
+    assert stats["mean"] == pytest.approx(0.0085)
+    # 7 and 8 ms go in the bucket up to 8 ms, 9 and 10 ms in the one up to 16
+    assert sum(stats["histogram"]) == 4
+    assert stats["histogram"][BUCKETS_MS.index(8)] == 2
+    assert stats["histogram"][BUCKETS_MS.index(16)] == 2
+
+
+def test_percentiles_and_the_slow_bucket():
+    profiler = Profiler(ring_size=1000)
+    for ms in range(100):
+        profiler.record("slot", 0.0, ms / 1000)
+    profiler.record("slot", 0.0, 5.0)
+    stats = profiler.stats("slot")
+    assert (stats["p50"], stats["p95"], stats["p99"]) == (0.05, 0.095, 0.099)
+    assert stats["histogram"][-1] == 1
+    assert list(profiler.snapshot()) == ["slot"]
+    profiler.reset()
+    assert profiler.snapshot() == {}
+
+
+def test_chrome_trace_export(tmp_path):
+    profiler = Profiler(trace_size=3)
+    profiler.record("first", profiler.origin, 0.5)
+    thread = threading.Thread(target=lambda: profiler.record("worker", profiler.origin + 1, 0.25), name="loader")
+    thread.start()
+    thread.join()
+    for i in range(2):
+        profiler.record("last", profiler.origin + 2 + i, 0.001)
+    path = tmp_path / "trace.json"
+    profiler.export_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    # only the latest trace_size spans are kept, in microseconds
+    assert [(event["name"], event["ts"], event["dur"]) for event in spans] == [
+        ("worker", 1e6, 0.25e6), ("last", 2e6, 1e3), ("last", 3e6, 1e3)
+    ]
+    names = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert names[spans[0]["tid"]] == "loader"
+    assert names[spans[1]["tid"]] == threading.current_thread().name
+
+
+def test_json_export(tmp_path):
+    profiler = Profiler()
+    profiler.record("slot", 0.0, 0.002)
+    path = tmp_path / "stats.json"
+    profiler.export_json(str(path))
+    data = json.loads(path.read_text())
+    assert data["buckets_ms"] == list(BUCKETS_MS)
+    assert data["slots"]["slot"]["count"] == 1
+
+
+def test_instrumented(monkeypatch):
+    profiler = Profiler()
+    monkeypatch.setattr(instrumentation, "profiler", profiler)
+
+    class Slots:
+        @instrumented
+        def clicked(self, checked):
+            return checked
+
+        @instrumented
+        def failing(self):
+            raise ValueError
+
+        @instrumented
+        def forward(self, *args):
+            return args
+
+    slots = Slots()
+    assert slots.clicked(True) and not profiler.rings
+    profiler.enabled = True
+    # arguments a slot doesn't take are dropped, as Qt would
+    assert slots.clicked(True, "extra") is True
+    assert slots.forward(1, 2, 3) == (1, 2, 3)
+    with pytest.raises(ValueError):
+        slots.failing()
+    counts = {name: stats["count"] for name, stats in profiler.snapshot().items()}
+    assert counts == {
+        "test_instrumented.<locals>.Slots.clicked": 1,
+        "test_instrumented.<locals>.Slots.failing": 1,
+        "test_instrumented.<locals>.Slots.forward": 1,
+    }
@@ -0,0 +1,101 @@
+import os
+import random
+import subprocess
+import sys
+
+import journal
+from journal import RecoveryJournal, find_orphans, replay
+
+
+def read_text(path):
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def patched(document):
+    text = document["text"]
+    for position, removed, added in document["deltas"]:
+        text = text[:position] + added + text[position + removed:]
+    return text
+
+
+def random_edits(rng, recovery, tab_id, text, count):
+    for _ in range(count):
+        position = rng.randrange(len(text) + 1)
+        removed = min(rng.randrange(3), len(text) - position)
+        added = "".join(rng.choice("ab é€\n") for _ in range(rng.randrange(4)))
+        text = text[:position] + added + text[position + removed:]
+        recovery.record_edit(tab_id, position, removed, added)
+    return text
+
+
+def test_edits_and_compaction_replay_to_the_same_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "COMPACT_THRESHOLD", 2000)
+    monkeypatch.setattr(journal, "COMPACT_TAB_BYTES", 1000)
+    rng = random.Random(5)
+    recovery = RecoveryJournal(str(tmp_path))
+    texts = {}
+    for tab_id in (1, 2):
+        texts[tab_id] = "start été\n"
+        recovery.set_base(tab_id, f"tab {tab_id}", text=texts[tab_id])
+    # a short tab's deltas stay as they are, a long one gets a fresh snapshot
+    texts[1] = random_edits(rng, recovery, 1, texts[1], 10)
+    texts[2] = random_edits(rng, recovery, 2, texts[2], 100)
+    recovery.flush()
+    # sizes count bytes, as the text is mostly multi-byte
+    assert recovery.size == os.path.getsize(recovery.path)
+    assert recovery.compact(lambda tab_id: (f"tab {tab_id}", None, texts[tab_id]))
+    assert recovery.size == os.path.getsize(recovery.path)
+    documents = {document["title"]: document for document in replay(recovery.path, read_text)}
+    assert documents["tab 2"]["deltas"] == []
+    for tab_id in (1, 2):
+        texts[tab_id] = random_edits(rng, recovery, tab_id, texts[tab_id], 5)
+    recovery.flush()
+    assert recovery.size == os.path.getsize(recovery.path)
+    documents = {document["title"]: document for document in replay(recovery.path, read_text)}
+    assert {title: patched(document) for title, document in documents.items()} == {
+        "tab 1": texts[1], "tab 2": texts[2]
+    }
+    recovery.discard()
+    assert not os.path.exists(recovery.path)
+
+
+def test_a_torn_last_line_is_ignored(tmp_path):
+    recovery = RecoveryJournal(str(tmp_path))
+    recovery.set_base(1, "tab", text="")
+    recovery.record_edit(1, 0, 0, "café")
+    recovery.flush()
+    with open(recovery.path, "ab") as file:
+        # cut off in the middle of a character
+        file.write('{"t": "edit", "p": 4, "r": 0, "a": "é'.encode("utf-8")[:-1])
+    [document] = replay(recovery.path, read_text)
+    assert patched(document) == "café"
+
+
+def test_file_bases_and_closed_tabs(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("on disk\n")
+    recovery = RecoveryJournal(str(tmp_path / "recovery"))
+    recovery.set_base(1, "file.txt", str(path))
+    recovery.record_edit(1, 0, 2, "still")
+    # unmodified tabs and closed ones have nothing to recover
+    recovery.set_base(2, "clean", str(path))
+    recovery.set_base(3, "closed", text="x", dirty=True)
+    recovery.close_tab(3)
+    recovery.flush()
+    assert recovery.size == os.path.getsize(recovery.path)
+    [document] = replay(recovery.path, read_text)
+    assert (document["title"], patched(document)) == ("file.txt", "still disk\n")
+    # the edits don't apply to a file that changed since
+    path.write_text("changed on disk\n")
+    assert replay(recovery.path, read_text) == []
+
+
+def test_find_orphans(tmp_path):
+    # the pid of a process that has exited
+    child = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    dead = int(child.stdout)
+    for name in (f"journal-{dead}-1.jsonl", f"journal-{os.getpid()}-1.jsonl", f"notes-{dead}.jsonl"):
+        (tmp_path / name).write_text("")
+    assert find_orphans(str(tmp_path)) == [str(tmp_path / f"journal-{dead}-1.jsonl")]
+    assert find_orphans(str(tmp_path / "missing")) == []
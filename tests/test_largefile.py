@@ -0,0 +1,72 @@
+import random
+import re
+
+import largefile
+from largefile import LargeFile, byte_aligned
+from search import compile_pattern
+
+WORDS = ["foo", "Foo", "é", "ÉTÉ", "\n", " ", "bar", "\xff"]
+
+
+def byte_span(text, match):
+    return len(text[:match.start()].encode("utf-8", "surrogateescape")), len(text[:match.end()].encode("utf-8", "surrogateescape"))
+
+
+def expected_forward(text, pattern, position):
+    # the first match from position on, else the first one before it
+    matches = [match for match in pattern.finditer(text, position) if match.end() > match.start()]
+    matches = matches or [match for match in pattern.finditer(text) if match.end() > match.start()]
+    return byte_span(text, matches[0]) if matches else None
+
+
+def expected_backward(text, pattern, position):
+    # the last match starting before position, else the last one in the file
+    matches = [match for match in pattern.finditer(text) if match.end() > match.start()]
+    before = [match for match in matches if match.start() < position] or matches
+    return byte_span(text, before[-1]) if before else None
+
+
+def test_str_patterns_search_decoded_windows(tmp_path, monkeypatch):
+    # tiny windows so matches straddle them, with context enough for the longest match
+    monkeypatch.setattr(largefile, "SEARCH_WINDOW", 16)
+    monkeypatch.setattr(largefile, "SEARCH_OVERLAP", 64)
+    rng = random.Random(1)
+    path = tmp_path / "big.txt"
+    for _ in range(40):
+        data = "".join(rng.choice(WORDS) for _ in range(rng.randrange(40))).encode("utf-8")
+        # bytes that don't decode still keep their offsets
+        data += b"\xc3 x\x80foo" if rng.random() < 0.3 else b""
+        path.write_bytes(data)
+        text = data.decode("utf-8", "surrogateescape")
+        large_file = LargeFile(str(path))
+        for term in (r"foo", r"été", r"\bfoo\b", r"^b", r"o$", r"é.", r"\w+", r"o\nb"):
+            pattern = compile_pattern(term, regex=True)
+            for start in range(len(data) + 1):
+                if start < len(data) and 0x80 <= data[start] < 0xC0:
+                    continue
+                position = len(data[:start].decode("utf-8", "surrogateescape"))
+                assert large_file.search(pattern, start) == expected_forward(text, pattern, position)
+                assert large_file.search(pattern, start, backward=True) == expected_backward(text, pattern, position)
+        large_file.close()
+
+
+def test_bytes_literals(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_bytes("foo café foo\ncafé".encode("utf-8"))
+    large_file = LargeFile(str(path))
+    pattern = compile_pattern("café", case_sensitive=True, encoding="utf-8")
+    assert large_file.search(pattern, 0) == (4, 9)
+    assert large_file.search(pattern, 5) == (14, 19)
+    assert large_file.search(pattern, 14, backward=True) == (4, 9)
+    # both directions wrap around
+    assert large_file.search(pattern, 15) == (4, 9)
+    assert large_file.search(pattern, 4, backward=True) == (14, 19)
+    assert large_file.search(compile_pattern("bar", encoding="utf-8"), 0) is None
+    large_file.close()
+
+
+def test_byte_aligned():
+    for encoding in ("utf-8", "UTF8", "cp1252", "latin-1", "koi8-r"):
+        assert byte_aligned(encoding)
+    for encoding in ("utf-16", "utf-32-le", "shift_jis", "utf-7", "no-such-encoding"):
+        assert not byte_aligned(encoding)
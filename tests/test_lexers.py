@@ -0,0 +1,100 @@
+import pytest
+
+import lexers
+from lexers import JsonLexer, LogLexer, MarkdownLexer, PythonLexer, lex_states, lexer_for_path
+
+PYTHON = '''def f():
+    """Starts here,
+    still a string: def if "quoted" and \\""" escaped
+    ''' + "'''" + ''' doesn't close it either
+    ends here"""
+    return 'x' + r"""one line""" + 1
+s = b\'\'\'
+\'\'\'
+'''
+
+MARKDOWN = """# Title
+```python
+# not a heading
+~~~
+```
+*back* to `text`
+~~~
+code
+~~~
+"""
+
+JSON = '{"key": "unterminated\n"value": [1, true]}\n'
+
+LOG = '2024-01-02 10:00:00 ERROR "quote\nnext INFO line\n'
+
+DOCUMENTS = [(PythonLexer(), PYTHON), (MarkdownLexer(), MARKDOWN), (JsonLexer(), JSON), (LogLexer(), LOG)]
+
+
+def line_states(lexer, text):
+    states = []
+    state = 0
+    for line in text.split("\n"):
+        state = lexer.tokenize(line, state)[1]
+        states.append(state)
+    return states
+
+
+def kinds(lexer, line, state=0):
+    return [(line[start:start + length], kind) for start, length, kind in lexer.tokenize(line, state)[0]]
+
+
+@pytest.mark.parametrize("lexer, text", DOCUMENTS)
+def test_lex_states_follow_tokenize(lexer, text, monkeypatch):
+    # the shortcut in end_state and the chunks lex_states hands out give the states tokenize does
+    monkeypatch.setattr(lexers, "STATES_CHUNK", 3)
+    chunks = []
+    lex_states(lexer, text, partial=chunks.append)
+    assert all(len(chunk) <= 3 for chunk in chunks)
+    assert [state for chunk in chunks for state in chunk] == line_states(lexer, text)
+
+
+def test_python_strings_across_lines():
+    lexer = PythonLexer()
+    assert line_states(lexer, PYTHON) == [0, 2, 2, 2, 0, 0, 1, 0, 0]
+    lines = PYTHON.split("\n")
+    assert kinds(lexer, lines[2], 2) == [(lines[2], "string")]
+    assert kinds(lexer, lines[4], 2) == [('    ends here"""', "string")]
+    # a string closed on the line it opened on still leaves the state at 0
+    assert kinds(lexer, lines[5]) == [
+        ("return", "keyword"), ("'x'", "string"), ('r"""', "string"), ('one line"""', "string"), ("1", "number")
+    ]
+    # an open string can start from a later state too, the rest of the line is lexed as usual
+    assert kinds(lexer, 'x""" if """y', 2) == [('x"""', "string"), ("if", "keyword"), ('"""', "string"), ("y", "string")]
+    assert lexer.tokenize('x""" if """y', 2)[1] == 2
+
+
+def test_markdown_fenced_blocks():
+    lexer = MarkdownLexer()
+    assert line_states(lexer, MARKDOWN) == [0, 1, 1, 1, 0, 0, 2, 2, 0, 0]
+    lines = MARKDOWN.split("\n")
+    # inside a fence a heading is code, and the other fence doesn't close it
+    assert kinds(lexer, lines[2], 1) == [("# not a heading", "code")]
+    assert kinds(lexer, lines[3], 1) == [("~~~", "code")]
+    assert kinds(lexer, lines[0]) == [("# Title", "heading")]
+    assert kinds(lexer, lines[5]) == [("*back*", "emphasis"), ("`text`", "code")]
+
+
+def test_single_line_lexers_carry_no_state():
+    assert line_states(JsonLexer(), JSON) == [0, 0, 0]
+    assert kinds(JsonLexer(), '"value": [1, true]}') == [('"value"', "key"), ("1", "number"), ("true", "literal")]
+    assert line_states(LogLexer(), LOG) == [0, 0, 0]
+    assert kinds(LogLexer(), "next INFO line") == [("INFO", "info")]
+
+
+def test_lex_states_stops_once_cancelled(monkeypatch):
+    monkeypatch.setattr(lexers, "STATES_CHUNK", 2)
+    chunks = []
+    lex_states(PythonLexer(), "a\nb\nc\nd\ne", partial=chunks.append, cancelled=lambda: len(chunks) == 1)
+    assert chunks == [[0, 0]]
+
+
+def test_lexer_for_path():
+    assert lexer_for_path("notes.MD").name == "Markdown"
+    assert lexer_for_path("app.log").name == "Log"
+    assert lexer_for_path("README") is None
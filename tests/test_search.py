@@ -0,0 +1,130 @@
+import random
+import re
+
+import pytest
+
+import search
+from search import (
+    MatchIndex, bytes_searchable, compile_pattern, find_all, is_line_local, replaced_position, replacements
+)
+
+WORDS = ["foo", "bar", "food", "fo", "o", "baz", "\n", " "]
+
+
+def random_text(rng, length):
+    return "".join(rng.choice(WORDS) for _ in range(length))
+
+
+def line_range(text, position, added):
+    # the whole lines an edit at position touched, as the editor passes them to apply_edit
+    start = text.rfind("\n", 0, position) + 1
+    end = text.find("\n", position + added)
+    return start, len(text) if end == -1 else end
+
+
+def test_match_index_follows_random_edits(monkeypatch):
+    # small chunks so edits split, shift and rebalance them
+    monkeypatch.setattr(search, "CHUNK_SIZE", 4)
+    rng = random.Random(6)
+    for term in ("foo", "o", "ba[rz]"):
+        pattern = compile_pattern(term, regex=True)
+        text = random_text(rng, 400)
+        index = MatchIndex.build(pattern, text)
+        for _ in range(300):
+            position = rng.randrange(len(text) + 1)
+            removed = min(rng.randrange(12), len(text) - position)
+            added = random_text(rng, rng.randrange(4))
+            text = text[:position] + added + text[position + removed:]
+            start, new_end = line_range(text, position, len(added))
+            old_end = new_end - (len(added) - removed)
+            index.apply_edit(start, old_end, new_end, text[start:new_end])
+            assert index.spans_between(0, float("inf")) == find_all(text, pattern)
+            assert index.total == len(find_all(text, pattern))
+
+
+def test_match_index_lookups():
+    pattern = compile_pattern("ab")
+    text = "ab xab\nab" * 200
+    index = MatchIndex.build(pattern, text)
+    spans = find_all(text, pattern)
+    for i in (0, 1, len(spans) // 2, len(spans) - 1):
+        assert index.span(i) == spans[i]
+        assert index.index_at(spans[i][0]) == i
+    assert index.spans_between(4, 12) == [span for span in spans if span[1] > 4 and span[0] < 12]
+
+
+def apply(text, edits):
+    pieces = []
+    previous = 0
+    for start, end, new_text in edits:
+        pieces.append(text[previous:start])
+        pieces.append(new_text)
+        previous = end
+    return "".join(pieces) + text[previous:]
+
+
+def test_literal_replacements():
+    text = "one two one\nthree one"
+    edits = replacements(text, compile_pattern("one", case_sensitive=True), r"\1 & 1")
+    assert [(start, end) for start, end, new_text in edits] == [(0, 3), (8, 11), (18, 21)]
+    assert apply(text, edits) == text.replace("one", r"\1 & 1")
+
+
+def test_regex_replacements_expand_templates():
+    rng = random.Random(7)
+    text = random_text(rng, 2000)
+    pattern = compile_pattern(r"(fo+)(d?)", regex=True, case_sensitive=True)
+    for template in (r"<\2\1>", r"\g<0>\g<0>", ""):
+        edits = replacements(text, pattern, template, regex=True)
+        assert apply(text, edits) == pattern.sub(template, text)
+        assert len(edits) == len(pattern.findall(text))
+
+
+def test_replacements_with_private_use_characters():
+    # the marker that brackets each replacement must be one the text doesn't use
+    text = "a\ue000b a\ue001b \ue002"
+    pattern = compile_pattern("a(.)b", regex=True)
+    assert apply(text, replacements(text, pattern, r"[\1]", regex=True)) == re.sub("a(.)b", r"[\1]", text)
+
+
+def test_replaced_position():
+    text = "xx foo yy foo zz"
+    edits = replacements(text, compile_pattern("foo"), "quux")
+    new_text = apply(text, edits)
+    assert replaced_position(edits, 0) == 0
+    # before, inside and after the first match
+    assert new_text[replaced_position(edits, text.index("yy")):].startswith("yy")
+    assert replaced_position(edits, 4) == 3 + len("quux")
+    assert replaced_position(edits, len(text)) == len(new_text)
+
+
+@pytest.mark.parametrize("term", [
+    r"a\nb", r"\x0a", r"\012", r"\u000a", r"\N{LINE FEED}", r"[\x00-\x7f]", r"[\s\S]", r"[^a]",
+    r"\s", r"\W", r"\D", r"\Z", r"\A", r"(?s)a.b", r"(?s:.)", r"x(?=\n)", r"(a)?(?(1)b|\n)",
+    r"(?x) a \n b", r"(?-m:^a)", "a\nb",
+])
+def test_patterns_that_span_lines(term):
+    assert not is_line_local(compile_pattern(term, regex=True))
+
+
+@pytest.mark.parametrize("term", [
+    r"foo", r"^a$", r"a.b", r"[^\n]+", r"\d+\w*", r"\bfoo\b", r"[a-z]{2,}", r"(a|b)\1", r"(?<!x)y",
+])
+def test_line_local_patterns(term):
+    assert is_line_local(compile_pattern(term, regex=True))
+
+
+def test_line_local_bytes_patterns():
+    assert is_line_local(compile_pattern("caf\u00e9", encoding="utf-8"))
+    assert not is_line_local(compile_pattern(r"a\sb", regex=True, encoding="latin-1"))
+
+
+def test_bytes_searchable():
+    assert bytes_searchable("caf\u00e9", False, True, False, "utf-8")
+    assert bytes_searchable("foo", False, False, False, "utf-8")
+    # case folding in bytes misses \u00c9 for \u00e9, and \u212a for k
+    assert not bytes_searchable("caf\u00e9", False, False, False, "utf-8")
+    assert not bytes_searchable("kit", False, False, False, "utf-8")
+    assert not bytes_searchable("foo", True, True, False, "utf-8")
+    assert not bytes_searchable("foo", False, True, True, "utf-8")
+    assert not bytes_searchable("\u20ac", False, True, False, "latin-1")
@@ -0,0 +1,40 @@
+import os
+
+from session import SESSION_FILE, load_session, new_buffer_name, read_buffer, save_session
+
+
+def test_buffers_round_trip(tmp_path):
+    directory = str(tmp_path / "session")
+    # line ends and characters come back exactly as they were
+    text = "unsaved\r\nnaïve €\rlast"
+    name = new_buffer_name()
+    session = {"current": 1, "tabs": [
+        {"title": "a.txt", "path": "/tmp/a.txt", "modified": False},
+        {"title": "Untitled", "path": None, "modified": True, "buffer": name},
+    ]}
+    save_session(directory, session, {name: text})
+    assert load_session(directory) == session
+    assert read_buffer(directory, name) == text
+
+
+def test_unreferenced_buffers_are_removed(tmp_path):
+    directory = str(tmp_path)
+    kept, dropped = new_buffer_name(), new_buffer_name()
+    assert kept != dropped
+    save_session(directory, {"tabs": [{"buffer": kept}, {"buffer": dropped}]}, {kept: "one", dropped: "two"})
+    (tmp_path / "notes.txt").write_text("not a buffer")
+    # the next session only references one of them
+    save_session(directory, {"tabs": [{"buffer": kept}]}, {})
+    assert sorted(os.listdir(directory)) == sorted([kept, "notes.txt", SESSION_FILE])
+    assert read_buffer(directory, kept) == "one"
+
+
+def test_load_session_rejects_what_it_cannot_use(tmp_path):
+    directory = str(tmp_path)
+    assert load_session(directory) is None
+    path = tmp_path / SESSION_FILE
+    for data in ("{not json", "[]", '{"tabs": {}}', '{"current": 0}'):
+        path.write_text(data)
+        assert load_session(directory) is None
+    path.write_text('{"tabs": []}')
+    assert load_session(directory) == {"tabs": []}
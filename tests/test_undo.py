@@ -0,0 +1,153 @@
+import os
+import random
+
+from undo import UndoLog, decompress_text, edit_cost, starts_word
+
+
+def replay(text, steps):
+    for step in steps:
+        for position, removed, added in step:
+            text = text[:position] + added + text[position + removed:]
+    return text
+
+
+class Editor:
+    # a document and its undo stack as the log sees them: every edit is a new command unless
+    # it joins the last one, as typing does
+    def __init__(self, directory, text=""):
+        self.text = text
+        self.log = UndoLog(directory, text)
+        self.commands = 0
+
+    def edit(self, position, removed, added, joining=False):
+        self.text = self.text[:position] + added + self.text[position + removed:]
+        if not joining:
+            self.commands += 1
+        self.log.joining = joining
+        self.log.record(position, removed, added, self.commands)
+        self.log.joining = False
+
+    def random_edit(self, rng):
+        position = rng.randrange(len(self.text) + 1)
+        removed = min(rng.randrange(4), len(self.text) - position)
+        self.edit(position, removed, "".join(rng.choice("ab \n") for _ in range(rng.randrange(1, 5))))
+
+    def live_text(self):
+        # what the log says the document holds: its anchor with the live steps done
+        return replay(decompress_text(self.log.anchor), self.log.done)
+
+
+def test_spill_and_restore_round_trip(tmp_path):
+    rng = random.Random(16)
+    editor = Editor(str(tmp_path), "start\n")
+    history = [editor.text]
+    for i in range(60):
+        editor.random_edit(rng)
+        history.append(editor.text)
+        if i % 10 == 9:
+            editor.log.spill(editor.text)
+    assert len(editor.log.segments) == 6
+    log = editor.log
+    # undo all the way down, restoring each segment once the live steps run out
+    for current, expected in zip(reversed(history), reversed(history[:-1])):
+        if not log.done:
+            base, done, redone = log.restore()
+            assert replay(base, done) == current
+        log.undo()
+        assert editor.live_text() == expected
+    assert not log.segments and not os.listdir(tmp_path)
+    for expected in history[1:]:
+        log.redo()
+        assert editor.live_text() == expected
+
+
+def test_spill_without_text(tmp_path):
+    # a hibernated tab spills before it has a document to anchor the next steps on
+    editor = Editor(str(tmp_path))
+    for word in ("one ", "two ", "three"):
+        editor.edit(len(editor.text), 0, word)
+    editor.log.spill()
+    assert editor.log.anchor is None
+    base, done, redone = editor.log.restore()
+    assert (base, redone) == ("", [])
+    assert replay(base, done) == "one two three"
+    assert editor.log.position() == 3
+
+
+def test_typing_merges_into_one_step(tmp_path):
+    editor = Editor(str(tmp_path))
+    editor.edit(0, 0, "w")
+    for position, char in enumerate("ord", 1):
+        editor.edit(position, 0, char, joining=True)
+    assert len(editor.log.done) == 1
+    editor.log.undo()
+    assert editor.live_text() == ""
+
+
+def test_edit_without_a_command_is_not_recorded(tmp_path):
+    # an edit that doesn't add a command and has no step to merge into is not recorded
+    log = UndoLog(str(tmp_path), "text")
+    log.record(0, 0, "x", 0)
+    assert log.done == [] and log.size == 0
+
+
+def test_clean_point_across_segments(tmp_path):
+    editor = Editor(str(tmp_path))
+    log = editor.log
+    for word in ("a ", "b ", "c "):
+        editor.edit(len(editor.text), 0, word)
+    log.mark_clean()
+    saved = editor.text
+    for word in ("d ", "e "):
+        editor.edit(len(editor.text), 0, word)
+    log.spill(editor.text)
+    editor.edit(len(editor.text), 0, "f ")
+    # the clean step lies in the spilled segment, below the live steps
+    assert log.clean == 3 and log.clean_step() == -2
+    while log.done:
+        log.undo()
+    base, done, redone = log.restore()
+    assert log.clean_step() == 3
+    assert replay(base, done[:log.clean_step()]) == saved
+
+
+def test_clean_point_is_dropped_with_its_step(tmp_path):
+    editor = Editor(str(tmp_path))
+    log = editor.log
+    editor.edit(0, 0, "one")
+    log.mark_clean()
+    # typing on into the saved step changes it
+    editor.edit(3, 0, "s", joining=True)
+    assert log.clean is None
+
+    log.mark_clean()
+    editor.edit(4, 0, " two")
+    log.undo()
+    log.undo()
+    # a new edit drops the redo branch the clean step was on
+    editor.text = ""
+    editor.edit(0, 0, "other")
+    assert log.clean is None
+
+    log.mark_clean()
+    log.spill(editor.text)
+    log.discard()
+    assert log.clean is None and log.depth == 0 and not os.listdir(tmp_path)
+
+
+def test_limits(tmp_path):
+    editor = Editor(str(tmp_path))
+    for i in range(5):
+        editor.edit(i, 0, "x")
+    assert editor.log.size == 5 * edit_cost(0, "x")
+    assert editor.log.over_limit(4, 1 << 20)
+    assert not editor.log.over_limit(5, 1 << 20)
+    assert editor.log.over_limit(5, editor.log.size - 1)
+
+
+def test_starts_word():
+    assert starts_word(" ", "a")
+    assert starts_word("a", "\n")
+    assert not starts_word("a", "b")
+    assert not starts_word("a", " ")
+    assert not starts_word(" ", " ")
@@ -0,0 +1,128 @@
+import zlib
+
+from hibernation import read_cache, remove_cache, write_cache
+
+# Qt keeps a tab's undo stack in memory. Once its live steps pass either limit they are
+# spilled to a compressed segment on disk, and undoing past the live stack loads them back
+UNDO_STEP_LIMIT = 1000
+UNDO_BYTE_LIMIT = 32 * 1024 * 1024
+# per edit bookkeeping on top of the UTF-16 text Qt keeps for undo and redo
+EDIT_OVERHEAD = 64
+
+
+def compress_text(text):
+    return zlib.compress(text.encode("utf-8"), 1)
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode("utf-8")
+
+
+def edit_cost(removed, added):
+    return 2 * (removed + len(added)) + EDIT_OVERHEAD
+
+
+def starts_word(previous, char):
+    # typing is undone a word at a time, a word together with the whitespace typed after it
+    return char in "\r\n" or (previous.isspace() and not char.isspace())
+
+
+class UndoLog:
+    # mirrors a document's undo stack as steps of (position, removed, added) edits on top of
+    # an anchor, the compressed text before the oldest live step. Older steps sit in segments
+    # on disk, each holding the anchor it started from
+    def __init__(self, directory, text=""):
+        self.directory = directory
+        self.segments = []
+        # steps done in the segments below the live ones, and the step count from the start of
+        # the history at which the document matches its file, None when no step does
+        self.depth = 0
+        self.clean = None
+        # Qt's command count after the last recorded edit, and whether the edit in progress
+        # joins the last step or comes from an undo or redo that must not be recorded
+        self.commands = 0
+        self.joining = False
+        self.replaying = False
+        # set while a keystroke is typed, its step stays open to the next one and can't be spilled
+        self.typing = False
+        self.reset(text)
+
+    def reset(self, text):
+        self.anchor = None if text is None else compress_text(text)
+        self.done = []
+        self.redone = []
+        self.size = 0
+
+    def record(self, position, removed, added, commands):
+        current = self.position()
+        merging = self.done and (self.joining or commands == self.commands)
+        # the clean point goes with the redo branch this edit drops, or with the step it changes
+        if self.clean is not None and (self.clean > current or self.clean == current and merging):
+            self.clean = None
+        if self.redone:
+            # a new edit drops the redo branch, as the document does
+            self.size -= self.steps_size(self.redone)
+            self.redone = []
+        if merging:
+            # without a new command Qt merged the edit into its last one
+            self.done[-1].append((position, removed, added))
+        elif commands != self.commands:
+            self.done.append([(position, removed, added)])
+        else:
+            # nothing to merge into and no new command, the change left nothing to undo
+            return
+        self.commands = commands
+        self.size += edit_cost(removed, added)
+
+    def position(self):
+        return self.depth + len(self.done)
+
+    def mark_clean(self):
+        self.clean = self.position()
+
+    def clean_step(self):
+        # the clean point as a count of live steps, None when there is none
+        return None if self.clean is None else self.clean - self.depth
+
+    @staticmethod
+    def steps_size(steps):
+        return sum(edit_cost(removed, added) for step in steps for position, removed, added in step)
+
+    def undo(self):
+        self.redone.append(self.done.pop())
+
+    def redo(self):
+        self.done.append(self.redone.pop())
+
+    def over_limit(self, steps, size):
+        return len(self.done) > steps or self.size > size
+
+    def spill(self, text=None):
+        # every live step goes to a new segment and text, the current document, becomes the
+        # anchor. Without text the anchor waits for the next restore, as for a hibernated tab
+        state = {"base": decompress_text(self.anchor), "done": self.done, "redone": self.redone}
+        self.segments.append(write_cache(self.directory, state))
+        self.depth += len(self.done)
+        self.reset(text)
+
+    def restore(self):
+        # the newest segment becomes the live history again, its undone steps are redone before
+        # the live ones. Returns (base, done, redone) for replay into a document
+        path = self.segments.pop()
+        try:
+            state = read_cache(path)
+        finally:
+            remove_cache(path)
+        self.anchor = compress_text(state["base"])
+        self.depth -= len(state["done"])
+        self.done = state["done"]
+        self.redone = self.redone + state["redone"]
+        self.size = self.steps_size(self.done) + self.steps_size(self.redone)
+        return state["base"], self.done, self.redone
+
+    def discard(self):
+        for path in self.segments:
+            remove_cache(path)
+        self.segments = []
+        self.depth = 0
+        self.clean = None